@@ -14,6 +14,11 @@ from setores.marketing.routes import marketing
 from setores.produtos.routes import produtos
 from setores.comercial.routes import comercial
 from setores.outros.routes import outros_bp
+from setores.ti.sla_monitor import monitor_sla
+from setores.ti.sla_rebaseline import executor_rebaseline_sla
+from setores.ti.outbox import processador_outbox
+from setores.ti.email_massa import disparador_email_massa
+from setores.ti.templates_email import templates_email
 from flask_login import LoginManager, login_required, current_user
 from datetime import timedelta, datetime
 from flask_socketio import SocketIO, emit, join_room, leave_room
@@ -280,6 +285,25 @@ with app.app_context():
         print("   - O servidor MySQL está acessível")
         print("   - As credenciais estão corretas")
 
+# Templates de email compilados uma vez e reaproveitados em todos os envios
+print(f"📧 Templates de email carregados: {templates_email.carregar()}")
+
+# Monitor de prazos de SLA (eventos 'sla_alerta' via Socket.IO)
+print("⏱️ Iniciando monitor de prazos de SLA...")
+monitor_sla.iniciar(app)
+
+# Recálculo de SLA em segundo plano (retoma jobs interrompidos)
+print("🔁 Iniciando executor de recálculo de SLA...")
+executor_rebaseline_sla.iniciar(app)
+
+# Efeitos colaterais pós-commit (e-mail, Socket.IO) gravados no outbox
+print("📬 Iniciando processador de outbox...")
+processador_outbox.iniciar(app)
+
+# Email em massa para grupos via $batch do Graph (retoma envios interrompidos)
+print("📨 Iniciando disparador de email em massa...")
+disparador_email_massa.iniciar(app)
+
 # Eventos Socket.IO
 @socketio.on('connect')
 def handle_connect():
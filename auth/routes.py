@@ -251,7 +251,7 @@ def gerar_token_seguro():
     return secrets.token_urlsafe(32)
 
 def enviar_email_reset_senha(user, codigo, token):
-    """Envia email com código de reset de senha"""
+    """Enfileira email com código de reset de senha (o chamador faz o commit)"""
     try:
         from setores.ti.email_service import email_service
 
@@ -315,10 +315,10 @@ def esqueci_senha():
         )
 
         db.session.add(reset_senha)
-        db.session.commit()
 
-        # Enviar email
+        # Email gravado na fila junto com o registro de reset (enviado após o commit)
         if enviar_email_reset_senha(user, codigo, token):
+            db.session.commit()
             current_app.logger.info(f"Reset de senha solicitado para usuário: {user.usuario}")
 
             return jsonify({
@@ -327,9 +327,8 @@ def esqueci_senha():
                 'token': token
             })
         else:
-            # Se falhou o envio do email, remover o registro
-            db.session.delete(reset_senha)
-            db.session.commit()
+            # Se não foi possível preparar o email, descartar o registro
+            db.session.rollback()
 
             return jsonify({
                 'success': False,
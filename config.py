@@ -53,10 +53,15 @@ class Config:
     CLIENT_SECRET = os.environ.get('CLIENT_SECRET')
     TENANT_ID = os.environ.get('TENANT_ID')
     USER_ID = os.environ.get('USER_ID')
+    # Endpoints do Graph e do login: lidos das variáveis de ambiente GRAPH_API_URL e
+    # GRAPH_LOGIN_URL na importação de fila_email/graph_token (não do app.config);
+    # apontar para scripts/fake_graph.py em testes de carga
     
     # Configurações de email
     EMAIL_SISTEMA = os.environ.get('EMAIL_SISTEMA', 'sistema@evoquefitness.com')
     EMAIL_TI = os.environ.get('EMAIL_TI', 'ti@academiaevoque.com.br')
+    # Notificações do mesmo chamado para o mesmo destinatário dentro da janela viram um único email
+    NOTIFICACOES_JANELA_SEGUNDOS = int(os.environ.get('NOTIFICACOES_JANELA_SEGUNDOS', 60))
     SMTP_SERVER = os.environ.get('SMTP_SERVER', 'smtp.gmail.com')
     SMTP_PORT = int(os.environ.get('SMTP_PORT', 587))
     SMTP_USE_TLS = os.environ.get('SMTP_USE_TLS', 'True').lower() == 'true'
@@ -77,6 +82,11 @@ class Config:
     
     # Configurações de upload
     UPLOAD_FOLDER = os.environ.get('UPLOAD_FOLDER', 'uploads/')
+    ANEXOS_STORAGE_BACKEND = os.environ.get('ANEXOS_STORAGE_BACKEND', 'local')
+    ANEXOS_STORAGE_DIR = os.environ.get('ANEXOS_STORAGE_DIR', os.path.join(UPLOAD_FOLDER, 'anexos'))
+    # Entrega de anexos pelo servidor web: prefixo de location interna do nginx ou X-Sendfile
+    ANEXOS_X_ACCEL_REDIRECT = os.environ.get('ANEXOS_X_ACCEL_REDIRECT')
+    USE_X_SENDFILE = os.environ.get('USE_X_SENDFILE', 'False').lower() == 'true'
     MAX_CONTENT_LENGTH = int(os.environ.get('MAX_CONTENT_LENGTH', 16777216))  # 16MB
     
     # Configurações de timezone
@@ -158,10 +168,15 @@ class DevelopmentMySQLConfig:
     CLIENT_SECRET = os.environ.get('CLIENT_SECRET')
     TENANT_ID = os.environ.get('TENANT_ID')
     USER_ID = os.environ.get('USER_ID')
+    # Endpoints do Graph e do login: lidos das variáveis de ambiente GRAPH_API_URL e
+    # GRAPH_LOGIN_URL na importação de fila_email/graph_token (não do app.config);
+    # apontar para scripts/fake_graph.py em testes de carga
 
     # Configurações de email
     EMAIL_SISTEMA = os.environ.get('EMAIL_SISTEMA', 'sistema@evoquefitness.com')
     EMAIL_TI = os.environ.get('EMAIL_TI', 'ti@academiaevoque.com.br')
+    # Notificações do mesmo chamado para o mesmo destinatário dentro da janela viram um único email
+    NOTIFICACOES_JANELA_SEGUNDOS = int(os.environ.get('NOTIFICACOES_JANELA_SEGUNDOS', 60))
     SMTP_SERVER = os.environ.get('SMTP_SERVER', 'smtp.gmail.com')
     SMTP_PORT = int(os.environ.get('SMTP_PORT', 587))
     SMTP_USE_TLS = os.environ.get('SMTP_USE_TLS', 'True').lower() == 'true'
@@ -182,6 +197,11 @@ class DevelopmentMySQLConfig:
 
     # Configurações de upload
     UPLOAD_FOLDER = os.environ.get('UPLOAD_FOLDER', 'uploads/')
+    ANEXOS_STORAGE_BACKEND = os.environ.get('ANEXOS_STORAGE_BACKEND', 'local')
+    ANEXOS_STORAGE_DIR = os.environ.get('ANEXOS_STORAGE_DIR', os.path.join(UPLOAD_FOLDER, 'anexos'))
+    # Entrega de anexos pelo servidor web: prefixo de location interna do nginx ou X-Sendfile
+    ANEXOS_X_ACCEL_REDIRECT = os.environ.get('ANEXOS_X_ACCEL_REDIRECT')
+    USE_X_SENDFILE = os.environ.get('USE_X_SENDFILE', 'False').lower() == 'true'
     MAX_CONTENT_LENGTH = int(os.environ.get('MAX_CONTENT_LENGTH', 16777216))  # 16MB
 
     # Configurações de timezone
@@ -207,6 +227,7 @@ class DevelopmentSQLiteConfig:
     # Configurações de email (desabilitadas para dev)
     EMAIL_SISTEMA = 'sistema@dev.local'
     EMAIL_TI = 'ti@dev.local'
+    NOTIFICACOES_JANELA_SEGUNDOS = int(os.environ.get('NOTIFICACOES_JANELA_SEGUNDOS', 60))
 
     # Configurações de segurança
     MAX_LOGIN_ATTEMPTS = 5
@@ -224,6 +245,8 @@ class DevelopmentSQLiteConfig:
 
     # Configurações de upload
     UPLOAD_FOLDER = 'uploads/'
+    ANEXOS_STORAGE_BACKEND = 'local'
+    ANEXOS_STORAGE_DIR = 'uploads/anexos'
     MAX_CONTENT_LENGTH = 16777216  # 16MB
 
     # Configurações de timezone
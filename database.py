@@ -1,5 +1,6 @@
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy import Index, event
+from sqlalchemy.orm import deferred
 from flask import current_app
 from flask_login import UserMixin
 from datetime import datetime, date
@@ -154,6 +155,10 @@ class User(db.Model, UserMixin):
 class Chamado(db.Model):
     __table_args__ = (
         Index('ix_chamado_status', 'status'),
+        Index('ix_chamado_sla_status', 'sla_status'),
+        Index('ix_chamado_sla_prazo_resolucao', 'sla_prazo_resolucao'),
+        Index('ix_chamado_sla_prazo_risco', 'sla_prazo_risco'),
+        Index('ix_chamado_data_abertura_id', 'data_abertura', 'id'),  # paginação por cursor
     )
     id = db.Column(db.Integer, primary_key=True)
     codigo = db.Column(db.String(20), unique=True, nullable=False)
@@ -184,6 +189,12 @@ class Chamado(db.Model):
     # Nova coluna para vincular ao usuário
     usuario_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
 
+    # SLA materializado (recalculado ao gravar o chamado, ver sla_utils)
+    sla_prazo_primeira_resposta = db.Column(db.DateTime, nullable=True)
+    sla_prazo_resolucao = db.Column(db.DateTime, nullable=True)
+    sla_prazo_risco = db.Column(db.DateTime, nullable=True)  # 80% do prazo de resolução consumido
+    sla_status = db.Column(db.String(20), nullable=True)
+
     # Relacionamentos para histórico
     status_assumido_por = db.relationship('User', foreign_keys=[status_assumido_por_id])
     concluido_por = db.relationship('User', foreign_keys=[concluido_por_id])
@@ -284,13 +295,23 @@ class SolicitacaoCompra(db.Model):
 
 class AnexoArquivo(db.Model):
     __tablename__ = 'anexos_arquivos'
+    __table_args__ = (
+        Index('ix_anexos_arquivos_sha256', 'sha256'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     chamado_id = db.Column(db.Integer, db.ForeignKey('chamado.id'), nullable=True)
     historico_ticket_id = db.Column(db.Integer, db.ForeignKey('historicos_tickets.id'), nullable=True)
     nome_original = db.Column(db.String(255), nullable=False)
     caminho_arquivo = db.Column(db.String(500), nullable=True)
-    arquivo_blob = db.Column(db.LargeBinary, nullable=True)
+    # Carregado só quando acessado: listagens não trazem o conteúdo do banco
+    arquivo_blob = deferred(db.Column(db.LargeBinary, nullable=True))
+    sha256 = db.Column(db.String(64), nullable=True)  # conteúdo no armazenamento de anexos
+    # Onde está o conteúdo: 'blob' (arquivo_blob), 'caminho' (caminho_arquivo) ou o backend do armazenamento ('local')
+    armazenamento = db.Column(db.String(20), nullable=True)
+    # Derivadas de imagens (JPEG no armazenamento de anexos), geradas em segundo plano
+    sha256_preview = db.Column(db.String(64), nullable=True)
+    sha256_miniatura = db.Column(db.String(64), nullable=True)
     mime_type = db.Column(db.String(100), nullable=True)
     tamanho_bytes = db.Column(db.Integer, nullable=True)
     data_upload = db.Column(db.DateTime, default=lambda: get_brazil_time().replace(tzinfo=None))
@@ -299,12 +320,19 @@ class AnexoArquivo(db.Model):
     chamado = db.relationship('Chamado', backref='anexos')
 
     def url_publica(self):
-        # If the file is stored in DB as blob, serve via download endpoint
-        if self.arquivo_blob:
-            return f"/ti/api/anexos/{self.id}/download"
-        if self.caminho_arquivo and self.caminho_arquivo.startswith('static/'):
-            return '/' + self.caminho_arquivo
-        return self.caminho_arquivo
+        # Decided from metadata only, so building the URL never loads arquivo_blob
+        if self.caminho_arquivo and not self.sha256 and self.armazenamento in (None, 'caminho'):
+            if self.caminho_arquivo.startswith('static/'):
+                return '/' + self.caminho_arquivo
+            return self.caminho_arquivo
+        # Store or DB blob: served via download endpoint
+        return f"/ti/api/anexos/{self.id}/download"
+
+    def url_preview(self):
+        return f"/ti/api/anexos/{self.id}/preview" if self.sha256_preview else None
+
+    def url_miniatura(self):
+        return f"/ti/api/anexos/{self.id}/miniatura" if self.sha256_miniatura else None
 
     def __repr__(self):
         return f'<AnexoArquivo {self.nome_original} ({self.tamanho_bytes} bytes)>'
@@ -378,7 +406,9 @@ class Configuracao(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     chave = db.Column(db.String(100), unique=True, nullable=False)
     valor = db.Column(db.Text, nullable=False)
-    data_atualizacao = db.Column(db.DateTime, default=lambda: get_brazil_time().replace(tzinfo=None))
+    # Também serve de versão para o cache de configurações (setores/ti/sla_utils.py)
+    data_atualizacao = db.Column(db.DateTime, default=lambda: get_brazil_time().replace(tzinfo=None),
+                                 onupdate=lambda: get_brazil_time().replace(tzinfo=None))
 
     def __repr__(self):
         return f'<Configuracao {self.chave}>'
@@ -904,6 +934,10 @@ class EmailMassa(db.Model):
     data_criacao = db.Column(db.DateTime, default=lambda: get_brazil_time().replace(tzinfo=None))
     data_envio = db.Column(db.DateTime, nullable=True)
     data_conclusao = db.Column(db.DateTime, nullable=True)
+    # Atualizado a cada lote enviado; envio 'enviando' sem heartbeat recente é retomado por outro worker
+    data_heartbeat = db.Column(db.DateTime, nullable=True)
+    # Gerado a cada reserva; só o worker que tem o token grava progresso do envio
+    token_envio = db.Column(db.String(32), nullable=True)
     criado_por = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     erro_detalhes = db.Column(db.Text, nullable=True)
 
@@ -912,12 +946,32 @@ class EmailMassa(db.Model):
     criador = db.relationship('User', foreign_keys=[criado_por])
     destinatarios = db.relationship('EmailMassaDestinatario', backref='email_massa', lazy=True, cascade='all, delete-orphan')
 
+    def to_dict(self):
+        total = self.destinatarios_count or 0
+        processados = (self.enviados_count or 0) + (self.falhas_count or 0)
+        return {
+            'id': self.id,
+            'grupo_id': self.grupo_id,
+            'assunto': self.assunto,
+            'status': self.status,
+            'destinatarios_count': total,
+            'enviados_count': self.enviados_count or 0,
+            'falhas_count': self.falhas_count or 0,
+            'percentual': round(min(processados / total * 100, 100), 1) if total else 100.0,
+            'erro_detalhes': self.erro_detalhes,
+            'data_envio': self.data_envio.strftime('%d/%m/%Y %H:%M') if self.data_envio else None,
+            'data_conclusao': self.data_conclusao.strftime('%d/%m/%Y %H:%M') if self.data_conclusao else None
+        }
+
     def __repr__(self):
         return f'<EmailMassa {self.assunto} - {self.status}>'
 
 class EmailMassaDestinatario(db.Model):
     """Tabela para destinatários específicos de emails em massa"""
     __tablename__ = 'email_massa_destinatarios'
+    __table_args__ = (
+        Index('ix_email_massa_destinatarios_envio', 'email_massa_id', 'status_envio'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     email_massa_id = db.Column(db.Integer, db.ForeignKey('emails_massa.id'), nullable=False)
@@ -1101,6 +1155,105 @@ class HistoricoSLA(db.Model):
     def __repr__(self):
         return f'<HistoricoSLA {self.id} - Chamado {self.chamado_id} - {self.acao}>'
 
+class OutboxEvento(db.Model):
+    """Efeitos colaterais (e-mail, Socket.IO...) gravados na mesma transação e executados em segundo plano"""
+    __tablename__ = 'outbox_eventos'
+    __table_args__ = (
+        Index('ix_outbox_eventos_status_proxima', 'status', 'proxima_tentativa'),
+        Index('ix_outbox_eventos_agrupamento', 'tipo', 'chave', 'status'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    tipo = db.Column(db.String(50), nullable=False)  # 'email', 'socketio', ...
+    payload = db.Column(db.Text, nullable=False)  # JSON
+    # Eventos pendentes com o mesmo tipo e chave são agrupados (ex.: 'chamado:12:fulano@x.com')
+    chave = db.Column(db.String(255), nullable=True)
+    status = db.Column(db.String(20), nullable=False, default='pendente')  # pendente, processando, concluido, erro
+    tentativas = db.Column(db.Integer, nullable=False, default=0)
+    # Próxima execução; enquanto 'processando' é o fim da reserva (depois disso outro worker pode retomar)
+    proxima_tentativa = db.Column(db.DateTime, nullable=False, default=lambda: get_brazil_time().replace(tzinfo=None))
+    erro = db.Column(db.Text, nullable=True)
+    data_criacao = db.Column(db.DateTime, default=lambda: get_brazil_time().replace(tzinfo=None))
+    data_processamento = db.Column(db.DateTime, nullable=True)
+
+    def get_payload(self):
+        """Retorna payload como dict"""
+        try:
+            return json.loads(self.payload)
+        except:
+            return {}
+
+    def __repr__(self):
+        return f'<OutboxEvento {self.id} - {self.tipo} - {self.status}>'
+
+class Sequencia(db.Model):
+    """Contadores atômicos (códigos de chamado, protocolos diários)"""
+    __tablename__ = 'sequencias'
+
+    nome = db.Column(db.String(50), primary_key=True)
+    valor = db.Column(db.BigInteger, nullable=False, default=0)  # último número entregue
+
+    def __repr__(self):
+        return f'<Sequencia {self.nome}={self.valor}>'
+
+class SlaRollupDiario(db.Model):
+    """Agregado diário de SLA dos chamados finalizados (dia de abertura x prioridade x unidade)"""
+    __tablename__ = 'sla_rollup_diario'
+    __table_args__ = (
+        db.UniqueConstraint('dia', 'prioridade', 'unidade', name='uq_sla_rollup_diario_chave'),
+        Index('ix_sla_rollup_diario_dia', 'dia'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    dia = db.Column(db.Date, nullable=False)  # dia de abertura dos chamados
+    prioridade = db.Column(db.String(20), nullable=False, default='')
+    unidade = db.Column(db.String(100), nullable=False, default='')
+    chamados_finalizados = db.Column(db.Integer, nullable=False, default=0)
+    chamados_cumpridos = db.Column(db.Integer, nullable=False, default=0)
+    chamados_violados = db.Column(db.Integer, nullable=False, default=0)
+    chamados_em_risco = db.Column(db.Integer, nullable=False, default=0)  # cumpridos com 80% ou mais do prazo usado
+    soma_horas_primeira_resposta = db.Column(db.Float, nullable=False, default=0.0)  # horas úteis
+    qtd_primeira_resposta = db.Column(db.Integer, nullable=False, default=0)
+    soma_horas_resolucao = db.Column(db.Float, nullable=False, default=0.0)  # horas úteis
+    qtd_resolucao = db.Column(db.Integer, nullable=False, default=0)
+    data_atualizacao = db.Column(db.DateTime, default=lambda: get_brazil_time().replace(tzinfo=None))
+
+    def __repr__(self):
+        return f'<SlaRollupDiario {self.dia} {self.prioridade} {self.unidade}>'
+
+class SlaRebaselineJob(db.Model):
+    """Job de recálculo do SLA de todos os chamados após mudança nas regras"""
+    __tablename__ = 'sla_rebaseline_job'
+
+    id = db.Column(db.Integer, primary_key=True)
+    status = db.Column(db.String(20), nullable=False, default='pendente')  # pendente, executando, concluido, erro, substituido
+    ultimo_id = db.Column(db.Integer, nullable=False, default=0)  # checkpoint: último chamado gravado
+    total_chamados = db.Column(db.Integer, nullable=False, default=0)
+    chamados_processados = db.Column(db.Integer, nullable=False, default=0)
+    usuario_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    erro = db.Column(db.Text, nullable=True)
+    data_criacao = db.Column(db.DateTime, default=lambda: get_brazil_time().replace(tzinfo=None))
+    data_inicio = db.Column(db.DateTime, nullable=True)
+    data_heartbeat = db.Column(db.DateTime, nullable=True)
+    data_conclusao = db.Column(db.DateTime, nullable=True)
+
+    def to_dict(self):
+        total = self.total_chamados or 0
+        return {
+            'id': self.id,
+            'status': self.status,
+            'total_chamados': total,
+            'chamados_processados': self.chamados_processados,
+            'percentual': round(min(self.chamados_processados / total * 100, 100), 1) if total else 100.0,
+            'erro': self.erro,
+            'data_criacao': self.data_criacao.isoformat() if self.data_criacao else None,
+            'data_inicio': self.data_inicio.isoformat() if self.data_inicio else None,
+            'data_conclusao': self.data_conclusao.isoformat() if self.data_conclusao else None
+        }
+
+    def __repr__(self):
+        return f'<SlaRebaselineJob {self.id} - {self.status}>'
+
 class Feriado(db.Model):
     """Tabela para feriados nacionais e locais"""
     __tablename__ = 'feriados'
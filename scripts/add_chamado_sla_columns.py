@@ -0,0 +1,85 @@
+import os
+import sys
+
+from flask import Flask
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import SQLAlchemyError
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from config import get_config
+from database import db
+
+# This script adds the materialized SLA columns to the Chamado table and backfills them.
+# Run: python scripts/add_chamado_sla_columns.py
+
+COLUMNS = [
+    ('sla_prazo_primeira_resposta', 'DATETIME'),
+    ('sla_prazo_resolucao', 'DATETIME'),
+    ('sla_prazo_risco', 'DATETIME'),
+    ('sla_status', 'VARCHAR(20)'),
+]
+
+INDEXES = [
+    ('ix_chamado_sla_status', 'sla_status'),
+    ('ix_chamado_sla_prazo_resolucao', 'sla_prazo_resolucao'),
+    ('ix_chamado_sla_prazo_risco', 'sla_prazo_risco'),
+    ('ix_chamado_data_abertura_id', 'data_abertura, id'),
+]
+
+
+def create_app():
+    app = Flask(__name__)
+    app.config.from_object(get_config())
+    db.init_app(app)
+    return app
+
+
+def column_exists(inspector, table, column):
+    for col in inspector.get_columns(table):
+        if col['name'] == column:
+            return True
+    return False
+
+
+def index_exists(inspector, table, index):
+    return any(idx['name'] == index for idx in inspector.get_indexes(table))
+
+
+def add_columns(engine):
+    insp = inspect(engine)
+
+    if not insp.has_table('chamado'):
+        raise RuntimeError('Table "chamado" does not exist. Run the app to create tables first.')
+
+    with engine.begin() as conn:
+        for name, col_type in COLUMNS:
+            try:
+                if not column_exists(insp, 'chamado', name):
+                    conn.execute(text(f"ALTER TABLE chamado ADD COLUMN {name} {col_type}"))
+                    print(f"Added column: {name}")
+                else:
+                    print(f"Column exists: {name}")
+            except SQLAlchemyError as e:
+                print(f"Error adding column {name}: {e}")
+
+        for name, column in INDEXES:
+            try:
+                if not index_exists(insp, 'chamado', name):
+                    conn.execute(text(f"CREATE INDEX {name} ON chamado ({column})"))
+                    print(f"Added index: {name}")
+                else:
+                    print(f"Index exists: {name}")
+            except SQLAlchemyError as e:
+                print(f"Error adding index {name}: {e}")
+
+
+if __name__ == '__main__':
+    app = create_app()
+    with app.app_context():
+        add_columns(db.engine)
+
+        from setores.ti.sla_utils import recalcular_sla_persistido
+        total = recalcular_sla_persistido()
+        print(f"Backfilled SLA for {total} tickets")
+    print('Done.')
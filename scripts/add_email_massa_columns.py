@@ -0,0 +1,59 @@
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.exc import SQLAlchemyError
+from config import get_config
+
+# This script adds the heartbeat and claim token columns used by the group
+# mass-mail dispatcher to emails_massa, and the (email_massa_id, status_envio)
+# index used to find pending recipients, if they don't exist.
+# Run: python scripts/add_email_massa_columns.py
+
+def get_engine():
+    cfg = get_config()
+    uri = getattr(cfg, 'SQLALCHEMY_DATABASE_URI', None) or getattr(cfg, 'DATABASE_URI', None)
+    if not uri:
+        raise RuntimeError('DATABASE URI not found in config')
+    return create_engine(uri)
+
+COLUMNS = [
+    ('emails_massa', 'data_heartbeat', 'DATETIME'),
+    ('emails_massa', 'token_envio', 'VARCHAR(32)'),
+]
+
+INDEXES = [
+    ('email_massa_destinatarios', 'ix_email_massa_destinatarios_envio', 'email_massa_id, status_envio'),
+]
+
+def column_exists(inspector, table, column):
+    return any(col['name'] == column for col in inspector.get_columns(table))
+
+def index_exists(inspector, table, index):
+    return any(idx['name'] == index for idx in inspector.get_indexes(table))
+
+if __name__ == '__main__':
+    engine = get_engine()
+    insp = inspect(engine)
+
+    for table in {t for t, _, _ in COLUMNS} | {t for t, _, _ in INDEXES}:
+        if not insp.has_table(table):
+            raise RuntimeError(f'Table "{table}" does not exist. Run the app to create tables first.')
+
+    with engine.begin() as conn:
+        for table, name, col_type in COLUMNS:
+            try:
+                if not column_exists(insp, table, name):
+                    conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {col_type}"))
+                    print(f"Added column: {table}.{name}")
+                else:
+                    print(f"Column exists: {table}.{name}")
+            except SQLAlchemyError as e:
+                print(f"Error adding column {table}.{name}: {e}")
+        for table, name, columns in INDEXES:
+            try:
+                if not index_exists(insp, table, name):
+                    conn.execute(text(f"CREATE INDEX {name} ON {table} ({columns})"))
+                    print(f"Added index: {name}")
+                else:
+                    print(f"Index exists: {name}")
+            except SQLAlchemyError as e:
+                print(f"Error adding index {name}: {e}")
+    print('Done.')
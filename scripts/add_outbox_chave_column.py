@@ -0,0 +1,58 @@
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.exc import SQLAlchemyError
+from config import get_config
+
+# This script adds the grouping key used to coalesce ticket notifications
+# to outbox_eventos, and the (tipo, chave, status) index used to find the
+# pending event for a key, if they don't exist.
+# Run: python scripts/add_outbox_chave_column.py
+
+def get_engine():
+    cfg = get_config()
+    uri = getattr(cfg, 'SQLALCHEMY_DATABASE_URI', None) or getattr(cfg, 'DATABASE_URI', None)
+    if not uri:
+        raise RuntimeError('DATABASE URI not found in config')
+    return create_engine(uri)
+
+COLUMNS = [
+    ('outbox_eventos', 'chave', 'VARCHAR(255)'),
+]
+
+INDEXES = [
+    ('outbox_eventos', 'ix_outbox_eventos_agrupamento', 'tipo, chave, status'),
+]
+
+def column_exists(inspector, table, column):
+    return any(col['name'] == column for col in inspector.get_columns(table))
+
+def index_exists(inspector, table, index):
+    return any(idx['name'] == index for idx in inspector.get_indexes(table))
+
+if __name__ == '__main__':
+    engine = get_engine()
+    insp = inspect(engine)
+
+    for table in {t for t, _, _ in COLUMNS} | {t for t, _, _ in INDEXES}:
+        if not insp.has_table(table):
+            raise RuntimeError(f'Table "{table}" does not exist. Run the app to create tables first.')
+
+    with engine.begin() as conn:
+        for table, name, col_type in COLUMNS:
+            try:
+                if not column_exists(insp, table, name):
+                    conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {col_type}"))
+                    print(f"Added column: {table}.{name}")
+                else:
+                    print(f"Column exists: {table}.{name}")
+            except SQLAlchemyError as e:
+                print(f"Error adding column {table}.{name}: {e}")
+        for table, name, columns in INDEXES:
+            try:
+                if not index_exists(insp, table, name):
+                    conn.execute(text(f"CREATE INDEX {name} ON {table} ({columns})"))
+                    print(f"Added index: {name}")
+                else:
+                    print(f"Index exists: {name}")
+            except SQLAlchemyError as e:
+                print(f"Error adding index {name}: {e}")
+    print('Done.')
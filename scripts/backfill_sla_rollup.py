@@ -0,0 +1,30 @@
+import os
+import sys
+
+from flask import Flask
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from config import get_config
+from database import db, SlaRollupDiario
+
+# This script creates the sla_rollup_diario table (if missing) and rebuilds it from closed tickets.
+# Run: python scripts/backfill_sla_rollup.py
+
+
+def create_app():
+    app = Flask(__name__)
+    app.config.from_object(get_config())
+    db.init_app(app)
+    return app
+
+
+if __name__ == '__main__':
+    app = create_app()
+    with app.app_context():
+        SlaRollupDiario.__table__.create(db.engine, checkfirst=True)
+
+        from setores.ti.sla_rollup import reconstruir_sla_rollup
+        total = reconstruir_sla_rollup()
+        print(f"Aggregated {total} closed tickets into sla_rollup_diario")
+    print('Done.')
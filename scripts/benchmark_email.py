@@ -0,0 +1,290 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from flask import Flask
+from sqlalchemy import func, insert
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from fake_graph import add_behaviour_arguments, behaviour_from_args, start_server
+
+# End-to-end throughput of the email paths against the local fake Graph
+# (scripts/fake_graph.py), so worker counts can be sized for email-heavy days
+# without touching Microsoft.
+#
+# - tickets: concurrent clients open tickets the way /ti/abrir-chamado does
+#   (Chamado row + rendered confirmation email queued in the outbox, one commit);
+#   measures request latency and how long the outbox takes to deliver everything.
+# - mass mail: one group email to N recipients through the $batch dispatcher;
+#   measures time until the job is finished and messages per second.
+#
+# The app runs against a temporary SQLite file unless --database-uri is given.
+# Results are written as JSON so runs can be compared over time.
+# Run: python scripts/benchmark_email.py [--tickets 200] [--clients 8] [--recipients 1000] [--latency-ms 150]
+
+SENDER = 'benchmark@evoquefitness.com'
+
+
+def configure_environment(base_url):
+    """Point the Graph modules at the fake server; must run before they are imported"""
+    os.environ['GRAPH_API_URL'] = f"{base_url}/v1.0"
+    os.environ['GRAPH_LOGIN_URL'] = base_url
+    for name in ('CLIENT_ID', 'CLIENT_SECRET', 'TENANT_ID'):
+        os.environ[name] = 'benchmark'
+    os.environ['USER_ID'] = SENDER
+
+
+def create_app(database_uri):
+    from config import get_config
+    from database import db
+
+    app = Flask(__name__)
+    app.config.from_object(get_config())
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_uri
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = (
+        {'connect_args': {'timeout': 30, 'check_same_thread': False}} if database_uri.startswith('sqlite') else {}
+    )
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+    return app
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def wait_until(check, timeout, interval=0.2):
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout:
+        if check():
+            return True
+        time.sleep(interval)
+    return False
+
+
+def open_ticket(app, index):
+    """Same database and email work as the ticket route, in one request-sized transaction"""
+    from database import db, Chamado, get_brazil_time
+    from setores.ti.fila_email import EMAIL_TI, enfileirar_email
+    from setores.ti.sequencias import gerar_codigo_chamado, gerar_protocolo
+    from setores.ti.templates_email import renderizar_email
+
+    start = time.perf_counter()
+    with app.app_context():
+        codigo = gerar_codigo_chamado()
+        protocolo = gerar_protocolo()
+        requester = f'bench{index % 500}@evoquefitness.com'
+        chamado = Chamado(
+            codigo=codigo, protocolo=protocolo, solicitante=f'Solicitante {index % 500}', cargo='Benchmark',
+            email=requester, telefone='0000000000', unidade='Unidade Benchmark', problema='Sistema EVO',
+            descricao='Chamado de benchmark', data_abertura=get_brazil_time().replace(tzinfo=None),
+            status='Aberto', prioridade='Normal'
+        )
+        db.session.add(chamado)
+        email = renderizar_email(
+            'chamado_aberto', codigo=codigo, protocolo=protocolo, prioridade='Normal',
+            nome_solicitante=chamado.solicitante, cargo='Benchmark', unidade=chamado.unidade, email=requester,
+            telefone=chamado.telefone, problema=chamado.problema, item_internet=None,
+            descricao=chamado.descricao, data_visita=None
+        )
+        evento = enfileirar_email([requester, EMAIL_TI], email.assunto, email.texto)
+        db.session.commit()
+        evento_id = evento.id
+        db.session.remove()
+    return evento_id, time.perf_counter() - start
+
+
+def email_counts(app, ids):
+    from database import db, OutboxEvento
+
+    with app.app_context():
+        rows = db.session.query(OutboxEvento.status, func.count()).filter(
+            OutboxEvento.id.in_(ids)
+        ).group_by(OutboxEvento.status).all()
+        db.session.remove()
+    return dict(rows)
+
+
+def run_tickets(app, count, clients, timeout):
+    print(f"Opening {count} tickets with {clients} concurrent clients...")
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        results = list(pool.map(lambda i: open_ticket(app, i), range(count)))
+    enqueue_s = time.perf_counter() - start
+    ids = [evento_id for evento_id, _ in results]
+    latencies = [latency for _, latency in results]
+
+    def finished():
+        counts = email_counts(app, ids)
+        return counts.get('concluido', 0) + counts.get('erro', 0) == len(ids)
+
+    delivered = wait_until(finished, timeout)
+    total_s = time.perf_counter() - start
+    counts = email_counts(app, ids)
+    sent = counts.get('concluido', 0)
+    result = {
+        'tickets': count,
+        'clients': clients,
+        'enqueue_s': round(enqueue_s, 3),
+        'tickets_per_s': round(count / enqueue_s, 1),
+        'request_latency_ms': {
+            'median': round(statistics.median(latencies) * 1000, 1),
+            'p95': round(percentile(latencies, 0.95) * 1000, 1),
+            'max': round(max(latencies) * 1000, 1),
+        },
+        'delivered_s': round(total_s, 3),
+        'emails_per_s': round(sent / total_s, 1),
+        'email_status': counts,
+        'timed_out': not delivered,
+    }
+    print(f"  {result['tickets_per_s']} tickets/s, p95 request {result['request_latency_ms']['p95']} ms, "
+          f"{sent}/{count} emails delivered in {result['delivered_s']}s ({result['emails_per_s']} emails/s)")
+    return result
+
+
+def mass_mail_status(app, email_massa_id):
+    from database import db, EmailMassa
+
+    with app.app_context():
+        email_massa = db.session.get(EmailMassa, email_massa_id)
+        status = (email_massa.status, email_massa.enviados_count or 0, email_massa.falhas_count or 0)
+        db.session.remove()
+    return status
+
+
+def run_mass_mail(app, recipients, timeout):
+    from database import db, EmailMassa, EmailMassaDestinatario, GrupoUsuarios, User
+    from setores.ti.email_massa import disparador_email_massa
+
+    print(f"Sending one group email to {recipients} recipients...")
+    with app.app_context():
+        user = User.query.filter_by(usuario='benchmark').first()
+        if not user:
+            user = User(nome='Benchmark', sobrenome='Email', usuario='benchmark', email=SENDER,
+                        senha_hash='-', nivel_acesso='Administrador')
+            db.session.add(user)
+            db.session.flush()
+        grupo = GrupoUsuarios(nome=f'Benchmark {time.time_ns()}', criado_por=user.id)
+        db.session.add(grupo)
+        db.session.flush()
+        email_massa = EmailMassa(grupo_id=grupo.id, assunto='Benchmark de email em massa',
+                                 conteudo='<p>Mensagem de benchmark</p>', tipo='benchmark',
+                                 destinatarios_count=recipients, status='preparando', criado_por=user.id)
+        db.session.add(email_massa)
+        db.session.flush()
+        db.session.execute(insert(EmailMassaDestinatario), [
+            {'email_massa_id': email_massa.id, 'email_destinatario': f'membro{i}@evoquefitness.com',
+             'nome_destinatario': f'Membro {i}', 'status_envio': 'pendente'}
+            for i in range(recipients)
+        ])
+        db.session.commit()
+        email_massa_id = email_massa.id
+        db.session.remove()
+
+    start = time.perf_counter()
+    disparador_email_massa.acordar()
+    finished = wait_until(lambda: mass_mail_status(app, email_massa_id)[0] in ('concluido', 'erro'), timeout)
+    total_s = time.perf_counter() - start
+    status, sent, failed = mass_mail_status(app, email_massa_id)
+    result = {
+        'recipients': recipients,
+        'status': status,
+        'sent': sent,
+        'failed': failed,
+        'total_s': round(total_s, 3),
+        'emails_per_s': round(sent / total_s, 1),
+        'timed_out': not finished,
+    }
+    print(f"  {sent}/{recipients} sent ({failed} failed) in {result['total_s']}s ({result['emails_per_s']} emails/s)")
+    return result
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__)), stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark ticket and mass-mail email throughput against a fake Graph')
+    parser.add_argument('--tickets', type=int, default=200)
+    parser.add_argument('--clients', type=int, default=8, help='concurrent ticket requests')
+    parser.add_argument('--recipients', type=int, default=1000, help='mass-mail recipients (0 skips)')
+    parser.add_argument('--timeout', type=int, default=600, help='seconds to wait for delivery in each phase')
+    parser.add_argument('--database-uri', default=None, help='default: temporary SQLite file')
+    parser.add_argument('--graph-url', default=None, help='use an already running fake_graph.py instead of starting one')
+    parser.add_argument('--output', default=None, help='JSON output file (default: email_benchmark_<timestamp>.json)')
+    add_behaviour_arguments(parser)
+    args = parser.parse_args()
+
+    server = None
+    base_url = args.graph_url
+    if not base_url:
+        server, base_url = start_server(port=0, **behaviour_from_args(args))
+        print(f"Fake Graph started on {base_url}")
+    configure_environment(base_url.rstrip('/'))
+
+    database_uri = args.database_uri
+    temp_path = None
+    if not database_uri:
+        handle, temp_path = tempfile.mkstemp(prefix='email_benchmark_', suffix='.db')
+        os.close(handle)
+        database_uri = f'sqlite:///{temp_path}'
+
+    from setores.ti.cliente_http import cliente_graph
+    from setores.ti.email_massa import disparador_email_massa
+    from setores.ti.outbox import processador_outbox
+
+    app = create_app(database_uri)
+    processador_outbox.iniciar(app)
+    disparador_email_massa.iniciar(app)
+
+    started = datetime.now()
+    report = {
+        'started_at': started.isoformat(),
+        'git_revision': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'fake_graph': behaviour_from_args(args) if server else {'url': base_url},
+        'results': {},
+    }
+    try:
+        if args.tickets:
+            report['results']['tickets'] = run_tickets(app, args.tickets, args.clients, args.timeout)
+        if args.recipients:
+            report['results']['mass_mail'] = run_mass_mail(app, args.recipients, args.timeout)
+        report['connections'] = cliente_graph.metricas()
+        if server:
+            report['fake_graph_stats'] = server.state.snapshot()
+    finally:
+        if server:
+            server.shutdown()
+        if temp_path:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+
+    output = args.output or f"email_benchmark_{started.strftime('%Y%m%d_%H%M%S')}.json"
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"Results written to {output}")
+
+
+if __name__ == '__main__':
+    main()
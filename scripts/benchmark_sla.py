@@ -0,0 +1,236 @@
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+from flask import Flask
+from sqlalchemy.pool import StaticPool
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from config import get_config
+from database import db, Chamado, Configuracao, Feriado, get_brazil_time
+
+# Benchmark of the SLA engine (setores/ti/sla_utils.py) on synthetic tickets.
+# Each size runs against a fresh in-memory SQLite database and results are written
+# as JSON so runs can be compared over time.
+# Run: python scripts/benchmark_sla.py [--sizes 1000 10000 100000] [--seed 42] [--output file.json]
+
+DEFAULT_SIZES = [1000, 10000, 100000]
+
+PRIORITIES = [('Crítica', 0.05), ('Urgente', 0.05), ('Alta', 0.2), ('Normal', 0.5), ('Baixa', 0.2)]
+STATUSES = [('Concluido', 0.6), ('Cancelado', 0.05), ('Aberto', 0.2), ('Aguardando', 0.15)]
+
+# Brazilian national holidays: recurring (month, day) plus a few movable dates
+RECURRING_HOLIDAYS = [(1, 1), (4, 21), (5, 1), (9, 7), (10, 12), (11, 2), (11, 15), (12, 25)]
+MOVABLE_HOLIDAYS = [date(2025, 3, 3), date(2025, 3, 4), date(2025, 4, 18), date(2025, 6, 19),
+                    date(2026, 2, 16), date(2026, 2, 17), date(2026, 4, 3), date(2026, 6, 4),
+                    date(2027, 2, 8), date(2027, 2, 9), date(2027, 3, 26), date(2027, 5, 27)]
+
+HISTORY_DAYS = 365
+
+
+def create_app():
+    app = Flask(__name__)
+    app.config.from_object(get_config())
+    # Single shared in-memory database for every connection in this process
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+        'poolclass': StaticPool,
+        'connect_args': {'check_same_thread': False},
+    }
+    db.init_app(app)
+    return app
+
+
+def weighted_choice(rng, options):
+    return rng.choices([value for value, _ in options], weights=[weight for _, weight in options])[0]
+
+
+def random_opening(rng, now):
+    """Opening time within the history window, mostly during business hours but also nights/weekends"""
+    day = (now - timedelta(days=rng.randint(0, HISTORY_DAYS - 1))).date()
+    if rng.random() < 0.8:
+        minute = rng.randint(8 * 60, 18 * 60 - 1)
+    else:
+        minute = rng.randint(0, 24 * 60 - 1)
+    return datetime.combine(day, datetime.min.time()) + timedelta(minutes=minute, seconds=rng.randint(0, 59))
+
+
+def generate_tickets(count, seed, now):
+    """Seeded synthetic Chamado rows (dicts for bulk insert) with realistic timelines"""
+    rng = random.Random(seed)
+    rows = []
+    for i in range(count):
+        opening = random_opening(rng, now)
+        status = weighted_choice(rng, STATUSES)
+        priority = weighted_choice(rng, PRIORITIES)
+
+        first_response = None
+        if status != 'Aberto' or rng.random() < 0.3:
+            first_response = opening + timedelta(minutes=rng.expovariate(1 / 180))
+        conclusion = None
+        if status in ('Concluido', 'Cancelado'):
+            start = first_response or opening
+            conclusion = start + timedelta(hours=rng.lognormvariate(2.5, 1.0))
+        # Closed tickets cannot end in the future
+        if conclusion and conclusion > now:
+            conclusion = now
+        if first_response and first_response > now:
+            first_response = None
+
+        rows.append({
+            'codigo': f'BENCH{i:07d}',
+            'protocolo': f'B{i:09d}',
+            'solicitante': f'Solicitante {i % 500}',
+            'cargo': 'Benchmark',
+            'email': f'bench{i % 500}@evoquefitness.com',
+            'telefone': '0000000000',
+            'unidade': f'Unidade {rng.randint(1, 40)}',
+            'problema': rng.choice(['Sistema EVO', 'Internet', 'Catraca', 'Som', 'Computador']),
+            'descricao': 'Chamado sintético de benchmark',
+            'data_abertura': opening,
+            'data_primeira_resposta': first_response,
+            'data_conclusao': conclusion,
+            'status': status,
+            'prioridade': priority,
+        })
+    return rows
+
+
+def seed_database(count, seed):
+    from setores.ti.sla_utils import SLA_PADRAO, invalidar_cache_configuracoes, invalidar_calendario_comercial
+
+    db.drop_all()
+    db.create_all()
+
+    db.session.add(Configuracao(chave='sla', valor=json.dumps(SLA_PADRAO)))
+    db.session.add(Configuracao(chave='horario_comercial',
+                                valor=json.dumps({'inicio': '08:00', 'fim': '18:00', 'dias_semana': [0, 1, 2, 3, 4]})))
+    for month, day in RECURRING_HOLIDAYS:
+        db.session.add(Feriado(nome=f'Feriado {day:02d}/{month:02d}', data=date(2026, month, day), recorrente=True))
+    for holiday in MOVABLE_HOLIDAYS:
+        db.session.add(Feriado(nome=f'Feriado {holiday.isoformat()}', data=holiday, recorrente=False))
+    db.session.commit()
+
+    now = get_brazil_time().replace(tzinfo=None)
+    db.session.bulk_insert_mappings(Chamado, generate_tickets(count, seed, now))
+    db.session.commit()
+
+    invalidar_cache_configuracoes()
+    invalidar_calendario_comercial()
+
+
+def measure(function, repeats):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def summarize(timings, count):
+    best = min(timings)
+    return {
+        'runs_s': [round(t, 6) for t in timings],
+        'best_s': round(best, 6),
+        'median_s': round(statistics.median(timings), 6),
+        'per_ticket_us': round(best / count * 1_000_000, 3) if count else None,
+    }
+
+
+def run_size(count, seed, repeats):
+    from setores.ti.sla_utils import (
+        calcular_horas_uteis, calcular_prazo_sla, calcular_sla_chamado_correto,
+        carregar_configuracoes_sla, carregar_configuracoes_horario_comercial,
+        obter_metricas_sla_consolidadas, recalcular_sla_persistido
+    )
+    from setores.ti.sla_lote import buscar_colunas_sla, calcular_sla_linhas
+    from setores.ti.sla_rollup import reconstruir_sla_rollup
+
+    print(f"Seeding {count} tickets (seed={seed})...")
+    start = time.perf_counter()
+    seed_database(count, seed)
+    results = {'seed_s': round(time.perf_counter() - start, 3)}
+
+    config_sla = carregar_configuracoes_sla()
+    config_horario = carregar_configuracoes_horario_comercial()
+    now = get_brazil_time()
+
+    chamados = Chamado.query.order_by(Chamado.id).all()
+    intervals = [(c.data_abertura, c.data_conclusao or now.replace(tzinfo=None)) for c in chamados]
+    limits = [(c.data_abertura, config_sla.get('resolucao_normal', 24)) for c in chamados]
+
+    benchmarks = {
+        'calcular_horas_uteis': lambda: [calcular_horas_uteis(a, b, config_horario) for a, b in intervals],
+        'calcular_prazo_sla': lambda: [calcular_prazo_sla(a, h, config_horario) for a, h in limits],
+        'calcular_sla_chamado_correto': lambda: [
+            calcular_sla_chamado_correto(c, config_sla, config_horario) for c in chamados
+        ],
+        'calcular_sla_lote': lambda: calcular_sla_linhas(buscar_colunas_sla(), config_sla, config_horario),
+        'recalcular_sla_persistido': lambda: recalcular_sla_persistido(),
+        'reconstruir_sla_rollup': lambda: reconstruir_sla_rollup(),
+        'obter_metricas_sla_consolidadas_30d': lambda: obter_metricas_sla_consolidadas(30),
+        'obter_metricas_sla_consolidadas_365d': lambda: obter_metricas_sla_consolidadas(365),
+    }
+    for name, function in benchmarks.items():
+        timings = measure(function, repeats)
+        results[name] = summarize(timings, count)
+        print(f"  {name}: best {results[name]['best_s']:.4f}s ({results[name]['per_ticket_us']} us/ticket)")
+
+    db.session.remove()
+    return results
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__)), stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the SLA engine on synthetic tickets')
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--output', default=None, help='JSON output file (default: sla_benchmark_<timestamp>.json)')
+    args = parser.parse_args()
+
+    import numpy
+
+    started = datetime.now()
+    report = {
+        'started_at': started.isoformat(),
+        'git_revision': git_revision(),
+        'python': platform.python_version(),
+        'numpy': numpy.__version__,
+        'platform': platform.platform(),
+        'seed': args.seed,
+        'repeats': args.repeats,
+        'results': {},
+    }
+
+    app = create_app()
+    with app.app_context():
+        for size in args.sizes:
+            report['results'][str(size)] = run_size(size, args.seed, args.repeats)
+
+    output = args.output or f"sla_benchmark_{started.strftime('%Y%m%d_%H%M%S')}.json"
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"Results written to {output}")
+
+
+if __name__ == '__main__':
+    main()
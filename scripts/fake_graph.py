@@ -0,0 +1,299 @@
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from collections import Counter
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+# Local stand-in for the Microsoft Graph endpoints used by the app: the
+# client-credentials token endpoint, /users/<id>/sendMail and /$batch.
+# Latency, error rate and 429 throttling are configurable, and the per-mailbox
+# concurrency limit (Graph allows 4 concurrent requests per mailbox) is
+# enforced with 429 + Retry-After, so load tests exercise the same retry paths
+# as production without sending real mail.
+#
+# Point the app at it with:
+#   GRAPH_API_URL=http://127.0.0.1:8025/v1.0
+#   GRAPH_LOGIN_URL=http://127.0.0.1:8025
+#   CLIENT_ID=x CLIENT_SECRET=x TENANT_ID=x USER_ID=noreply@example.com
+#
+# GET /stats returns request/message counters; POST /stats/reset clears them.
+# Run: python scripts/fake_graph.py [--port 8025] [--latency-ms 150] [--error-rate 0.01] [--throttle-rate 0.02]
+
+DEFAULT_PORT = 8025
+MAX_BATCH_SIZE = 20
+
+SEND_MAIL_PATH = re.compile(r'^/v1\.0/users/([^/]+)/sendMail$')
+TOKEN_PATH = re.compile(r'^/[^/]+/oauth2/v2\.0/token$')
+BATCH_PATH = '/v1.0/$batch'
+
+
+class FakeGraphState:
+    """Behaviour settings plus thread-safe counters shared by all handler threads"""
+
+    def __init__(self, latency_ms=150, jitter_ms=50, batch_item_ms=20, error_rate=0.0,
+                 throttle_rate=0.0, retry_after=2, mailbox_concurrency=4, token_ttl=3599, seed=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.batch_item_ms = batch_item_ms
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.mailbox_concurrency = mailbox_concurrency
+        self.token_ttl = token_ttl
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._active = Counter()  # mailbox -> requests in flight
+        self.stats = Counter()
+
+    def count(self, key, amount=1):
+        with self._lock:
+            self.stats[key] += amount
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.stats)
+
+    def reset(self):
+        with self._lock:
+            self.stats.clear()
+
+    def outcome(self):
+        """'ok', 'throttled' or 'error' for one message, drawn from the configured rates"""
+        with self._lock:
+            draw = self._rng.random()
+        if draw < self.throttle_rate:
+            return 'throttled'
+        if draw < self.throttle_rate + self.error_rate:
+            return 'error'
+        return 'ok'
+
+    def delay(self, items=1):
+        with self._lock:
+            jitter = self._rng.uniform(-self.jitter_ms, self.jitter_ms) if self.jitter_ms else 0
+        seconds = max(0.0, self.latency_ms + jitter + self.batch_item_ms * (items - 1)) / 1000
+        if seconds:
+            time.sleep(seconds)
+
+    def enter_mailbox(self, mailbox):
+        """Reserve a concurrency slot; False when the mailbox is already at its limit"""
+        with self._lock:
+            if self.mailbox_concurrency and self._active[mailbox] >= self.mailbox_concurrency:
+                return False
+            self._active[mailbox] += 1
+            self.stats['max_concurrency'] = max(self.stats['max_concurrency'], self._active[mailbox])
+            return True
+
+    def leave_mailbox(self, mailbox):
+        with self._lock:
+            self._active[mailbox] -= 1
+
+
+def graph_error(code, message):
+    return {'error': {'code': code, 'message': message,
+                      'innerError': {'date': formatdate(usegmt=True), 'request-id': str(uuid.uuid4())}}}
+
+
+class FakeGraphHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, like the real endpoints
+    server_version = 'FakeGraph/1.0'
+
+    @property
+    def state(self) -> FakeGraphState:
+        return self.server.state
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length) if length else b''
+
+    def _send(self, status, body=None, headers=None):
+        payload = json.dumps(body).encode() if body is not None else b''
+        self.send_response(status)
+        if body is not None:
+            self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, str(value))
+        self.end_headers()
+        if payload:
+            self.wfile.write(payload)
+
+    def _authorized(self):
+        if self.headers.get('Authorization', '').startswith('Bearer fake-'):
+            return True
+        self.state.count('unauthorized')
+        self._send(401, graph_error('InvalidAuthenticationToken', 'Access token is empty or invalid.'))
+        return False
+
+    def do_GET(self):
+        if urlsplit(self.path).path == '/stats':
+            self._send(200, self.state.snapshot())
+        else:
+            self._send(404, graph_error('NotFound', self.path))
+
+    def do_POST(self):
+        path = urlsplit(self.path).path
+        body = self._read_body()
+        if path == '/stats/reset':
+            self.state.reset()
+            self._send(204)
+        elif TOKEN_PATH.match(path):
+            self._token()
+        elif path == BATCH_PATH:
+            self._batch(body)
+        else:
+            match = SEND_MAIL_PATH.match(path)
+            if match:
+                self._send_mail(match.group(1), body)
+            else:
+                self._send(404, graph_error('NotFound', path))
+
+    def _token(self):
+        self.state.count('token_requests')
+        self.state.delay()
+        self._send(200, {'token_type': 'Bearer', 'expires_in': self.state.token_ttl,
+                         'access_token': f'fake-{uuid.uuid4().hex}'})
+
+    def _send_mail(self, mailbox, body):
+        self.state.count('send_mail_requests')
+        if not self._authorized():
+            return
+        try:
+            message = json.loads(body)['message']
+            recipients = message['toRecipients']
+        except (ValueError, KeyError, TypeError):
+            self.state.count('bad_requests')
+            self._send(400, graph_error('ErrorInvalidRequest', 'Invalid sendMail body'))
+            return
+        if not self.state.enter_mailbox(mailbox):
+            self.state.count('throttled')
+            self._send(429, graph_error('ApplicationThrottled', 'MailboxConcurrency limit exceeded'),
+                       {'Retry-After': self.state.retry_after})
+            return
+        try:
+            self.state.delay()
+            outcome = self.state.outcome()
+        finally:
+            self.state.leave_mailbox(mailbox)
+        if outcome == 'throttled':
+            self.state.count('throttled')
+            self._send(429, graph_error('ApplicationThrottled', 'Too many requests'),
+                       {'Retry-After': self.state.retry_after})
+        elif outcome == 'error':
+            self.state.count('server_errors')
+            self._send(500, graph_error('InternalServerError', 'Simulated failure'))
+        else:
+            self.state.count('messages_sent')
+            self.state.count('recipients', len(recipients))
+            self._send(202)
+
+    def _batch(self, body):
+        self.state.count('batch_requests')
+        if not self._authorized():
+            return
+        try:
+            items = json.loads(body)['requests']
+        except (ValueError, KeyError, TypeError):
+            self.state.count('bad_requests')
+            self._send(400, graph_error('BadRequest', 'Invalid batch body'))
+            return
+        if len(items) > MAX_BATCH_SIZE:
+            self.state.count('bad_requests')
+            self._send(400, graph_error('BadRequest', f'Batch limit is {MAX_BATCH_SIZE} requests'))
+            return
+
+        mailboxes = {m.group(1) for m in (SEND_MAIL_PATH.match('/v1.0' + r.get('url', '')) for r in items) if m}
+        mailbox = next(iter(mailboxes), '')
+        if not self.state.enter_mailbox(mailbox):
+            self.state.count('throttled', len(items))
+            self._send(429, graph_error('ApplicationThrottled', 'MailboxConcurrency limit exceeded'),
+                       {'Retry-After': self.state.retry_after})
+            return
+        try:
+            self.state.delay(len(items))
+        finally:
+            self.state.leave_mailbox(mailbox)
+
+        responses = []
+        for item in items:
+            outcome = self.state.outcome()
+            if outcome == 'throttled':
+                self.state.count('throttled')
+                responses.append({'id': item.get('id'), 'status': 429,
+                                  'headers': {'Retry-After': str(self.state.retry_after)},
+                                  'body': graph_error('ApplicationThrottled', 'Too many requests')})
+            elif outcome == 'error':
+                self.state.count('server_errors')
+                responses.append({'id': item.get('id'), 'status': 500,
+                                  'body': graph_error('InternalServerError', 'Simulated failure')})
+            else:
+                self.state.count('messages_sent')
+                responses.append({'id': item.get('id'), 'status': 202, 'body': None})
+        self._send(200, {'responses': responses})
+
+
+def start_server(host='127.0.0.1', port=DEFAULT_PORT, verbose=False, **behaviour):
+    """Start the fake server in a daemon thread; returns (server, base_url)"""
+    server = ThreadingHTTPServer((host, port), FakeGraphHandler)
+    server.daemon_threads = True
+    server.state = FakeGraphState(**behaviour)
+    server.verbose = verbose
+    threading.Thread(target=server.serve_forever, name='fake-graph', daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+def add_behaviour_arguments(parser):
+    parser.add_argument('--latency-ms', type=float, default=150, help='base latency per request')
+    parser.add_argument('--jitter-ms', type=float, default=50, help='uniform +/- jitter added to the latency')
+    parser.add_argument('--batch-item-ms', type=float, default=20, help='extra latency per additional $batch item')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of messages answered with 500')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='fraction of messages answered with 429')
+    parser.add_argument('--retry-after', type=int, default=2, help='Retry-After seconds sent with 429')
+    parser.add_argument('--mailbox-concurrency', type=int, default=4,
+                        help='concurrent requests per mailbox before 429 (0 = unlimited)')
+    parser.add_argument('--seed', type=int, default=None)
+
+
+def behaviour_from_args(args):
+    return {
+        'latency_ms': args.latency_ms,
+        'jitter_ms': args.jitter_ms,
+        'batch_item_ms': args.batch_item_ms,
+        'error_rate': args.error_rate,
+        'throttle_rate': args.throttle_rate,
+        'retry_after': args.retry_after,
+        'mailbox_concurrency': args.mailbox_concurrency,
+        'seed': args.seed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fake Microsoft Graph server for email load tests')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--verbose', action='store_true', help='log every request')
+    add_behaviour_arguments(parser)
+    args = parser.parse_args()
+
+    server, base_url = start_server(args.host, args.port, args.verbose, **behaviour_from_args(args))
+    print(f"Fake Graph listening on {base_url}")
+    print(f"  GRAPH_API_URL={base_url}/v1.0")
+    print(f"  GRAPH_LOGIN_URL={base_url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
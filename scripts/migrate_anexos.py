@@ -0,0 +1,399 @@
+import argparse
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from io import BytesIO
+
+from flask import Flask
+from sqlalchemy import func, select, update
+from werkzeug.utils import secure_filename
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.append(PROJECT_ROOT)
+
+from config import get_config
+from database import db, AnexoArquivo
+
+# Moves attachment contents between storage backends:
+#   blob    -> anexos_arquivos.arquivo_blob
+#   caminho -> file under the project (caminho_arquivo, e.g. static/uploads/anexos/...)
+#   local   -> content-addressed attachment store (ANEXOS_STORAGE_DIR)
+#
+# Rows are read in id order in batches; the contents of each batch are copied by a
+# thread pool and every row is updated in its own short transaction, conditioned on
+# its storage kind not having changed. After each batch the last id is written to a
+# checkpoint file, so an interrupted run resumes where it stopped. Contents are
+# hashed while copied and, with --verify, read back from the destination and
+# compared before the row is switched.
+#
+# Requires the armazenamento column (python scripts/migrate_anexos_to_store.py --metadata-only).
+# Run: python scripts/migrate_anexos.py --from blob --to local [--workers 4] [--batch-size 200]
+#          [--max-mb-per-second 20] [--verify] [--delete-source] [--dry-run]
+#
+# --sweep-orphans removes store contents that no row references (sha256, sha256_preview
+# or sha256_miniatura), e.g. uploads whose ticket transaction was rolled back, plus
+# interrupted temporary uploads. Only files older than --min-age-hours are touched, so
+# uploads of transactions still in flight are left alone.
+# Run: python scripts/migrate_anexos.py --sweep-orphans [--min-age-hours 24] [--dry-run]
+
+KINDS = ('blob', 'caminho', 'local')
+CHUNK_SIZE = 64 * 1024
+DEFAULT_PATH_DIR = os.path.join('static', 'uploads', 'anexos')
+
+table = AnexoArquivo.__table__
+
+
+def create_app():
+    # root_path at the project root so a relative ANEXOS_STORAGE_DIR matches the app
+    app = Flask(__name__, root_path=PROJECT_ROOT)
+    app.config.from_object(get_config())
+    db.init_app(app)
+    return app
+
+
+class Throttle:
+    """Limits the combined copy rate of all worker threads"""
+
+    def __init__(self, bytes_per_second):
+        self.bytes_per_second = bytes_per_second
+        self.started = time.monotonic()
+        self.total = 0
+        self.lock = threading.Lock()
+
+    def consume(self, size):
+        if not self.bytes_per_second:
+            return
+        with self.lock:
+            self.total += size
+            wait = self.total / self.bytes_per_second - (time.monotonic() - self.started)
+        if wait > 0:
+            time.sleep(wait)
+
+
+class HashingReader:
+    """File-like wrapper that hashes and counts everything read through it"""
+
+    def __init__(self, source):
+        self.source = source
+        self.digest = hashlib.sha256()
+        self.size = 0
+
+    def read(self, size=-1):
+        chunk = self.source.read(size)
+        self.digest.update(chunk)
+        self.size += len(chunk)
+        return chunk
+
+
+class Checkpoint:
+    def __init__(self, path, source, target):
+        self.path = path
+        self.data = {'source': source, 'target': target, 'last_id': 0,
+                     'migrated': 0, 'failed': 0, 'bytes': 0, 'updated_at': None}
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, encoding='utf-8') as f:
+            saved = json.load(f)
+        if (saved.get('source'), saved.get('target')) != (self.data['source'], self.data['target']):
+            raise SystemExit(f"Checkpoint {self.path} belongs to {saved.get('source')} -> {saved.get('target')}; "
+                             f"use --reset or another --checkpoint")
+        self.data.update(saved)
+        print(f"Resuming after id={self.data['last_id']} ({self.data['migrated']} already migrated)")
+
+    def save(self):
+        self.data['updated_at'] = datetime.now().isoformat()
+        temporary = f'{self.path}.tmp'
+        with open(temporary, 'w', encoding='utf-8') as f:
+            json.dump(self.data, f, indent=2)
+        os.replace(temporary, self.path)
+
+
+def hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def project_path(relative):
+    return os.path.normpath(os.path.join(PROJECT_ROOT, relative.lstrip('/')))
+
+
+class Migrator:
+    def __init__(self, app, args):
+        from setores.ti.armazenamento_anexos import obter_armazenamento
+
+        self.app = app
+        self.args = args
+        self.engine = db.engine
+        self.store = obter_armazenamento(app)
+        self.throttle = Throttle(int(args.max_mb_per_second * 1024 * 1024) if args.max_mb_per_second else 0)
+        self.kinds = {'blob': 'blob', 'caminho': 'caminho', 'local': self.store.tipo}
+
+    # --- source -----------------------------------------------------------------
+
+    def open_source(self, row):
+        if self.args.source == 'blob':
+            with self.engine.connect() as conn:
+                blob = conn.execute(select(table.c.arquivo_blob).where(table.c.id == row.id)).scalar()
+            if blob is None:
+                raise ValueError('arquivo_blob is empty')
+            return BytesIO(blob)
+        if self.args.source == 'caminho':
+            if not row.caminho_arquivo:
+                raise ValueError('caminho_arquivo is empty')
+            return open(project_path(row.caminho_arquivo), 'rb')
+        return self.store.abrir(row.sha256)
+
+    def source_size(self, row):
+        """Size without copying anything (dry-run)"""
+        if self.args.source == 'blob':
+            with self.engine.connect() as conn:
+                return conn.execute(select(func.length(table.c.arquivo_blob)).where(table.c.id == row.id)).scalar() or 0
+        if self.args.source == 'caminho':
+            path = project_path(row.caminho_arquivo or '')
+            return os.path.getsize(path) if os.path.isfile(path) else 0
+        path = self.store.caminho_local(row.sha256)
+        return os.path.getsize(path) if path and os.path.isfile(path) else (row.tamanho_bytes or 0)
+
+    def cleanup_source(self, row):
+        """Removes the old copy once no row references it any more"""
+        if self.args.source == 'caminho':
+            path = project_path(row.caminho_arquivo)
+            with self.engine.connect() as conn:
+                in_use = conn.execute(select(func.count()).where(
+                    table.c.caminho_arquivo == row.caminho_arquivo, table.c.armazenamento == 'caminho'
+                )).scalar()
+            if not in_use and os.path.exists(path):
+                os.remove(path)
+        elif self.args.source == 'local':
+            # Same content may also be another attachment's preview or thumbnail
+            if not self.referenced([row.sha256]):
+                self.store.remover(row.sha256)
+
+    # --- destination --------------------------------------------------------------
+
+    def write_target(self, row, reader):
+        """Copies the content and returns the column values that point the row at it"""
+        if self.args.target == 'local':
+            sha256, size = self.store.salvar_stream(reader)
+            if self.args.verify and hash_file(self.store.caminho_local(sha256)) != sha256:
+                raise ValueError('stored content does not match its hash')
+            return {'sha256': sha256, 'armazenamento': self.store.tipo, 'tamanho_bytes': size,
+                    'arquivo_blob': None, 'caminho_arquivo': None}
+
+        if self.args.target == 'blob':
+            data = reader.read()
+            return {'arquivo_blob': data, 'armazenamento': 'blob', 'tamanho_bytes': len(data),
+                    'sha256': None, 'caminho_arquivo': None}
+
+        relative = os.path.join(self.args.path_dir, f'{row.id}_{secure_filename(row.nome_original) or "anexo"}')
+        path = project_path(relative)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            for chunk in iter(lambda: reader.read(CHUNK_SIZE), b''):
+                f.write(chunk)
+        if self.args.verify and hash_file(path) != reader.digest.hexdigest():
+            raise ValueError('written file does not match the source hash')
+        return {'caminho_arquivo': relative.replace(os.sep, '/'), 'armazenamento': 'caminho',
+                'tamanho_bytes': reader.size, 'arquivo_blob': None, 'sha256': None}
+
+    def verify_blob(self, conn, row_id, expected):
+        # Same transaction as the update: a mismatch rolls the row back
+        blob = conn.execute(select(table.c.arquivo_blob).where(table.c.id == row_id)).scalar()
+        return blob is not None and hashlib.sha256(blob).hexdigest() == expected
+
+    # --- per row ------------------------------------------------------------------
+
+    def migrate_row(self, row):
+        try:
+            with self.open_source(row) as source:
+                reader = HashingReader(source)
+                values = self.write_target(row, reader)
+                # Drain whatever the target did not read (blob reads everything at once)
+                while reader.read(CHUNK_SIZE):
+                    pass
+            digest = reader.digest.hexdigest()
+            if self.args.source == 'local' and digest != row.sha256:
+                raise ValueError(f'source content is corrupted (hash {digest})')
+            self.throttle.consume(reader.size)
+
+            with self.engine.begin() as conn:
+                result = conn.execute(
+                    update(table)
+                    .where(table.c.id == row.id, table.c.armazenamento == self.kinds[self.args.source])
+                    .values(**values)
+                )
+                if result.rowcount != 1:
+                    return 'skipped', 0, 'storage kind changed meanwhile'
+                if self.args.verify and self.args.target == 'blob' and not self.verify_blob(conn, row.id, digest):
+                    raise ValueError('blob read back does not match the source hash')
+
+            if self.args.delete_source:
+                self.cleanup_source(row)
+            return 'migrated', reader.size, None
+        except Exception as e:
+            return 'failed', 0, str(e)
+
+    # --- orphans ------------------------------------------------------------------
+
+    def referenced(self, hashes):
+        with self.engine.connect() as conn:
+            rows = conn.execute(
+                select(table.c.sha256, table.c.sha256_preview, table.c.sha256_miniatura)
+                .where(table.c.sha256.in_(hashes) | table.c.sha256_preview.in_(hashes)
+                       | table.c.sha256_miniatura.in_(hashes))
+            ).all()
+        return {value for row in rows for value in row if value}
+
+    def sweep_orphans(self):
+        cutoff = time.time() - self.args.min_age_hours * 3600
+        removed = total = 0
+
+        def sweep(hashes):
+            nonlocal removed, total
+            in_use = self.referenced(hashes)
+            for sha256 in hashes:
+                if sha256 in in_use:
+                    continue
+                path = self.store.caminho_local(sha256)
+                size = os.path.getsize(path) if path and os.path.isfile(path) else 0
+                # Re-checked just before removing: a new upload of the same content renews the date
+                if path and os.path.isfile(path) and os.path.getmtime(path) > cutoff:
+                    continue
+                if not self.args.dry_run:
+                    self.store.remover(sha256)
+                removed += 1
+                total += size
+
+        batch = []
+        for sha256, modified in self.store.listar():
+            if modified > cutoff:
+                continue
+            batch.append(sha256)
+            if len(batch) >= self.args.batch_size:
+                sweep(batch)
+                batch = []
+        if batch:
+            sweep(batch)
+
+        temporaries = 0
+        for path, modified in self.store.listar_temporarios():
+            if modified <= cutoff:
+                if not self.args.dry_run:
+                    os.remove(path)
+                temporaries += 1
+
+        prefix = '[dry-run] would remove' if self.args.dry_run else 'Removed'
+        print(f'{prefix} {removed} orphaned contents ({total / 1024 / 1024:.1f} MB) '
+              f'and {temporaries} temporary uploads older than {self.args.min_age_hours}h')
+
+    # --- batches ------------------------------------------------------------------
+
+    def next_batch(self, last_id):
+        with self.engine.connect() as conn:
+            return conn.execute(
+                select(table.c.id, table.c.nome_original, table.c.caminho_arquivo,
+                       table.c.sha256, table.c.tamanho_bytes)
+                .where(table.c.id > last_id, table.c.armazenamento == self.kinds[self.args.source])
+                .order_by(table.c.id)
+                .limit(self.args.batch_size)
+            ).all()
+
+    def dry_run(self):
+        last_id = total = count = 0
+        while True:
+            rows = self.next_batch(last_id)
+            if not rows:
+                break
+            with ThreadPoolExecutor(max_workers=self.args.workers) as pool:
+                sizes = list(pool.map(self.source_size, rows))
+            count += len(rows)
+            total += sum(sizes)
+            last_id = rows[-1].id
+        print(f'[dry-run] {count} attachments, {total} bytes ({total / 1024 / 1024:.1f} MB) '
+              f'would move {self.args.source} -> {self.args.target}')
+
+    def run(self, checkpoint):
+        data = checkpoint.data
+        with ThreadPoolExecutor(max_workers=self.args.workers) as pool:
+            while True:
+                rows = self.next_batch(data['last_id'])
+                if not rows:
+                    break
+                for row, (status, size, error) in zip(rows, pool.map(self.migrate_row, rows)):
+                    if status == 'migrated':
+                        data['migrated'] += 1
+                        data['bytes'] += size
+                    elif status == 'failed':
+                        data['failed'] += 1
+                        print(f'Error migrating anexo.id={row.id}: {error}')
+                    else:
+                        print(f'Skipped anexo.id={row.id}: {error}')
+                data['last_id'] = rows[-1].id
+                checkpoint.save()
+                print(f"Batch up to id={data['last_id']}: {data['migrated']} migrated, "
+                      f"{data['failed']} failed, {data['bytes']} bytes")
+                if self.args.pause:
+                    time.sleep(self.args.pause)
+
+        print('\nSummary:')
+        print('  migrated:', data['migrated'])
+        print('  failed  :', data['failed'])
+        print('  bytes   :', data['bytes'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Move attachment contents between storage backends')
+    parser.add_argument('--from', dest='source', choices=KINDS)
+    parser.add_argument('--to', dest='target', choices=KINDS)
+    parser.add_argument('--batch-size', type=int, default=200)
+    parser.add_argument('--workers', type=int, default=4, help='Threads copying contents')
+    parser.add_argument('--max-mb-per-second', type=float, default=0, help='Copy rate limit (0 = unlimited)')
+    parser.add_argument('--pause', type=float, default=0, help='Seconds to sleep between batches')
+    parser.add_argument('--verify', action='store_true', help='Read the destination back and compare hashes')
+    parser.add_argument('--delete-source', action='store_true', help='Remove old files/store contents no longer referenced')
+    parser.add_argument('--path-dir', default=DEFAULT_PATH_DIR, help='Directory (relative to the project) for --to caminho')
+    parser.add_argument('--checkpoint', default=None, help='Checkpoint file (default: migrate_anexos_<from>_<to>.checkpoint.json)')
+    parser.add_argument('--reset', action='store_true', help='Ignore an existing checkpoint')
+    parser.add_argument('--dry-run', action='store_true', help='Only report how many attachments/bytes would move')
+    parser.add_argument('--sweep-orphans', action='store_true',
+                        help='Remove store contents no attachment references instead of migrating')
+    parser.add_argument('--min-age-hours', type=float, default=24,
+                        help='With --sweep-orphans, only touch contents older than this')
+    args = parser.parse_args()
+
+    if not args.sweep_orphans:
+        if not args.source or not args.target:
+            parser.error('--from and --to are required (or use --sweep-orphans)')
+        if args.source == args.target:
+            parser.error('--from and --to must be different')
+
+    app = create_app()
+    with app.app_context():
+        migrator = Migrator(app, args)
+        if args.sweep_orphans:
+            migrator.sweep_orphans()
+            return
+        if args.dry_run:
+            migrator.dry_run()
+            return
+
+        checkpoint = Checkpoint(args.checkpoint or f'migrate_anexos_{args.source}_{args.target}.checkpoint.json',
+                                args.source, args.target)
+        if not args.reset:
+            checkpoint.load()
+        migrator.run(checkpoint)
+    print('Done.')
+
+
+if __name__ == '__main__':
+    main()
@@ -13,6 +13,9 @@ The script will:
 - Update tamanho_bytes and mime_type when possible; set caminho_arquivo to NULL after successful migration
 
 Make a DB backup before running in production.
+
+This script migrates every row in a single transaction. For large databases use
+scripts/migrate_anexos.py --from caminho --to blob (batched, resumable, parallel).
 """
 
 import os
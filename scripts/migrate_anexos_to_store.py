@@ -0,0 +1,151 @@
+import argparse
+import os
+import sys
+from io import BytesIO
+
+from flask import Flask
+from sqlalchemy import inspect, select, text, update
+from sqlalchemy.exc import SQLAlchemyError
+
+PROJECT_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.append(PROJECT_ROOT)
+
+from config import get_config
+from database import db, AnexoArquivo
+
+# This script adds the sha256/armazenamento columns to anexos_arquivos, fills
+# armazenamento (and missing sizes) for existing rows, and moves attachment blobs
+# stored in the database (arquivo_blob) into the content-addressed attachment store
+# (ANEXOS_STORAGE_DIR). Rows are processed in id order with one commit per batch, so
+# an interrupted run can simply be started again.
+# Run: python scripts/migrate_anexos_to_store.py [--batch-size 100] [--dry-run] [--metadata-only]
+
+TABLE = 'anexos_arquivos'
+
+COLUMNS = [
+    ('sha256', 'VARCHAR(64)'),
+    ('armazenamento', 'VARCHAR(20)'),
+    ('sha256_preview', 'VARCHAR(64)'),
+    ('sha256_miniatura', 'VARCHAR(64)'),
+]
+
+INDEXES = [
+    ('ix_anexos_arquivos_sha256', 'sha256'),
+]
+
+# Storage kind of rows written before the column existed
+BACKFILL = [
+    "UPDATE anexos_arquivos SET armazenamento = 'local' WHERE armazenamento IS NULL AND sha256 IS NOT NULL",
+    "UPDATE anexos_arquivos SET armazenamento = 'blob' WHERE armazenamento IS NULL AND arquivo_blob IS NOT NULL",
+    "UPDATE anexos_arquivos SET armazenamento = 'caminho' WHERE armazenamento IS NULL AND caminho_arquivo IS NOT NULL",
+    "UPDATE anexos_arquivos SET tamanho_bytes = LENGTH(arquivo_blob) WHERE tamanho_bytes IS NULL AND arquivo_blob IS NOT NULL",
+]
+
+
+def create_app():
+    # root_path at the project root so a relative ANEXOS_STORAGE_DIR matches the app
+    app = Flask(__name__, root_path=os.path.abspath(PROJECT_ROOT))
+    app.config.from_object(get_config())
+    db.init_app(app)
+    return app
+
+
+def add_columns(engine):
+    insp = inspect(engine)
+    if not insp.has_table(TABLE):
+        raise RuntimeError(f'Table "{TABLE}" does not exist. Run the app to create tables first.')
+
+    with engine.begin() as conn:
+        for name, col_type in COLUMNS:
+            if not any(col['name'] == name for col in insp.get_columns(TABLE)):
+                conn.execute(text(f"ALTER TABLE {TABLE} ADD COLUMN {name} {col_type}"))
+                print(f'Added column: {name}')
+            else:
+                print(f'Column exists: {name}')
+        for name, column in INDEXES:
+            if not any(idx['name'] == name for idx in insp.get_indexes(TABLE)):
+                conn.execute(text(f"CREATE INDEX {name} ON {TABLE} ({column})"))
+                print(f'Added index: {name}')
+            else:
+                print(f'Index exists: {name}')
+
+
+def backfill_metadata(engine):
+    with engine.begin() as conn:
+        for sql in BACKFILL:
+            print(f'{conn.execute(text(sql)).rowcount} rows: {sql}')
+
+
+def migrate_blobs(batch_size, dry_run=False):
+    from setores.ti.armazenamento_anexos import detectar_mime, obter_armazenamento
+
+    store = obter_armazenamento()
+    print(f'Attachment store: {store.tipo} ({getattr(store, "diretorio", "")})')
+
+    last_id = 0
+    migrated = failed = total_bytes = 0
+    while True:
+        ids = db.session.execute(
+            select(AnexoArquivo.id)
+            .where(AnexoArquivo.id > last_id,
+                   AnexoArquivo.arquivo_blob.isnot(None),
+                   AnexoArquivo.sha256.is_(None))
+            .order_by(AnexoArquivo.id)
+            .limit(batch_size)
+        ).scalars().all()
+        if not ids:
+            break
+        last_id = ids[-1]
+
+        for anexo_id in ids:
+            # One blob in memory at a time
+            blob, nome, mime = db.session.execute(
+                select(AnexoArquivo.arquivo_blob, AnexoArquivo.nome_original, AnexoArquivo.mime_type)
+                .where(AnexoArquivo.id == anexo_id)
+            ).one()
+            if dry_run:
+                print(f'[dry-run] Would move id={anexo_id} size={len(blob)}')
+                migrated += 1
+                total_bytes += len(blob)
+                continue
+            try:
+                sha256, size = store.salvar_stream(BytesIO(blob))
+                db.session.execute(
+                    update(AnexoArquivo)
+                    .where(AnexoArquivo.id == anexo_id)
+                    .values(sha256=sha256, armazenamento=store.tipo, tamanho_bytes=size,
+                            mime_type=detectar_mime(nome, mime), arquivo_blob=None)
+                    .execution_options(synchronize_session=False)
+                )
+                migrated += 1
+                total_bytes += size
+            except Exception as e:
+                print(f'Error migrating anexo.id={anexo_id}: {e}')
+                failed += 1
+        db.session.commit()
+        print(f'Batch up to id={last_id}: {migrated} migrated so far ({total_bytes} bytes)')
+
+    print('\nSummary:')
+    print('  migrated:', migrated)
+    print('  failed  :', failed)
+    print('  bytes   :', total_bytes)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Move attachment blobs into the attachment store')
+    parser.add_argument('--batch-size', type=int, default=100)
+    parser.add_argument('--dry-run', action='store_true')
+    parser.add_argument('--metadata-only', action='store_true', help='Only add columns and fill armazenamento')
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        try:
+            add_columns(db.engine)
+            backfill_metadata(db.engine)
+        except SQLAlchemyError as e:
+            print('Error while adding columns:', e)
+            sys.exit(1)
+        if not args.metadata_only:
+            migrate_blobs(args.batch_size, dry_run=args.dry_run)
+    print('Done.')
@@ -4,7 +4,7 @@ from auth.auth_helpers import setor_required
 from datetime import datetime, date
 from database import db, SolicitacaoCompra, User
 from setores.ti.email_service import email_service
-from jinja2 import Template
+from setores.ti.templates_email import renderizar_email
 import os
 
 compras_bp = Blueprint(
@@ -115,10 +115,11 @@ def criar_solicitacao():
         )
 
         db.session.add(solicitacao)
-        db.session.commit()
+        db.session.flush()
 
-        # Enviar email de notificação
+        # Emails de notificação gravados na fila na mesma transação da solicitação
         enviar_email_nova_solicitacao(solicitacao)
+        db.session.commit()
 
         current_app.logger.info(f'Nova solicitação de compra criada: {protocolo} pelo usuário {current_user.usuario}')
 
@@ -134,123 +135,13 @@ def criar_solicitacao():
         return jsonify({'erro': 'Erro interno do servidor'}), 500
 
 def enviar_email_nova_solicitacao(solicitacao):
-    """Envia email de notificação para nova solicitação de compra"""
+    """Enfileira emails de notificação para nova solicitação de compra (o chamador faz o commit)"""
     try:
-        template_html = Template("""
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <meta charset="utf-8">
-            <style>
-                body { font-family: Arial, sans-serif; line-height: 1.6; color: #333; }
-                .container { max-width: 600px; margin: 0 auto; padding: 20px; }
-                .header { background-color: #FF6200; color: white; padding: 20px; text-align: center; border-radius: 8px 8px 0 0; }
-                .content { background-color: #f8f9fa; padding: 20px; border-radius: 0 0 8px 8px; }
-                .info-box { background-color: white; padding: 15px; margin: 10px 0; border-left: 4px solid #FF6200; border-radius: 4px; }
-                .priority-high { border-left-color: #dc3545; }
-                .priority-urgent { border-left-color: #ff0000; background-color: #fff5f5; }
-                .footer { text-align: center; margin-top: 20px; font-size: 12px; color: #666; }
-                .btn { background-color: #FF6200; color: white; padding: 10px 20px; text-decoration: none; border-radius: 4px; display: inline-block; }
-                .status-badge { background-color: #28a745; color: white; padding: 4px 8px; border-radius: 12px; font-size: 12px; }
-            </style>
-        </head>
-        <body>
-            <div class="container">
-                <div class="header">
-                    <h1>📋 Nova Solicitação de Compra</h1>
-                </div>
-
-                <div class="content">
-                    <p>Uma nova solicitação de compra foi criada no sistema:</p>
-
-                    <div class="info-box {% if solicitacao.prioridade == 'Alta' %}priority-high{% elif solicitacao.prioridade == 'Urgente' %}priority-urgent{% endif %}">
-                        <h3>📄 Detalhes da Solicitação</h3>
-                        <p><strong>Protocolo:</strong> {{ solicitacao.protocolo }}</p>
-                        <p><strong>Solicitante:</strong> {{ solicitacao.solicitante.nome }} {{ solicitacao.solicitante.sobrenome }}</p>
-                        <p><strong>Email:</strong> {{ solicitacao.solicitante.email }}</p>
-                        <p><strong>Setor:</strong> {{ solicitacao.solicitante.setor }}</p>
-                        <p><strong>Data:</strong> {{ data_atual }}</p>
-                        <p><strong>Status:</strong> <span class="status-badge">{{ solicitacao.status }}</span></p>
-                    </div>
-
-                    <div class="info-box">
-                        <h3>🛍�� Produto/Serviço</h3>
-                        <p><strong>Item:</strong> {{ solicitacao.produto }}</p>
-                        <p><strong>Quantidade:</strong> {{ solicitacao.quantidade }}</p>
-                        {% if solicitacao.categoria %}<p><strong>Categoria:</strong> {{ solicitacao.categoria|title }}</p>{% endif %}
-                        {% if solicitacao.valor_estimado %}<p><strong>Valor Estimado:</strong> R$ {{ "%.2f"|format(solicitacao.valor_estimado) }}</p>{% endif %}
-                        {% if solicitacao.data_entrega_desejada %}<p><strong>Data Desejada:</strong> {{ solicitacao.data_entrega_desejada.strftime('%d/%m/%Y') }}</p>{% endif %}
-                    </div>
-
-                    <div class="info-box">
-                        <h3>📝 Justificativa</h3>
-                        <p>{{ solicitacao.justificativa }}</p>
-                        {% if solicitacao.observacoes %}
-                        <h4>💬 Observações Adicionais</h4>
-                        <p>{{ solicitacao.observacoes }}</p>
-                        {% endif %}
-                    </div>
-
-                    <div class="info-box">
-                        <h3>⚡ Prioridade</h3>
-                        <p><strong>{{ solicitacao.prioridade }}</strong> {% if solicitacao.urgente %} - <span style="color: red;">URGENTE</span>{% endif %}</p>
-                    </div>
-
-                    <p style="text-align: center; margin: 30px 0;">
-                        <a href="#" class="btn">Acessar Sistema de Compras</a>
-                    </p>
-                </div>
-
-                <div class="footer">
-                    <p>Este é um email automático do sistema de compras da Evoque Fitness.</p>
-                    <p>{{ data_atual }}</p>
-                </div>
-            </div>
-        </body>
-        </html>
-        """)
-
         # Preparar dados para o template
         from database import get_brazil_time
         data_atual = get_brazil_time().strftime('%d/%m/%Y às %H:%M')
 
-        corpo_html = template_html.render(
-            solicitacao=solicitacao,
-            data_atual=data_atual
-        )
-
-        # Versão texto
-        corpo_texto = f"""
-Nova Solicitação de Compra - Evoque Fitness
-
-PROTOCOLO: {solicitacao.protocolo}
-
-SOLICITANTE:
-- Nome: {solicitacao.solicitante.nome} {solicitacao.solicitante.sobrenome}
-- Email: {solicitacao.solicitante.email}
-- Setor: {solicitacao.solicitante.setor}
-
-PRODUTO/SERVIÇO:
-- Item: {solicitacao.produto}
-- Quantidade: {solicitacao.quantidade}
-- Categoria: {solicitacao.categoria or 'Não especificada'}
-- Valor Estimado: R$ {solicitacao.valor_estimado or 'Não informado'}
-- Data Desejada: {solicitacao.data_entrega_desejada.strftime('%d/%m/%Y') if solicitacao.data_entrega_desejada else 'Não especificada'}
-
-JUSTIFICATIVA:
-{solicitacao.justificativa}
-
-OBSERVAÇÕES:
-{solicitacao.observacoes or 'Nenhuma'}
-
-PRIORIDADE: {solicitacao.prioridade} {'- URGENTE' if solicitacao.urgente else ''}
-
----
-Sistema de Compras Evoque Fitness
-{data_atual}
-        """
-
-        assunto = f"📋 Nova Solicitação de Compra - {solicitacao.protocolo}"
+        email = renderizar_email('nova_solicitacao_compra', solicitacao=solicitacao, data_atual=data_atual)
 
         # Enviar para o setor de compras e administradores
         destinatarios = []
@@ -267,13 +158,13 @@ Sistema de Compras Evoque Fitness
             if admin.email not in destinatarios:
                 destinatarios.append(admin.email)
 
-        # Enviar email para cada destinatário
+        # Enfileirar email para cada destinatário
         for destinatario in destinatarios:
-            email_service.enviar_email(destinatario, assunto, corpo_html, corpo_texto)
+            email_service.enfileirar_email(destinatario, email.assunto, email.html, email.texto)
 
         # Enviar email de confirmação para o solicitante
-        assunto_confirmacao = f"✅ Solicitação de Compra Criada - {solicitacao.protocolo}"
-        email_service.enviar_email(solicitacao.solicitante.email, assunto_confirmacao, corpo_html, corpo_texto)
+        confirmacao = renderizar_email('confirmacao_solicitacao_compra', solicitacao=solicitacao)
+        email_service.enfileirar_email(solicitacao.solicitante.email, confirmacao.assunto, email.html, email.texto)
 
         return True
 
@@ -0,0 +1,285 @@
+"""
+Armazenamento de anexos endereçado pelo conteúdo (SHA-256)
+
+Os uploads são copiados em blocos para um arquivo temporário enquanto o
+SHA-256 é calculado; ao final o arquivo é movido (os.replace, atômico) para
+o caminho derivado do hash. Conteúdo idêntico é gravado uma única vez e a
+linha de AnexoArquivo guarda apenas hash, tamanho e tipo MIME.
+
+O backend é escolhido por ANEXOS_STORAGE_BACKEND ('local' por enquanto) e
+o diretório por ANEXOS_STORAGE_DIR, relativo à raiz da aplicação quando não
+for absoluto.
+
+Downloads usam o hash como ETag forte e respondem a GET condicional e Range.
+Com ANEXOS_X_ACCEL_REDIRECT (nginx) ou USE_X_SENDFILE (Apache/lighttpd) o
+servidor web envia o arquivo e o worker só monta os cabeçalhos; sem eles o
+arquivo é entregue pelo wsgi.file_wrapper do servidor (sendfile no gunicorn).
+
+Exibição no navegador (inline) só para JPEG, PNG, GIF e PDF, com o tipo
+deduzido da extensão e confirmado pelos primeiros bytes: o Content-Type do
+upload vem do navegador e não é confiável (um SVG com script enviado como
+"foto.png" seria executado na origem da aplicação). Respostas inline levam
+ainda Content-Security-Policy: sandbox e X-Content-Type-Options: nosniff.
+"""
+import hashlib
+import logging
+import mimetypes
+import os
+import re
+import tempfile
+import threading
+from typing import BinaryIO, Dict, Iterator, Optional, Tuple
+from urllib.parse import quote
+
+from flask import Response, current_app, request, send_file
+
+logger = logging.getLogger(__name__)
+
+TAMANHO_BLOCO = 64 * 1024
+DIRETORIO_PADRAO = os.path.join('uploads', 'anexos')
+_HASH_VALIDO = re.compile(r'^[0-9a-f]{64}$')
+# Conteúdo de um hash nunca muda; 'private' porque os downloads exigem login
+MAX_AGE_DOWNLOAD = 24 * 60 * 60
+# Tipos exibidos no navegador -> assinaturas (primeiros bytes) aceitas
+ASSINATURAS_INLINE = {
+    'image/jpeg': (b'\xff\xd8\xff',),
+    'image/png': (b'\x89PNG\r\n\x1a\n',),
+    'image/gif': (b'GIF87a', b'GIF89a'),
+    'application/pdf': (b'%PDF-',),
+}
+TAMANHO_ASSINATURA = 8
+
+
+def tipo_inline(nome_arquivo: str, inicio: bytes) -> Optional[str]:
+    """
+    Tipo MIME para exibir o anexo no navegador, ou None para forçar o download.
+
+    O tipo vem da extensão do nome e precisa conferir com os primeiros bytes do
+    conteúdo; o mime_type gravado no upload não é usado.
+    """
+    mime, _ = mimetypes.guess_type(nome_arquivo or '')
+    assinaturas = ASSINATURAS_INLINE.get(mime)
+    if assinaturas and inicio and inicio.startswith(assinaturas):
+        return mime
+    return None
+
+
+def _content_disposition(nome: str, inline: bool) -> str:
+    tipo = 'inline' if inline else 'attachment'
+    ascii_nome = nome.encode('ascii', 'ignore').decode('ascii').replace('"', '') or 'anexo'
+    return f"{tipo}; filename=\"{ascii_nome}\"; filename*=UTF-8''{quote(nome)}"
+
+
+def _cache_privado(resposta: Response, inline: bool = False) -> Response:
+    if inline:
+        # Mesmo um tipo permitido não pode executar script na origem da aplicação
+        resposta.headers['Content-Security-Policy'] = 'sandbox'
+        resposta.headers['X-Content-Type-Options'] = 'nosniff'
+    resposta.accept_ranges = 'bytes'
+    resposta.cache_control.no_cache = None
+    resposta.cache_control.public = False
+    resposta.cache_control.private = True
+    resposta.cache_control.max_age = MAX_AGE_DOWNLOAD
+    return resposta
+
+
+def enviar_bytes(conteudo: bytes, nome: str, mime_type: Optional[str], inline: bool = False) -> Response:
+    """Resposta para conteúdo já em memória (anexos antigos em arquivo_blob)"""
+    from io import BytesIO
+    return _cache_privado(send_file(
+        BytesIO(conteudo), mimetype=mime_type or 'application/octet-stream',
+        as_attachment=not inline, download_name=nome,
+        etag=hashlib.sha256(conteudo).hexdigest(), conditional=True
+    ), inline)
+
+
+class ArmazenamentoAnexos:
+    """Interface dos backends de armazenamento de anexos"""
+
+    tipo: str = ''
+
+    def salvar_stream(self, stream: BinaryIO) -> Tuple[str, int]:
+        """Grava o conteúdo lido em blocos e retorna (sha256, tamanho em bytes)"""
+        raise NotImplementedError
+
+    def abrir(self, sha256: str) -> BinaryIO:
+        raise NotImplementedError
+
+    def existe(self, sha256: str) -> bool:
+        raise NotImplementedError
+
+    def remover(self, sha256: str):
+        """Remove o conteúdo; quem chama garante que nenhum anexo ainda o referencia"""
+        raise NotImplementedError
+
+    def caminho_local(self, sha256: str) -> Optional[str]:
+        """Caminho em disco do conteúdo, quando o backend for um diretório local"""
+        return None
+
+    def listar(self) -> Iterator[Tuple[str, float]]:
+        """(sha256, data de gravação em epoch) de todo conteúdo armazenado"""
+        raise NotImplementedError
+
+    def listar_temporarios(self) -> Iterator[Tuple[str, float]]:
+        """(caminho, data em epoch) de uploads interrompidos antes de chegar ao hash"""
+        return iter(())
+
+    def ler_inicio(self, sha256: str, tamanho: int = TAMANHO_ASSINATURA) -> bytes:
+        """Primeiros bytes do conteúdo (para conferir o tipo antes de exibir inline)"""
+        with self.abrir(sha256) as arquivo:
+            return arquivo.read(tamanho)
+
+    def resposta_download(self, sha256: str, nome: str, mime_type: Optional[str], inline: bool = False) -> Response:
+        """Resposta HTTP com ETag forte (hash), GET condicional e Range"""
+        return _cache_privado(send_file(
+            self.abrir(sha256), mimetype=mime_type or 'application/octet-stream',
+            as_attachment=not inline, download_name=nome, etag=sha256, conditional=True
+        ), inline)
+
+
+class ArmazenamentoLocal(ArmazenamentoAnexos):
+    """Diretório local com layout <dir>/ab/cd/<sha256>"""
+
+    tipo = 'local'
+
+    def __init__(self, diretorio: str):
+        self.diretorio = os.path.abspath(diretorio)
+        self._temporarios = os.path.join(self.diretorio, 'tmp')
+
+    def _caminho(self, sha256: str) -> str:
+        if not sha256 or not _HASH_VALIDO.match(sha256):
+            raise ValueError(f"Hash de anexo inválido: {sha256!r}")
+        return os.path.join(self.diretorio, sha256[:2], sha256[2:4], sha256)
+
+    def salvar_stream(self, stream: BinaryIO) -> Tuple[str, int]:
+        os.makedirs(self._temporarios, exist_ok=True)
+        descritor, temporario = tempfile.mkstemp(dir=self._temporarios, prefix='upload-')
+        try:
+            resumo = hashlib.sha256()
+            tamanho = 0
+            with os.fdopen(descritor, 'wb') as destino:
+                while True:
+                    bloco = stream.read(TAMANHO_BLOCO)
+                    if not bloco:
+                        break
+                    resumo.update(bloco)
+                    destino.write(bloco)
+                    tamanho += len(bloco)
+                destino.flush()
+                os.fsync(destino.fileno())
+
+            sha256 = resumo.hexdigest()
+            final = self._caminho(sha256)
+            if os.path.exists(final):
+                # Conteúdo já armazenado por outro anexo; a data renovada protege o novo
+                # anexo da limpeza de órfãos até a transação dele terminar
+                os.remove(temporario)
+                os.utime(final)
+            else:
+                os.makedirs(os.path.dirname(final), exist_ok=True)
+                os.replace(temporario, final)
+            return sha256, tamanho
+        except Exception:
+            if os.path.exists(temporario):
+                os.remove(temporario)
+            raise
+
+    def abrir(self, sha256: str) -> BinaryIO:
+        return open(self._caminho(sha256), 'rb')
+
+    def existe(self, sha256: str) -> bool:
+        return os.path.isfile(self._caminho(sha256))
+
+    def remover(self, sha256: str):
+        caminho = self._caminho(sha256)
+        if os.path.exists(caminho):
+            os.remove(caminho)
+
+    def caminho_local(self, sha256: str) -> Optional[str]:
+        return self._caminho(sha256)
+
+    def listar(self) -> Iterator[Tuple[str, float]]:
+        for raiz, _, arquivos in os.walk(self.diretorio):
+            if raiz == self._temporarios:
+                continue
+            for nome in arquivos:
+                if _HASH_VALIDO.match(nome):
+                    yield nome, os.path.getmtime(os.path.join(raiz, nome))
+
+    def listar_temporarios(self) -> Iterator[Tuple[str, float]]:
+        if not os.path.isdir(self._temporarios):
+            return
+        for nome in os.listdir(self._temporarios):
+            caminho = os.path.join(self._temporarios, nome)
+            yield caminho, os.path.getmtime(caminho)
+
+    def resposta_download(self, sha256: str, nome: str, mime_type: Optional[str], inline: bool = False) -> Response:
+        caminho = self._caminho(sha256)
+        prefixo = current_app.config.get('ANEXOS_X_ACCEL_REDIRECT')
+        if not prefixo:
+            # Com caminho, send_file usa X-Sendfile (USE_X_SENDFILE) ou wsgi.file_wrapper
+            return _cache_privado(send_file(
+                caminho, mimetype=mime_type or 'application/octet-stream',
+                as_attachment=not inline, download_name=nome, etag=sha256, conditional=True
+            ), inline)
+
+        # nginx entrega o arquivo (inclusive Range) a partir de uma location interna
+        resposta = Response(mimetype=mime_type or 'application/octet-stream')
+        relativo = os.path.relpath(caminho, self.diretorio).replace(os.sep, '/')
+        resposta.headers['X-Accel-Redirect'] = f"{prefixo.rstrip('/')}/{relativo}"
+        resposta.headers['Content-Disposition'] = _content_disposition(nome, inline)
+        resposta.set_etag(sha256)
+        return _cache_privado(resposta.make_conditional(request), inline)
+
+
+BACKENDS = {
+    'local': ArmazenamentoLocal,
+}
+
+# (backend, diretório) -> instância
+_instancias: Dict[Tuple[str, str], ArmazenamentoAnexos] = {}
+_lock = threading.Lock()
+
+
+def obter_armazenamento(app=None) -> ArmazenamentoAnexos:
+    """Backend configurado na aplicação (current_app por padrão)"""
+    app = app or current_app
+    backend = app.config.get('ANEXOS_STORAGE_BACKEND', 'local')
+    diretorio = app.config.get('ANEXOS_STORAGE_DIR') or DIRETORIO_PADRAO
+    if not os.path.isabs(diretorio):
+        diretorio = os.path.join(app.root_path, diretorio)
+
+    chave = (backend, diretorio)
+    with _lock:
+        if chave not in _instancias:
+            if backend not in BACKENDS:
+                raise ValueError(f"Backend de anexos desconhecido: {backend}")
+            _instancias[chave] = BACKENDS[backend](diretorio)
+        return _instancias[chave]
+
+
+def detectar_mime(nome_arquivo: str, mime_informado: Optional[str] = None) -> str:
+    """MIME informado pelo navegador ou, na falta dele, deduzido pela extensão"""
+    if mime_informado and mime_informado != 'application/octet-stream':
+        return mime_informado
+    mime, _ = mimetypes.guess_type(nome_arquivo or '')
+    return mime or 'application/octet-stream'
+
+
+def salvar_upload(arquivo) -> Dict:
+    """
+    Grava um upload (werkzeug FileStorage) no armazenamento sem lê-lo inteiro em memória.
+
+    Retorna os campos de AnexoArquivo: sha256, armazenamento, tamanho_bytes e mime_type. Se a
+    transação do anexo for desfeita o conteúdo fica no armazenamento (um novo envio
+    do mesmo arquivo o reaproveita); conteúdo que nenhum anexo referencia é removido
+    por scripts/migrate_anexos.py --sweep-orphans.
+    """
+    armazenamento = obter_armazenamento()
+    sha256, tamanho = armazenamento.salvar_stream(arquivo.stream)
+    return {
+        'sha256': sha256,
+        'armazenamento': armazenamento.tipo,
+        'tamanho_bytes': tamanho,
+        'mime_type': detectar_mime(arquivo.filename, arquivo.mimetype),
+    }
@@ -0,0 +1,256 @@
+"""
+Calendário comercial compilado para cálculos de SLA
+
+Em vez de percorrer dia a dia, o calendário guarda os segundos úteis
+acumulados até o início de cada dia (feriados já descontados). Assim, horas
+úteis entre duas datas viram uma subtração e o prazo de SLA vira uma busca
+binária (bisect).
+"""
+from bisect import bisect_left, bisect_right
+from datetime import date, datetime, time, timedelta
+from itertools import accumulate
+from typing import Dict, Iterable, Optional, Tuple
+import threading
+
+import pytz
+
+# Timezone do Brasil
+BRAZIL_TZ = pytz.timezone('America/Sao_Paulo')
+
+# Margem (em dias) usada ao estender a tabela acumulada
+MARGEM_DIAS = 366
+
+
+def _segundos_do_dia(valor: time) -> float:
+    """Converte um objeto time em segundos desde a meia-noite"""
+    return valor.hour * 3600 + valor.minute * 60 + valor.second + valor.microsecond / 1_000_000
+
+
+def para_horario_local(dt: datetime) -> datetime:
+    """Converte um datetime para o horário local do Brasil sem tzinfo"""
+    if dt.tzinfo is None:
+        return dt
+    return dt.astimezone(BRAZIL_TZ).replace(tzinfo=None)
+
+
+class CalendarioComercial:
+    """
+    Calendário de horário comercial com segundos úteis acumulados por dia.
+
+    A tabela cobre um intervalo de dias (ordinais) e é estendida sob demanda;
+    cada extensão cria uma nova tabela e a troca de forma atômica, então
+    leituras concorrentes nunca veem um estado parcial.
+    """
+
+    def __init__(self, inicio: time, fim: time, dias_semana: Iterable[int],
+                 feriados: Iterable[date] = (), feriados_recorrentes: Iterable[Tuple[int, int]] = ()):
+        self.inicio_seg = _segundos_do_dia(inicio)
+        self.fim_seg = _segundos_do_dia(fim)
+        self.duracao = max(0.0, self.fim_seg - self.inicio_seg)
+        self.dias_semana = frozenset(int(d) for d in dias_semana)
+        # Feriados com data fixa (ordinais) e recorrentes, expandidos para todo ano como (mês, dia)
+        self.feriados = frozenset(d.toordinal() for d in feriados)
+        self.feriados_recorrentes = frozenset((int(m), int(d)) for m, d in feriados_recorrentes)
+        self._lock = threading.Lock()
+        # (ordinal do primeiro dia, acumulado) onde acumulado[i] = segundos úteis antes do dia base + i
+        self._tabela: Tuple[int, list] = (0, [0.0])
+        self._tem_expediente = self.duracao > 0 and bool(self.dias_semana)
+
+    @classmethod
+    def de_config(cls, config_horario: Dict, feriados: Iterable[date] = (),
+                  feriados_recorrentes: Iterable[Tuple[int, int]] = ()) -> 'CalendarioComercial':
+        """Cria o calendário a partir do dicionário de horário comercial"""
+        return cls(config_horario['inicio'], config_horario['fim'], config_horario['dias_semana'],
+                   feriados, feriados_recorrentes)
+
+    def eh_feriado(self, ordinal: int) -> bool:
+        """Verifica se o dia (ordinal) é feriado fixo ou recorrente"""
+        if ordinal in self.feriados:
+            return True
+        if self.feriados_recorrentes:
+            dia = date.fromordinal(ordinal)
+            return (dia.month, dia.day) in self.feriados_recorrentes
+        return False
+
+    def eh_dia_util(self, dia: date) -> bool:
+        """Verifica se o dia é útil (dia da semana configurado e não feriado)"""
+        return bool(self._segundos_uteis_dia(dia.toordinal()))
+
+    def _segundos_uteis_dia(self, ordinal: int) -> float:
+        # date.fromordinal(1) é segunda-feira, logo weekday = (ordinal - 1) % 7
+        if (ordinal - 1) % 7 not in self.dias_semana:
+            return 0.0
+        if self.eh_feriado(ordinal):
+            return 0.0
+        return self.duracao
+
+    def _garantir_intervalo(self, primeiro: int, ultimo: int) -> Tuple[int, list]:
+        """Garante que a tabela cubra os ordinais [primeiro, ultimo] e a retorna"""
+        base, acumulado = self._tabela
+        if len(acumulado) > 1 and base <= primeiro and ultimo < base + len(acumulado) - 1:
+            return base, acumulado
+
+        with self._lock:
+            base, acumulado = self._tabela
+            dias_atuais = len(acumulado) - 1
+            if dias_atuais and base <= primeiro and ultimo < base + dias_atuais:
+                return base, acumulado
+
+            if dias_atuais:
+                novo_base = min(base, primeiro - MARGEM_DIAS)
+                novo_fim = max(base + dias_atuais, ultimo + MARGEM_DIAS)
+            else:
+                novo_base = primeiro - MARGEM_DIAS
+                novo_fim = ultimo + MARGEM_DIAS
+
+            duracoes = [self._segundos_uteis_dia(o) for o in range(novo_base, novo_fim + 1)]
+            acumulado = [0.0] + list(accumulate(duracoes))
+            self._tabela = (novo_base, acumulado)
+            return self._tabela
+
+    def tabela(self, primeiro: int, ultimo: int) -> Tuple[int, list]:
+        """Retorna (ordinal base, segundos acumulados) cobrindo os ordinais informados"""
+        return self._garantir_intervalo(primeiro, ultimo)
+
+    def _parcial_no_dia(self, ordinal: int, segundos: float) -> float:
+        if not self._segundos_uteis_dia(ordinal):
+            return 0.0
+        return min(max(segundos - self.inicio_seg, 0.0), self.duracao)
+
+    def _posicao(self, dt: datetime, tabela: Tuple[int, list]) -> float:
+        """Segundos úteis acumulados desde o início da tabela até dt (horário local)"""
+        base, acumulado = tabela
+        ordinal = dt.toordinal()
+        segundos = dt.hour * 3600 + dt.minute * 60 + dt.second + dt.microsecond / 1_000_000
+        return acumulado[ordinal - base] + self._parcial_no_dia(ordinal, segundos)
+
+    def segundos_uteis(self, inicio: datetime, fim: datetime) -> float:
+        """Segundos úteis entre duas datas em horário local (sem tzinfo)"""
+        if inicio >= fim:
+            return 0.0
+        tabela = self._garantir_intervalo(inicio.toordinal(), fim.toordinal())
+        return self._posicao(fim, tabela) - self._posicao(inicio, tabela)
+
+    def horas_uteis(self, inicio: datetime, fim: datetime) -> float:
+        """Horas úteis (sem arredondamento) entre duas datas em horário local"""
+        return self.segundos_uteis(inicio, fim) / 3600
+
+    def _horas_no_dia(self, ordinal: int, inicio: datetime, fim: datetime) -> float:
+        if not self._segundos_uteis_dia(ordinal):
+            return 0.0
+        abertura = self._inicio_do_dia(ordinal)
+        fechamento = abertura + timedelta(seconds=self.duracao)
+        periodo_inicio = max(inicio, abertura)
+        periodo_fim = min(fim, fechamento)
+        if periodo_inicio < periodo_fim:
+            return (periodo_fim - periodo_inicio).total_seconds() / 3600
+        return 0.0
+
+    def _horas_uteis_por_dia(self, inicio: datetime, fim: datetime) -> float:
+        """Soma dia a dia (mesma ordem de operações de ponto flutuante do cálculo original)"""
+        primeiro, ultimo = inicio.toordinal(), fim.toordinal()
+        horas = self._horas_no_dia(primeiro, inicio, fim)
+        if primeiro == ultimo:
+            return horas
+
+        # Dias completos entre o primeiro e o último contribuem sempre com a mesma parcela
+        base, acumulado = self._garantir_intervalo(primeiro, ultimo)
+        completos = round((acumulado[ultimo - base] - acumulado[primeiro + 1 - base]) / self.duracao) if self.duracao else 0
+        parcela = timedelta(seconds=self.duracao).total_seconds() / 3600
+        for _ in range(completos):
+            horas += parcela
+        return horas + self._horas_no_dia(ultimo, inicio, fim)
+
+    def horas_uteis_arredondadas(self, inicio: datetime, fim: datetime, casas: int = 2) -> float:
+        """Horas úteis arredondadas, idênticas ao somatório dia a dia"""
+        horas = self.horas_uteis(inicio, fim)
+        escala = 10 ** casas
+        if abs((horas * escala) % 1 - 0.5) < 1e-6:
+            # Empate no arredondamento: o resultado depende da ordem das somas,
+            # então refazemos a soma dia a dia para manter o mesmo valor
+            horas = self._horas_uteis_por_dia(inicio, fim)
+        return round(horas, casas)
+
+    def eh_horario_comercial(self, dt: datetime) -> bool:
+        """Verifica se um datetime local está dentro do horário comercial"""
+        if not self.eh_dia_util(dt.date()):
+            return False
+        segundos = dt.hour * 3600 + dt.minute * 60 + dt.second + dt.microsecond / 1_000_000
+        return self.inicio_seg <= segundos <= self.fim_seg
+
+    def _inicio_do_dia(self, ordinal: int) -> datetime:
+        return datetime.combine(date.fromordinal(ordinal), time()) + timedelta(seconds=self.inicio_seg)
+
+    def proximo_horario_comercial(self, dt: datetime) -> datetime:
+        """Retorna dt se estiver em horário comercial, senão a próxima abertura"""
+        if self.eh_horario_comercial(dt) or not self._tem_expediente:
+            return dt
+
+        ordinal = dt.toordinal()
+        segundos = dt.hour * 3600 + dt.minute * 60 + dt.second + dt.microsecond / 1_000_000
+        if self._segundos_uteis_dia(ordinal) and segundos < self.inicio_seg:
+            return self._inicio_do_dia(ordinal)
+
+        # Primeiro dia a partir de amanhã com segundos úteis
+        base, acumulado = self._garantir_intervalo(ordinal, ordinal + 14)
+        while True:
+            valor_amanha = acumulado[ordinal + 1 - base]
+            indice = bisect_right(acumulado, valor_amanha)
+            if indice < len(acumulado):
+                return self._inicio_do_dia(base + indice - 1)
+            base, acumulado = self._garantir_intervalo(ordinal, base + len(acumulado) + MARGEM_DIAS)
+
+    def somar_horas_uteis(self, inicio: datetime, horas: float) -> datetime:
+        """
+        Retorna o instante em que se completam `horas` úteis a partir de inicio.
+
+        É o inverso exato de horas_uteis: horas_uteis(inicio, resultado) == horas.
+        """
+        if horas <= 0 or not self._tem_expediente:
+            return self.proximo_horario_comercial(inicio)
+
+        ordinal = inicio.toordinal()
+        tabela = self._garantir_intervalo(ordinal, ordinal + 14)
+        alvo = self._posicao(inicio, tabela) + horas * 3600
+
+        base, acumulado = tabela
+        while acumulado[-1] < alvo:
+            base, acumulado = self._garantir_intervalo(ordinal, base + 2 * (len(acumulado) - 1))
+
+        # Primeiro dia cujo acumulado ao final alcança o alvo
+        indice = bisect_left(acumulado, alvo) - 1
+        restante = alvo - acumulado[indice]
+        return self._inicio_do_dia(base + indice) + timedelta(seconds=restante)
+
+
+# Calendários compilados por configuração de horário
+_calendarios: Dict[tuple, CalendarioComercial] = {}
+_calendarios_lock = threading.Lock()
+
+
+def obter_calendario(config_horario: Dict, feriados: Optional[Iterable[date]] = None,
+                     feriados_recorrentes: Optional[Iterable[Tuple[int, int]]] = None) -> CalendarioComercial:
+    """Retorna (e guarda em memória) o calendário compilado para a configuração"""
+    feriados = tuple(sorted(set(feriados or ())))
+    feriados_recorrentes = tuple(sorted(set(feriados_recorrentes or ())))
+    chave = (
+        config_horario['inicio'],
+        config_horario['fim'],
+        tuple(sorted(config_horario['dias_semana'])),
+        feriados,
+        feriados_recorrentes,
+    )
+    calendario = _calendarios.get(chave)
+    if calendario is None:
+        with _calendarios_lock:
+            calendario = _calendarios.get(chave)
+            if calendario is None:
+                calendario = CalendarioComercial.de_config(config_horario, feriados, feriados_recorrentes)
+                _calendarios[chave] = calendario
+    return calendario
+
+
+def limpar_calendarios():
+    """Descarta os calendários compilados (serão recriados sob demanda)"""
+    with _calendarios_lock:
+        _calendarios.clear()
@@ -0,0 +1,115 @@
+"""
+Cliente HTTP compartilhado para o Microsoft Graph e o login da Microsoft
+
+Cada requests.post avulso abria uma conexão TCP+TLS nova. Aqui uma única
+requests.Session (segura para uso entre threads) mantém um pool de conexões
+keep-alive por host, com no máximo CONEXOES_POR_HOST conexões: quando todas
+estão em uso a requisição espera uma ser devolvida, em vez de abrir conexões
+extras que seriam descartadas. Toda requisição recebe TIMEOUT_PADRAO se o
+chamador não informar outro.
+
+metricas() mostra, por host, quantas requisições foram feitas e quantas
+conexões precisaram ser abertas; a diferença é o reaproveitamento.
+"""
+import logging
+import threading
+import time
+from typing import Dict
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+TIMEOUT_PADRAO = (5, 30)  # (conexão, leitura) em segundos
+CONEXOES_POR_HOST = 10
+HOSTS_EM_CACHE = 10  # pools de host mantidos abertos (Graph, login e eventuais outros)
+PORTAS_PADRAO = {'https': 443, 'http': 80}
+
+
+def _nome_host(esquema: str, host: str, porta) -> str:
+    if porta is None or porta == PORTAS_PADRAO.get(esquema):
+        return host
+    return f"{host}:{porta}"
+
+
+class ClienteHTTP:
+    """requests.Session com pool de conexões por host, timeout padrão e métricas"""
+
+    def __init__(self, conexoes_por_host: int = CONEXOES_POR_HOST, timeout=TIMEOUT_PADRAO):
+        self.conexoes_por_host = conexoes_por_host
+        self.timeout = timeout
+        self._adaptador = HTTPAdapter(
+            pool_connections=HOSTS_EM_CACHE,
+            pool_maxsize=conexoes_por_host,
+            pool_block=True,
+            max_retries=0  # novas tentativas ficam com quem chama (outbox, disparador)
+        )
+        self._sessao = requests.Session()
+        self._sessao.mount('https://', self._adaptador)
+        self._sessao.mount('http://', self._adaptador)
+        self._lock = threading.Lock()
+        self._contadores: Dict[str, Dict] = {}
+
+    def request(self, metodo: str, url: str, **kwargs) -> requests.Response:
+        kwargs.setdefault('timeout', self.timeout)
+        partes = urlsplit(url)
+        host = _nome_host(partes.scheme, partes.hostname, partes.port)
+        inicio = time.monotonic()
+        try:
+            resposta = self._sessao.request(metodo, url, **kwargs)
+        except requests.RequestException:
+            self._registrar(host, time.monotonic() - inicio, erro=True)
+            raise
+        self._registrar(host, time.monotonic() - inicio)
+        return resposta
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request('POST', url, **kwargs)
+
+    def _registrar(self, host: str, duracao: float, erro: bool = False):
+        with self._lock:
+            contador = self._contadores.setdefault(host, {'requisicoes': 0, 'erros': 0, 'tempo_total': 0.0})
+            contador['requisicoes'] += 1
+            contador['tempo_total'] += duracao
+            if erro:
+                contador['erros'] += 1
+
+    def _conexoes_abertas(self) -> Dict[str, int]:
+        """Conexões já criadas por host, segundo os pools do urllib3"""
+        pools = self._adaptador.poolmanager.pools
+        conexoes = {}
+        for chave in list(pools.keys()):
+            pool = pools.get(chave)
+            if pool is not None:
+                host = _nome_host(chave.key_scheme, chave.key_host, chave.key_port)
+                conexoes[host] = conexoes.get(host, 0) + pool.num_connections
+        return conexoes
+
+    def metricas(self) -> Dict[str, Dict]:
+        """Requisições, conexões abertas e taxa de reaproveitamento por host"""
+        conexoes = self._conexoes_abertas()
+        with self._lock:
+            contadores = {host: dict(valores) for host, valores in self._contadores.items()}
+        resultado = {}
+        for host, valores in contadores.items():
+            requisicoes = valores['requisicoes']
+            abertas = min(conexoes.get(host, 0), requisicoes)
+            resultado[host] = {
+                'requisicoes': requisicoes,
+                'erros': valores['erros'],
+                'conexoes_abertas': abertas,
+                'conexoes_reaproveitadas': requisicoes - abertas,
+                'taxa_reaproveitamento': round((requisicoes - abertas) / requisicoes * 100, 1) if requisicoes else 0.0,
+                'tempo_medio_ms': round(valores['tempo_total'] / requisicoes * 1000, 1) if requisicoes else 0.0,
+                'limite_conexoes': self.conexoes_por_host,
+            }
+        return resultado
+
+
+# Instância global usada por todas as chamadas ao Graph e ao login da Microsoft
+cliente_graph = ClienteHTTP()
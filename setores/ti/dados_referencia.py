@@ -0,0 +1,190 @@
+"""
+Cache em memória dos dados de referência do formulário de chamados
+
+Unidades, problemas reportados e itens de internet mudam poucas vezes por
+ano, mas eram consultados a cada abertura do formulário e novamente na
+validação do envio. Cada tabela fica em memória como tuplas imutáveis com um
+carimbo de versão guardado na tabela 'sequencias' (linha 'versao_<tabela>').
+
+Qualquer insert/update/delete nos modelos incrementa a versão na mesma
+transação da alteração e descarta o cache local após o commit. Os demais
+workers comparam os carimbos no máximo a cada INTERVALO_VERIFICACAO segundos
+(uma consulta para as três tabelas); entre verificações, renderizar o
+formulário e validar o envio não acessam o banco.
+"""
+import logging
+import threading
+import time
+from collections import namedtuple
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import event, insert, select, update
+from sqlalchemy.orm import Session, object_session
+
+from database import db, Unidade, ProblemaReportado, ItemInternet, Sequencia
+
+logger = logging.getLogger(__name__)
+
+INTERVALO_VERIFICACAO = 30  # segundos entre comparações de versão com o banco
+PREFIXO_VERSAO = 'versao_'
+
+UnidadeRef = namedtuple('UnidadeRef', 'id nome')
+ProblemaRef = namedtuple('ProblemaRef', 'id nome prioridade_padrao requer_item_internet ativo')
+ItemInternetRef = namedtuple('ItemInternetRef', 'id nome ativo')
+
+TABELAS_REFERENCIA = {
+    Unidade: 'unidade',
+    ProblemaReportado: 'problema_reportado',
+    ItemInternet: 'item_internet',
+}
+
+# tabela -> (versão, registros ordenados por nome, registros por id)
+_cache: Dict[str, Tuple[int, tuple, Dict[int, tuple]]] = {}
+_verificado_em = 0.0
+_lock = threading.RLock()
+
+
+def _nome_versao(tabela: str) -> str:
+    return f"{PREFIXO_VERSAO}{tabela}"
+
+
+def _ler_versoes() -> Dict[str, int]:
+    tabela = Sequencia.__table__
+    nomes = [_nome_versao(t) for t in TABELAS_REFERENCIA.values()]
+    with db.session.no_autoflush:
+        linhas = db.session.execute(
+            select(tabela.c.nome, tabela.c.valor).where(tabela.c.nome.in_(nomes))
+        ).all()
+    versoes = {nome[len(PREFIXO_VERSAO):]: int(valor) for nome, valor in linhas}
+    return {t: versoes.get(t, 0) for t in TABELAS_REFERENCIA.values()}
+
+
+def _carregar_registros(tabela: str) -> tuple:
+    with db.session.no_autoflush:
+        if tabela == 'unidade':
+            linhas = db.session.query(Unidade.id, Unidade.nome).order_by(Unidade.nome).all()
+            return tuple(UnidadeRef(*linha) for linha in linhas)
+
+        if tabela == 'problema_reportado':
+            linhas = db.session.query(
+                ProblemaReportado.id, ProblemaReportado.nome, ProblemaReportado.prioridade_padrao,
+                ProblemaReportado.requer_item_internet, ProblemaReportado.ativo
+            ).order_by(ProblemaReportado.nome).all()
+            return tuple(ProblemaRef(*linha) for linha in linhas)
+
+        try:
+            linhas = db.session.query(ItemInternet.id, ItemInternet.nome, ItemInternet.ativo).order_by(ItemInternet.nome).all()
+        except Exception:
+            # Bancos antigos podem não ter a coluna 'ativo'
+            db.session.rollback()
+            linhas = [(i, n, True) for i, n in db.session.query(ItemInternet.id, ItemInternet.nome).order_by(ItemInternet.nome).all()]
+        return tuple(ItemInternetRef(*linha) for linha in linhas)
+
+
+def _registros(tabela: str) -> Tuple[tuple, Dict[int, tuple]]:
+    """Registros da tabela, recarregados apenas quando a versão mudou"""
+    global _verificado_em
+    with _lock:
+        agora = time.monotonic()
+        if agora - _verificado_em >= INTERVALO_VERIFICACAO:
+            try:
+                versoes = _ler_versoes()
+                for nome, (versao, _, _) in list(_cache.items()):
+                    if versoes.get(nome) != versao:
+                        _cache.pop(nome, None)
+                        logger.info(f"Dados de referência '{nome}' alterados em outro processo, recarregando")
+                _verificado_em = agora
+            except Exception as e:
+                logger.error(f"Erro ao verificar versão dos dados de referência: {str(e)}")
+
+        if tabela not in _cache:
+            # Versão lida antes dos dados: uma alteração concorrente força nova leitura na próxima verificação
+            versao = _ler_versoes()[tabela]
+            registros = _carregar_registros(tabela)
+            _cache[tabela] = (versao, registros, {r.id: r for r in registros})
+        _, registros, por_id = _cache[tabela]
+        return registros, por_id
+
+
+def _para_inteiro(valor) -> Optional[int]:
+    try:
+        return int(valor)
+    except (TypeError, ValueError):
+        return None
+
+
+def listar_unidades() -> tuple:
+    """Unidades ordenadas por nome"""
+    return _registros('unidade')[0]
+
+
+def listar_problemas_ativos() -> tuple:
+    """Problemas ativos ordenados por nome"""
+    return tuple(p for p in _registros('problema_reportado')[0] if p.ativo)
+
+
+def listar_itens_internet_ativos() -> tuple:
+    """Itens de internet ativos ordenados por nome"""
+    return tuple(i for i in _registros('item_internet')[0] if i.ativo)
+
+
+def obter_unidade(unidade_id) -> Optional[UnidadeRef]:
+    return _registros('unidade')[1].get(_para_inteiro(unidade_id))
+
+
+def obter_problema(problema_id) -> Optional[ProblemaRef]:
+    return _registros('problema_reportado')[1].get(_para_inteiro(problema_id))
+
+
+def obter_item_internet(item_id) -> Optional[ItemInternetRef]:
+    return _registros('item_internet')[1].get(_para_inteiro(item_id))
+
+
+def invalidar_dados_referencia(*tabelas: str):
+    """Descarta o cache das tabelas informadas (todas, se nenhuma for informada)"""
+    with _lock:
+        for tabela in tabelas or tuple(TABELAS_REFERENCIA.values()):
+            _cache.pop(tabela, None)
+
+
+def _marcar_referencia_alterada(mapper, connection, target):
+    sessao = object_session(target)
+    if sessao is not None:
+        sessao.info.setdefault('referencia_alterada', set()).add(TABELAS_REFERENCIA[mapper.class_])
+
+
+for _modelo in TABELAS_REFERENCIA:
+    for _evento in ('after_insert', 'after_update', 'after_delete'):
+        event.listen(_modelo, _evento, _marcar_referencia_alterada)
+
+
+@event.listens_for(Session, 'after_flush')
+def _incrementar_versoes(session, flush_context):
+    """Incrementa a versão na transação da alteração: outros workers só a veem após o commit"""
+    pendentes = session.info.get('referencia_alterada', set()) - session.info.get('referencia_versionada', set())
+    if not pendentes:
+        return
+    tabela = Sequencia.__table__
+    conexao = session.connection()
+    for nome in sorted(pendentes):
+        resultado = conexao.execute(
+            update(tabela).where(tabela.c.nome == _nome_versao(nome)).values(valor=tabela.c.valor + 1)
+        )
+        if resultado.rowcount == 0:
+            conexao.execute(insert(tabela).values(nome=_nome_versao(nome), valor=1))
+    # Uma versão por transação basta, mesmo com vários flushes
+    session.info.setdefault('referencia_versionada', set()).update(pendentes)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidar_referencia_apos_commit(session):
+    session.info.pop('referencia_versionada', None)
+    alteradas = session.info.pop('referencia_alterada', None)
+    if alteradas:
+        invalidar_dados_referencia(*alteradas)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _descartar_marcacao_referencia(session):
+    session.info.pop('referencia_alterada', None)
+    session.info.pop('referencia_versionada', None)
@@ -10,7 +10,8 @@ sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '
 
 from app import app
 from database import db, Chamado, HistoricoSLA
-from setores.ti.sla_utils import calcular_sla_chamado_correto, carregar_configuracoes_sla, carregar_configuracoes_horario_comercial
+from setores.ti.sla_utils import carregar_configuracoes_sla, carregar_configuracoes_horario_comercial
+from setores.ti.sla_lote import buscar_colunas_sla, calcular_sla_linhas, sla_info_do_lote
 
 def debug_sla_violations():
     """Analisa violações de SLA em detalhes"""
@@ -28,9 +29,13 @@ def debug_sla_violations():
             print()
             
             # Buscar chamados concluídos/cancelados
-            chamados_finalizados = Chamado.query.filter(
-                Chamado.status.in_(['Concluido', 'Cancelado'])
-            ).order_by(Chamado.data_abertura.desc()).limit(20).all()
+            chamados_finalizados = buscar_colunas_sla(
+                Chamado.status.in_(['Concluido', 'Cancelado']),
+                extras=(Chamado.codigo,),
+                ordenacao=(Chamado.data_abertura.desc(),),
+                limite=20
+            )
+            sla = calcular_sla_linhas(chamados_finalizados, config_sla, config_horario)
             
             print(f"📊 Analisando {len(chamados_finalizados)} chamados finalizados...")
             print()
@@ -39,24 +44,25 @@ def debug_sla_violations():
             cumprimentos_encontrados = 0
             sem_data_conclusao = 0
             
-            for chamado in chamados_finalizados:
-                sla_info = calcular_sla_chamado_correto(chamado, config_sla, config_horario)
+            for i, chamado in enumerate(chamados_finalizados):
+                data_abertura, _, data_conclusao, status, prioridade, codigo = chamado
+                sla_info = sla_info_do_lote(sla, i)
                 
                 # Verificar se tem data de conclusão
-                if not chamado.data_conclusao:
+                if not data_conclusao:
                     sem_data_conclusao += 1
-                    print(f"❌ Chamado {chamado.codigo}: SEM DATA DE CONCLUSÃO")
-                    print(f"   Status: {chamado.status}, Prioridade: {chamado.prioridade}")
-                    print(f"   Data abertura: {chamado.data_abertura}")
+                    print(f"❌ Chamado {codigo}: SEM DATA DE CONCLUSÃO")
+                    print(f"   Status: {status}, Prioridade: {prioridade}")
+                    print(f"   Data abertura: {data_abertura}")
                     print()
                     continue
                 
                 if sla_info['sla_status'] == 'Violado':
                     violacoes_encontradas += 1
-                    print(f"🚨 VIOLAÇÃO: Chamado {chamado.codigo}")
-                    print(f"   Status: {chamado.status}, Prioridade: {chamado.prioridade}")
-                    print(f"   Data abertura: {chamado.data_abertura}")
-                    print(f"   Data conclusão: {chamado.data_conclusao}")
+                    print(f"🚨 VIOLAÇÃO: Chamado {codigo}")
+                    print(f"   Status: {status}, Prioridade: {prioridade}")
+                    print(f"   Data abertura: {data_abertura}")
+                    print(f"   Data conclusão: {data_conclusao}")
                     print(f"   Tempo resolução (úteis): {sla_info['horas_uteis_decorridas']:.2f}h")
                     print(f"   Limite SLA: {sla_info['sla_limite']}h")
                     print(f"   Status SLA: {sla_info['sla_status']}")
@@ -0,0 +1,104 @@
+"""
+Pré-visualização e miniatura de anexos de imagem
+
+Fotos de celular chegam com 5–10 MB e eram abertas em resolução total só para
+serem vistas na timeline. No upload, anexos .jpg/.png/.gif recebem um evento
+'anexo_derivados' no outbox (mesma transação do anexo); o processador do
+outbox gera em segundo plano uma prévia para a web (até TAMANHO_PREVIEW px)
+e uma miniatura (até TAMANHO_MINIATURA px) em JPEG, gravadas no armazenamento
+de anexos como qualquer outro conteúdo. O original continua disponível.
+"""
+import logging
+from io import BytesIO
+from typing import Optional, Tuple
+
+from database import db, AnexoArquivo
+from setores.ti.armazenamento_anexos import obter_armazenamento
+from setores.ti.outbox import enfileirar, tratador_outbox
+
+logger = logging.getLogger(__name__)
+
+EXTENSOES_IMAGEM = ('.jpg', '.jpeg', '.png', '.gif')
+TAMANHO_PREVIEW = (1280, 1280)
+QUALIDADE_PREVIEW = 80
+TAMANHO_MINIATURA = (320, 320)
+QUALIDADE_MINIATURA = 75
+# Imagens maiores são recusadas antes de decodificar (proteção contra "decompression bomb").
+# Conferido pelo tamanho do cabeçalho: Image.MAX_IMAGE_PIXELS é global do processo e
+# o Pillow só recusa acima do dobro dele (entre 1x e 2x apenas emite um aviso).
+MAXIMO_PIXELS = 50_000_000
+
+
+def eh_imagem(nome_arquivo: str, mime_type: Optional[str] = None) -> bool:
+    return (nome_arquivo or '').lower().endswith(EXTENSOES_IMAGEM) or (
+        bool(mime_type) and mime_type in ('image/jpeg', 'image/png', 'image/gif')
+    )
+
+
+def agendar_derivados(anexo: AnexoArquivo):
+    """Enfileira a geração das derivadas de um anexo de imagem já com id (após flush)"""
+    if anexo.sha256 and eh_imagem(anexo.nome_original, anexo.mime_type):
+        enfileirar('anexo_derivados', {'anexo_id': anexo.id})
+
+
+def _gerar_jpeg(imagem, tamanho: Tuple[int, int], qualidade: int) -> BytesIO:
+    from PIL import Image
+
+    copia = imagem.copy()
+    copia.thumbnail(tamanho, Image.LANCZOS)
+    saida = BytesIO()
+    copia.save(saida, format='JPEG', quality=qualidade, optimize=True, progressive=True)
+    saida.seek(0)
+    return saida
+
+
+def gerar_derivados(anexo: AnexoArquivo) -> bool:
+    """Gera prévia e miniatura do anexo; False se não for possível (formato/biblioteca)"""
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:
+        logger.warning("Pillow não instalado; prévias de imagem desabilitadas")
+        return False
+
+    armazenamento = obter_armazenamento()
+    try:
+        with armazenamento.abrir(anexo.sha256) as original:
+            imagem = Image.open(original)  # lê só o cabeçalho
+            largura, altura = imagem.size
+            if largura * altura > MAXIMO_PIXELS:
+                raise ValueError(f"Imagem de {largura}x{altura} px excede o limite de {MAXIMO_PIXELS} px")
+            # JPEG: decodifica já reduzido quando possível (bem mais rápido e leve)
+            imagem.draft('RGB', TAMANHO_PREVIEW)
+            imagem = ImageOps.exif_transpose(imagem)  # GIF animado: apenas o primeiro quadro
+            if imagem.mode in ('RGBA', 'LA') or (imagem.mode == 'P' and 'transparency' in imagem.info):
+                # JPEG não tem transparência: compõe sobre fundo branco
+                rgba = imagem.convert('RGBA')
+                imagem = Image.new('RGB', rgba.size, (255, 255, 255))
+                imagem.paste(rgba, mask=rgba.split()[-1])
+            else:
+                imagem = imagem.convert('RGB')
+
+            preview, _ = armazenamento.salvar_stream(_gerar_jpeg(imagem, TAMANHO_PREVIEW, QUALIDADE_PREVIEW))
+            miniatura, _ = armazenamento.salvar_stream(_gerar_jpeg(imagem, TAMANHO_MINIATURA, QUALIDADE_MINIATURA))
+    except Image.DecompressionBombError as e:
+        raise ValueError(str(e)) from e
+
+    anexo.sha256_preview = preview
+    anexo.sha256_miniatura = miniatura
+    return True
+
+
+@tratador_outbox('anexo_derivados')
+def _processar_derivados(payload):
+    anexo = db.session.get(AnexoArquivo, payload['anexo_id'])
+    if anexo is None or not anexo.sha256 or anexo.sha256_miniatura:
+        return
+    try:
+        gerado = gerar_derivados(anexo)
+    except (OSError, ValueError) as e:
+        # Arquivo corrompido ou formato não suportado: não adianta tentar de novo
+        logger.warning(f"Não foi possível gerar prévia do anexo {anexo.id}: {str(e)}")
+        return
+    if gerado:
+        db.session.commit()
+        logger.info(f"Prévia e miniatura geradas para o anexo {anexo.id}")
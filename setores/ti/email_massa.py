@@ -0,0 +1,387 @@
+"""
+Envio de email em massa para grupos via Microsoft Graph ($batch)
+
+A rota só grava o EmailMassa ('preparando') e os destinatários ('pendente')
+e devolve o id; este disparador reserva o envio em segundo plano, monta os
+emails personalizados e os envia em requisições $batch de até TAMANHO_LOTE
+mensagens, com LOTES_PARALELOS requisições simultâneas. Depois de cada grupo
+de lotes os destinatários e os contadores enviados_count/falhas_count são
+gravados e o progresso é emitido via Socket.IO ('email_massa_progresso').
+
+Mensagens recusadas com 429/5xx continuam 'pendente' e são reenviadas na
+rodada seguinte (respeitando o Retry-After); após MAXIMO_RODADAS ficam como
+'falha'. Um envio interrompido (reinício do servidor) é retomado pelo
+heartbeat, a partir dos destinatários ainda pendentes.
+
+Cada reserva grava um token_envio novo e toda gravação do envio exige esse
+token: um worker que travou e perdeu o envio para outro para no próximo
+lote. Destinatários só saem de 'pendente' uma vez, e os contadores somam
+apenas as linhas realmente alteradas.
+"""
+import logging
+import threading
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import requests
+from sqlalchemy import and_, case, or_, update
+
+from database import db, EmailMassa, EmailMassaDestinatario, get_brazil_time
+from setores.ti.cliente_http import cliente_graph
+from setores.ti.fila_email import URL_GRAPH, ler_retry_after, montar_mensagem
+from setores.ti.graph_token import provedor_token_graph
+from setores.ti.templates_email import renderizar_email
+
+logger = logging.getLogger(__name__)
+
+TAMANHO_LOTE = 20  # máximo de requisições por $batch no Graph
+LOTES_PARALELOS = 3
+MAXIMO_RODADAS = 5
+ESPERA_BASE = 15  # segundos entre rodadas; dobra a cada rodada
+MAXIMO_ESPERA = 60  # teto de qualquer espera (menor que TEMPO_HEARTBEAT)
+TIMEOUT_LOTE = (5, 60)  # (conexão, leitura) em segundos
+# Envio 'enviando' sem heartbeat por esse tempo é considerado interrompido e retomado
+TEMPO_HEARTBEAT = timedelta(minutes=2)
+INTERVALO_VERIFICACAO = 60  # segundos entre buscas por envios de outros workers
+STATUS_REPETIR = (401, 408, 429, 500, 502, 503, 504)
+
+
+def _agora_local() -> datetime:
+    return get_brazil_time().replace(tzinfo=None)
+
+
+def enviar_lote_graph(token: str, remetente: str, assunto: str,
+                      itens: List[Tuple[int, str, str]]) -> Tuple[Dict[int, Tuple[str, Optional[str]]], Optional[int]]:
+    """
+    Envia até TAMANHO_LOTE emails (id, endereço, html) num único $batch.
+
+    Retorna {id: (situação, erro)} com situação 'enviado', 'falha' ou 'repetir'
+    e o maior Retry-After recebido. Não acessa o banco (roda no pool de threads).
+    """
+    corpo = {'requests': [
+        {
+            'id': str(dest_id),
+            'method': 'POST',
+            'url': f'/users/{remetente}/sendMail',
+            'headers': {'Content-Type': 'application/json'},
+            'body': montar_mensagem([endereco], assunto, html, 'HTML')
+        }
+        for dest_id, endereco, html in itens
+    ]}
+    try:
+        resposta = cliente_graph.post(
+            f"{URL_GRAPH}/$batch",
+            headers={'Authorization': f'Bearer {token}', 'Content-Type': 'application/json'},
+            json=corpo,
+            timeout=TIMEOUT_LOTE
+        )
+    except requests.RequestException as e:
+        return {dest_id: ('repetir', f"Erro na requisição ao Microsoft Graph: {str(e)}") for dest_id, _, _ in itens}, None
+
+    if resposta.status_code != 200:
+        if resposta.status_code == 401:
+            provedor_token_graph.invalidar(token)
+        situacao = 'repetir' if resposta.status_code in STATUS_REPETIR else 'falha'
+        erro = f"$batch respondeu {resposta.status_code}: {resposta.text[:300]}"
+        return ({dest_id: (situacao, erro) for dest_id, _, _ in itens},
+                ler_retry_after(resposta.headers.get('Retry-After')))
+
+    resultados = {}
+    espera = None
+    for sub in resposta.json().get('responses', []):
+        dest_id = int(sub['id'])
+        status = sub.get('status')
+        if status == 202:
+            resultados[dest_id] = ('enviado', None)
+            continue
+        retry_after = ler_retry_after((sub.get('headers') or {}).get('Retry-After'))
+        if retry_after is not None:
+            espera = max(espera or 0, retry_after)
+        if status == 401:
+            provedor_token_graph.invalidar(token)
+        situacao = 'repetir' if status in STATUS_REPETIR else 'falha'
+        resultados[dest_id] = (situacao, f"Microsoft Graph respondeu {status}: {str(sub.get('body'))[:300]}")
+    for dest_id, _, _ in itens:
+        resultados.setdefault(dest_id, ('repetir', 'Sem resposta no $batch'))
+    return resultados, espera
+
+
+class DisparadorEmailMassa:
+    """Executa em segundo plano os envios de email em massa gravados no banco"""
+
+    def __init__(self, tamanho_lote: int = TAMANHO_LOTE, lotes_paralelos: int = LOTES_PARALELOS):
+        self.tamanho_lote = tamanho_lote
+        self.lotes_paralelos = lotes_paralelos
+        self._cond = threading.Condition()
+        self._acordar = False
+        self._thread: Optional[threading.Thread] = None
+        self._app = None
+
+    @property
+    def ativo(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def iniciar(self, app):
+        """Inicia a thread que executa (e retoma) envios pendentes"""
+        if self.ativo:
+            return
+        self._app = app
+        self._thread = threading.Thread(target=self._executar, name='email-massa', daemon=True)
+        self._thread.start()
+        logger.info("Disparador de email em massa iniciado")
+
+    def acordar(self):
+        """Chamado depois do commit de um novo EmailMassa"""
+        with self._cond:
+            self._acordar = True
+            self._cond.notify()
+
+    def _executar(self):
+        while True:
+            with self._cond:
+                self._acordar = False
+            try:
+                with self._app.app_context():
+                    reserva = self._reservar_proximo()
+                    if reserva:
+                        self._processar(*reserva)
+                        continue
+            except Exception as e:
+                logger.error(f"Erro no disparador de email em massa: {str(e)}")
+            with self._cond:
+                if not self._acordar:
+                    self._cond.wait(INTERVALO_VERIFICACAO)
+
+    def _reservar_proximo(self) -> Optional[Tuple[int, str]]:
+        """Reserva um envio novo (ou interrompido) com UPDATE condicional entre workers; retorna (id, token)"""
+        agora = _agora_local()
+        candidatos = db.session.query(EmailMassa.id).filter(
+            EmailMassa.status.in_(['preparando', 'enviando'])
+        ).order_by(EmailMassa.id).all()
+
+        for (email_massa_id,) in candidatos:
+            token = uuid.uuid4().hex
+            resultado = db.session.execute(
+                update(EmailMassa)
+                .where(EmailMassa.id == email_massa_id)
+                .where(or_(
+                    EmailMassa.status == 'preparando',
+                    and_(
+                        EmailMassa.status == 'enviando',
+                        or_(EmailMassa.data_heartbeat.is_(None),
+                            EmailMassa.data_heartbeat < agora - TEMPO_HEARTBEAT)
+                    )
+                ))
+                .values(status='enviando', data_heartbeat=agora, token_envio=token,
+                        data_envio=db.func.coalesce(EmailMassa.data_envio, agora))
+                .execution_options(synchronize_session=False)
+            )
+            db.session.commit()
+            if resultado.rowcount == 1:
+                return email_massa_id, token
+        return None
+
+    def _processar(self, email_massa_id: int, token_envio: str):
+        from setores.ti.email_service import email_service
+
+        email_massa = db.session.get(EmailMassa, email_massa_id)
+        contexto = {
+            'assunto': email_massa.assunto,
+            'mensagem': email_massa.conteudo,
+            'nome_grupo': email_massa.grupo.nome if email_massa.grupo else '',
+            'remetente': f"{email_massa.criador.nome} {email_massa.criador.sobrenome}",
+            'data_envio': (email_massa.data_envio or email_massa.data_criacao).strftime('%d/%m/%Y às %H:%M'),
+        }
+        assunto = email_massa.assunto
+        db.session.commit()
+        logger.info(f"Envio em massa {email_massa_id} iniciado")
+
+        try:
+            if not email_service.configurado:
+                self._descartar_pendentes(email_massa_id, token_envio, 'Email desabilitado')
+            else:
+                with ThreadPoolExecutor(max_workers=self.lotes_paralelos, thread_name_prefix='email-massa') as pool:
+                    for rodada in range(1, MAXIMO_RODADAS + 1):
+                        pendentes = self._executar_rodada(pool, email_massa_id, token_envio, email_service.user_id,
+                                                          assunto, contexto, rodada == MAXIMO_RODADAS)
+                        if pendentes is None:
+                            logger.info(f"Envio em massa {email_massa_id} não está mais ativo neste worker")
+                            return
+                        if not pendentes:
+                            break
+                        espera = min(ESPERA_BASE * 2 ** (rodada - 1), MAXIMO_ESPERA)
+                        logger.warning(f"Envio em massa {email_massa_id}: {pendentes} emails para repetir em {espera}s")
+                        if not self._esperar(email_massa_id, token_envio, espera):
+                            logger.info(f"Envio em massa {email_massa_id} não está mais ativo neste worker")
+                            return
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Erro no envio em massa {email_massa_id}: {str(e)}")
+            self._finalizar(email_massa_id, token_envio, str(e))
+            return
+        self._finalizar(email_massa_id, token_envio)
+        logger.info(f"Envio em massa {email_massa_id} concluído")
+
+    def _executar_rodada(self, pool, email_massa_id: int, token_envio: str, remetente: str, assunto: str,
+                         contexto: Dict, ultima_rodada: bool) -> Optional[int]:
+        """Percorre os destinatários pendentes; retorna quantos ficaram para repetir (None se o envio foi perdido)"""
+        ultimo_id = 0
+        para_repetir = 0
+        while True:
+            linhas = db.session.query(
+                EmailMassaDestinatario.id,
+                EmailMassaDestinatario.email_destinatario,
+                EmailMassaDestinatario.nome_destinatario
+            ).filter(
+                EmailMassaDestinatario.email_massa_id == email_massa_id,
+                EmailMassaDestinatario.status_envio == 'pendente',
+                EmailMassaDestinatario.id > ultimo_id
+            ).order_by(EmailMassaDestinatario.id).limit(self.tamanho_lote * self.lotes_paralelos).all()
+            db.session.commit()
+            if not linhas:
+                return para_repetir
+            ultimo_id = linhas[-1].id
+            # Confirma a reserva antes de enviar: se outro worker assumiu, nada sai daqui
+            if not self._renovar_heartbeat(email_massa_id, token_envio):
+                return None
+
+            itens = [
+                (linha.id, linha.email_destinatario,
+                 renderizar_email('email_grupo', nome_destinatario=linha.nome_destinatario, **contexto).html)
+                for linha in linhas
+            ]
+            token = provedor_token_graph.obter_token()
+            if token:
+                futuros = [
+                    pool.submit(enviar_lote_graph, token, remetente, assunto, itens[i:i + self.tamanho_lote])
+                    for i in range(0, len(itens), self.tamanho_lote)
+                ]
+                resultados, espera = {}, None
+                for futuro in futuros:
+                    parcial, retry_after = futuro.result()
+                    resultados.update(parcial)
+                    if retry_after is not None:
+                        espera = max(espera or 0, retry_after)
+            else:
+                resultados = {dest_id: ('repetir', 'Token do Microsoft Graph não obtido') for dest_id, _, _ in itens}
+                espera = None
+
+            if not self._gravar_resultados(email_massa_id, token_envio, resultados, ultima_rodada):
+                return None
+            para_repetir += sum(1 for situacao, _ in resultados.values() if situacao == 'repetir')
+            if espera:
+                # Caixa de correio limitada (429): segura os próximos lotes
+                if not self._esperar(email_massa_id, token_envio, min(espera, MAXIMO_ESPERA)):
+                    return None
+
+    def _renovar_heartbeat(self, email_massa_id: int, token_envio: str) -> bool:
+        """Atualiza o heartbeat (travando a linha do envio); False se a reserva passou para outro worker"""
+        resultado = db.session.execute(
+            update(EmailMassa)
+            .where(EmailMassa.id == email_massa_id, EmailMassa.status == 'enviando',
+                   EmailMassa.token_envio == token_envio)
+            .values(data_heartbeat=_agora_local())
+            .execution_options(synchronize_session=False)
+        )
+        if resultado.rowcount != 1:
+            db.session.rollback()
+            return False
+        db.session.commit()
+        return True
+
+    def _gravar_resultados(self, email_massa_id: int, token_envio: str,
+                           resultados: Dict[int, Tuple[str, Optional[str]]], ultima_rodada: bool) -> bool:
+        """Grava destinatários, contadores e heartbeat na mesma transação; False se o envio não é mais deste worker"""
+        agora = _agora_local()
+        enviados = [dest_id for dest_id, (situacao, _) in resultados.items() if situacao == 'enviado']
+        falhas_por_erro = defaultdict(list)
+        for dest_id, (situacao, erro) in resultados.items():
+            if situacao == 'falha' or (situacao == 'repetir' and ultima_rodada):
+                falhas_por_erro[erro].append(dest_id)
+
+        # Primeiro trava a linha do envio exigindo o token da reserva
+        resultado = db.session.execute(
+            update(EmailMassa)
+            .where(EmailMassa.id == email_massa_id, EmailMassa.status == 'enviando',
+                   EmailMassa.token_envio == token_envio)
+            .values(data_heartbeat=agora)
+            .execution_options(synchronize_session=False)
+        )
+        if resultado.rowcount != 1:
+            db.session.rollback()
+            return False
+
+        # Só linhas ainda pendentes mudam; os contadores somam o que de fato mudou
+        total_enviados = 0
+        if enviados:
+            total_enviados = db.session.execute(
+                update(EmailMassaDestinatario)
+                .where(EmailMassaDestinatario.id.in_(enviados),
+                       EmailMassaDestinatario.status_envio == 'pendente')
+                .values(status_envio='enviado', data_envio=agora)
+                .execution_options(synchronize_session=False)
+            ).rowcount
+        total_falhas = 0
+        for erro, ids in falhas_por_erro.items():
+            total_falhas += db.session.execute(
+                update(EmailMassaDestinatario)
+                .where(EmailMassaDestinatario.id.in_(ids),
+                       EmailMassaDestinatario.status_envio == 'pendente')
+                .values(status_envio='falha', erro_envio=erro)
+                .execution_options(synchronize_session=False)
+            ).rowcount
+        if total_enviados or total_falhas:
+            db.session.execute(
+                update(EmailMassa)
+                .where(EmailMassa.id == email_massa_id)
+                .values(enviados_count=EmailMassa.enviados_count + total_enviados,
+                        falhas_count=EmailMassa.falhas_count + total_falhas)
+                .execution_options(synchronize_session=False)
+            )
+        db.session.commit()
+        self._emitir_progresso(email_massa_id)
+        return True
+
+    def _descartar_pendentes(self, email_massa_id: int, token_envio: str, erro: str):
+        pendentes = db.session.query(EmailMassaDestinatario.id).filter(
+            EmailMassaDestinatario.email_massa_id == email_massa_id,
+            EmailMassaDestinatario.status_envio == 'pendente'
+        ).all()
+        self._gravar_resultados(email_massa_id, token_envio, {dest_id: ('falha', erro) for (dest_id,) in pendentes}, True)
+
+    def _esperar(self, email_massa_id: int, token_envio: str, segundos: float) -> bool:
+        """Pausa mantendo o heartbeat em dia (segundos nunca passa de MAXIMO_ESPERA); False se perdeu a reserva"""
+        time.sleep(segundos)
+        return self._renovar_heartbeat(email_massa_id, token_envio)
+
+    def _finalizar(self, email_massa_id: int, token_envio: str, erro: Optional[str] = None):
+        try:
+            db.session.execute(
+                update(EmailMassa)
+                .where(EmailMassa.id == email_massa_id, EmailMassa.status == 'enviando',
+                       EmailMassa.token_envio == token_envio)
+                .values(status='erro' if erro else case((EmailMassa.falhas_count == 0, 'concluido'), else_='erro'),
+                        erro_detalhes=erro, data_conclusao=_agora_local())
+                .execution_options(synchronize_session=False)
+            )
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Erro ao finalizar envio em massa {email_massa_id}: {str(e)}")
+        self._emitir_progresso(email_massa_id)
+
+    def _emitir_progresso(self, email_massa_id: int):
+        try:
+            email_massa = db.session.get(EmailMassa, email_massa_id, populate_existing=True)
+            if email_massa and hasattr(self._app, 'socketio'):
+                self._app.socketio.emit('email_massa_progresso', email_massa.to_dict())
+        except Exception as socket_error:
+            logger.warning(f"Erro ao emitir evento Socket.IO: {str(socket_error)}")
+
+
+# Instância global do disparador
+disparador_email_massa = DisparadorEmailMassa()
@@ -0,0 +1,90 @@
+from flask import Blueprint, request
+from flask_login import login_required, current_user
+from database import db, OutboxEvento
+from auth.auth_helpers import setor_required
+from setores.ti.painel import json_response, error_response
+from setores.ti.fila_email import status_email
+from setores.ti.outbox import reprocessar
+from setores.ti.cliente_http import cliente_graph
+import logging
+
+emails_bp = Blueprint('emails', __name__)
+logger = logging.getLogger(__name__)
+
+TIPOS_EMAIL = ('email', 'notificacao_chamado')
+
+
+@emails_bp.route('/api/emails/<int:email_id>', methods=['GET'])
+@login_required
+def obter_status_email(email_id):
+    """Situação de entrega de um email enfileirado (id devolvido pelas rotas que enviam email)"""
+    try:
+        evento = OutboxEvento.query.get(email_id)
+        if not evento or evento.tipo not in TIPOS_EMAIL:
+            return error_response('Email não encontrado', 404)
+        return json_response(status_email(evento))
+    except Exception as e:
+        logger.error(f"Erro ao consultar email {email_id}: {str(e)}")
+        return error_response('Erro interno do servidor')
+
+
+@emails_bp.route('/api/emails', methods=['GET'])
+@login_required
+@setor_required('Administrador')
+def listar_emails():
+    """Lista a fila de emails; ?status=erro mostra as mensagens que esgotaram as tentativas"""
+    try:
+        status = request.args.get('status')
+        page = request.args.get('page', 1, type=int)
+        per_page = min(request.args.get('per_page', 20, type=int), 100)
+
+        query = OutboxEvento.query.filter(OutboxEvento.tipo.in_(TIPOS_EMAIL))
+        if status:
+            query = query.filter(OutboxEvento.status == status)
+
+        paginacao = query.order_by(OutboxEvento.id.desc()).paginate(page=page, per_page=per_page, error_out=False)
+        return json_response({
+            'emails': [status_email(evento) for evento in paginacao.items],
+            'pagination': {
+                'page': paginacao.page,
+                'per_page': per_page,
+                'total': paginacao.total,
+                'pages': paginacao.pages
+            }
+        })
+    except Exception as e:
+        logger.error(f"Erro ao listar emails: {str(e)}")
+        return error_response('Erro interno do servidor')
+
+
+@emails_bp.route('/api/emails/conexoes', methods=['GET'])
+@login_required
+@setor_required('Administrador')
+def metricas_conexoes_graph():
+    """Reaproveitamento das conexões HTTP com o Microsoft Graph e o login da Microsoft"""
+    try:
+        return json_response(cliente_graph.metricas())
+    except Exception as e:
+        logger.error(f"Erro ao obter métricas de conexão: {str(e)}")
+        return error_response('Erro interno do servidor')
+
+
+@emails_bp.route('/api/emails/<int:email_id>/reprocessar', methods=['POST'])
+@login_required
+@setor_required('Administrador')
+def reprocessar_email(email_id):
+    """Devolve à fila um email que esgotou as tentativas"""
+    try:
+        evento = OutboxEvento.query.get(email_id)
+        if not evento or evento.tipo not in TIPOS_EMAIL:
+            return error_response('Email não encontrado', 404)
+        if not reprocessar(evento.id):
+            return error_response('Somente emails com falha podem ser reenviados')
+        db.session.commit()
+        logger.info(f"Email {email_id} devolvido à fila por {current_user.usuario}")
+        db.session.refresh(evento)
+        return json_response(status_email(evento))
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Erro ao reprocessar email {email_id}: {str(e)}")
+        return error_response('Erro interno do servidor')
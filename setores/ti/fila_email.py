@@ -0,0 +1,182 @@
+"""
+Fila de e-mails de saída (Microsoft Graph)
+
+As rotas não conversam com o Graph: enfileirar_email() grava a mensagem no
+outbox na mesma transação dos dados e a resposta volta sem esperar a rede.
+O processador do outbox envia em segundo plano, com no máximo
+LIMITE_CONCORRENCIA['email'] envios simultâneos, e trata a resposta do Graph:
+
+- 202: enviado;
+- 429/503: respeita o Retry-After (AdiarEvento, sem gastar tentativa);
+- 401: descarta o token em cache e tenta de novo com espera exponencial;
+- demais 4xx: erro permanente, o evento vai direto para 'erro';
+- 5xx/falha de rede: espera exponencial até MAXIMO_TENTATIVAS.
+
+O id do evento retornado serve para consultar a entrega (status_email).
+"""
+import logging
+import os
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+from typing import Dict, List, Optional, Union
+
+import requests
+
+from database import OutboxEvento
+from setores.ti.cliente_http import cliente_graph
+from setores.ti.graph_token import provedor_token_graph
+from setores.ti.outbox import AdiarEvento, ErroPermanente, enfileirar, tratador_outbox
+
+logger = logging.getLogger(__name__)
+
+# Como as credenciais, lido do ambiente na importação (também nas threads sem app context)
+URL_GRAPH = os.getenv('GRAPH_API_URL', 'https://graph.microsoft.com/v1.0').rstrip('/')
+TIMEOUT_ENVIO = (5, 30)  # (conexão, leitura) em segundos
+ESPERA_PADRAO_THROTTLING = 60  # segundos, quando o 429/503 vem sem Retry-After
+REMETENTE_PADRAO = os.getenv('USER_ID')
+EMAIL_TI = os.getenv('EMAIL_TI', 'ti@academiaevoque.com.br')
+
+# Situação do evento de outbox -> situação da entrega exibida no sistema
+SITUACOES_ENTREGA = {
+    'pendente': 'na_fila',
+    'processando': 'enviando',
+    'concluido': 'enviado',
+    'erro': 'falhou',
+}
+
+
+class ErroEnvioEmail(Exception):
+    """Resposta diferente de 202 do Graph (ou falha antes de enviar)"""
+
+    def __init__(self, mensagem: str, status: Optional[int] = None, retry_after: Optional[int] = None):
+        super().__init__(mensagem)
+        self.status = status
+        self.retry_after = retry_after
+
+
+def ler_retry_after(valor: Optional[str]) -> Optional[int]:
+    """Retry-After em segundos ou como data HTTP"""
+    if not valor:
+        return None
+    try:
+        return max(0, int(valor))
+    except ValueError:
+        pass
+    try:
+        data = parsedate_to_datetime(valor)
+        return max(0, int((data - datetime.now(data.tzinfo)).total_seconds()))
+    except (TypeError, ValueError):
+        return None
+
+
+def montar_mensagem(destinatarios: List[str], assunto: str, corpo: str, tipo_conteudo: str = 'Text') -> Dict:
+    """Corpo de /sendMail para uma mensagem"""
+    return {
+        'message': {
+            'subject': assunto,
+            'body': {'contentType': tipo_conteudo, 'content': corpo},
+            'toRecipients': [{'emailAddress': {'address': endereco}} for endereco in destinatarios]
+        },
+        'saveToSentItems': 'false'
+    }
+
+
+def enviar_mensagem_graph(destinatarios: List[str], assunto: str, corpo: str,
+                          tipo_conteudo: str = 'Text', remetente: Optional[str] = None):
+    """Envia uma mensagem agora; levanta ErroEnvioEmail se o Graph não aceitar"""
+    remetente = remetente or REMETENTE_PADRAO
+    if not remetente:
+        raise ErroEnvioEmail("Remetente (USER_ID) não configurado")
+    token = provedor_token_graph.obter_token()
+    if not token:
+        raise ErroEnvioEmail("Token do Microsoft Graph não obtido")
+
+    try:
+        resposta = cliente_graph.post(
+            f"{URL_GRAPH}/users/{remetente}/sendMail",
+            headers={'Authorization': f'Bearer {token}', 'Content-Type': 'application/json'},
+            json=montar_mensagem(destinatarios, assunto, corpo, tipo_conteudo),
+            timeout=TIMEOUT_ENVIO
+        )
+    except requests.RequestException as e:
+        raise ErroEnvioEmail(f"Erro na requisição ao Microsoft Graph: {str(e)}") from e
+
+    if resposta.status_code == 202:
+        return
+    if resposta.status_code == 401:
+        # Token revogado/expirado antes do previsto: a próxima tentativa renova
+        provedor_token_graph.invalidar(token)
+    raise ErroEnvioEmail(
+        f"Microsoft Graph respondeu {resposta.status_code}: {resposta.text[:500]}",
+        status=resposta.status_code,
+        retry_after=ler_retry_after(resposta.headers.get('Retry-After'))
+    )
+
+
+def classificar_erro(erro: ErroEnvioEmail) -> Exception:
+    """Converte a falha do Graph na exceção que orienta o outbox (adiar, desistir ou repetir)"""
+    if erro.status in (429, 503):
+        espera = erro.retry_after if erro.retry_after is not None else ESPERA_PADRAO_THROTTLING
+        return AdiarEvento(espera, str(erro))
+    if erro.status and 400 <= erro.status < 500 and erro.status not in (401, 408):
+        return ErroPermanente(str(erro))
+    return erro
+
+
+def email_habilitado(remetente: Optional[str] = None) -> bool:
+    return provedor_token_graph.configurado and bool(remetente or REMETENTE_PADRAO)
+
+
+def enfileirar_email(destinatarios: Union[str, List[str], None], assunto: str, corpo: str,
+                     tipo_conteudo: str = 'Text', remetente: Optional[str] = None) -> OutboxEvento:
+    """
+    Grava o e-mail no outbox; ele só é enviado depois do commit do chamador.
+
+    Sem destinatários, vai para EMAIL_TI. tipo_conteudo é 'Text' ou 'HTML'.
+    """
+    if destinatarios is None:
+        destinatarios = [EMAIL_TI]
+    elif isinstance(destinatarios, str):
+        destinatarios = [destinatarios]
+    payload = {
+        'assunto': assunto,
+        'corpo': corpo,
+        'destinatarios': [d for d in destinatarios if d],
+        'tipo_conteudo': tipo_conteudo,
+    }
+    if remetente:
+        payload['remetente'] = remetente
+    return enfileirar('email', payload)
+
+
+@tratador_outbox('email')
+def _enviar_email(payload: Dict):
+    remetente = payload.get('remetente')
+    if not email_habilitado(remetente):
+        # Vai para 'erro' (não conta como enviado); reprocessar depois de configurar o Graph
+        logger.warning(f"E-mail desabilitado; mensagem '{payload.get('assunto')}' não enviada")
+        raise ErroPermanente('E-mail desabilitado')
+    destinatarios = payload.get('destinatarios') or [EMAIL_TI]
+    try:
+        enviar_mensagem_graph(destinatarios, payload['assunto'], payload['corpo'],
+                              payload.get('tipo_conteudo', 'Text'), remetente)
+    except ErroEnvioEmail as e:
+        raise classificar_erro(e) from e
+    logger.info(f"E-mail '{payload['assunto']}' enviado para {', '.join(destinatarios)}")
+
+
+def status_email(evento: OutboxEvento) -> Dict:
+    """Situação de entrega de um e-mail enfileirado"""
+    payload = evento.get_payload()
+    return {
+        'id': evento.id,
+        'situacao': SITUACOES_ENTREGA.get(evento.status, evento.status),
+        'status': evento.status,
+        'assunto': payload.get('assunto'),
+        'destinatarios': payload.get('destinatarios', []),
+        'tentativas': evento.tentativas,
+        'proxima_tentativa': evento.proxima_tentativa.strftime('%d/%m/%Y %H:%M:%S') if evento.status == 'pendente' and evento.proxima_tentativa else None,
+        'erro': evento.erro,
+        'data_criacao': evento.data_criacao.strftime('%d/%m/%Y %H:%M:%S') if evento.data_criacao else None,
+        'data_envio': evento.data_processamento.strftime('%d/%m/%Y %H:%M:%S') if evento.status == 'concluido' and evento.data_processamento else None,
+    }
@@ -0,0 +1,115 @@
+"""
+Token de acesso do Microsoft Graph compartilhado (client credentials)
+
+O token é obtido uma vez e reutilizado por todas as threads até
+MARGEM_RENOVACAO segundos antes de expirar (expires_in). A renovação acontece
+sob um lock: enquanto uma thread consulta o endpoint de token, as demais
+esperam e recebem o mesmo token, em vez de cada e-mail fazer sua própria
+requisição de autenticação.
+"""
+import logging
+import os
+import threading
+import time
+from typing import Optional
+
+from setores.ti.cliente_http import cliente_graph
+
+logger = logging.getLogger(__name__)
+
+MARGEM_RENOVACAO = 300  # segundos antes do vencimento em que o token é renovado
+TIMEOUT_TOKEN = (5, 15)  # (conexão, leitura) em segundos
+ESCOPO_GRAPH = 'https://graph.microsoft.com/.default'
+
+
+class ProvedorTokenGraph:
+    """Obtém e mantém em cache o token de aplicação do Microsoft Graph"""
+
+    def __init__(self, client_id: Optional[str], client_secret: Optional[str], tenant_id: Optional[str],
+                 url_login: str = 'https://login.microsoftonline.com', escopo: str = ESCOPO_GRAPH):
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.tenant_id = tenant_id
+        self.url_login = url_login.rstrip('/')
+        self.escopo = escopo
+        self._token: Optional[str] = None
+        self._valido_ate = 0.0  # time.monotonic()
+        self._lock = threading.Lock()
+
+    @property
+    def configurado(self) -> bool:
+        return all([self.client_id, self.client_secret, self.tenant_id])
+
+    @property
+    def url_token(self) -> str:
+        return f"{self.url_login}/{self.tenant_id}/oauth2/v2.0/token"
+
+    def _token_valido(self) -> Optional[str]:
+        if self._token and time.monotonic() < self._valido_ate:
+            return self._token
+        return None
+
+    def obter_token(self) -> Optional[str]:
+        """Token em cache ou renovado; None se não for possível obtê-lo"""
+        token = self._token_valido()
+        if token:
+            return token
+        if not self.configurado:
+            logger.error("Credenciais do Microsoft Graph não configuradas")
+            return None
+
+        with self._lock:
+            # Outra thread pode ter renovado enquanto esta esperava o lock
+            token = self._token_valido()
+            if token:
+                return token
+            return self._renovar()
+
+    def _renovar(self) -> Optional[str]:
+        try:
+            logger.info(f"Solicitando token de acesso do Microsoft Graph para o tenant {self.tenant_id}")
+            resposta = cliente_graph.post(self.url_token, data={
+                'client_id': self.client_id,
+                'client_secret': self.client_secret,
+                'scope': self.escopo,
+                'grant_type': 'client_credentials'
+            }, timeout=TIMEOUT_TOKEN)
+
+            if resposta.status_code != 200:
+                logger.error(f"Erro na autenticação do Microsoft Graph: Status {resposta.status_code}, Resposta: {resposta.text}")
+                return None
+
+            dados = resposta.json()
+            token = dados.get('access_token')
+            if not token:
+                logger.error(f"Resposta de token sem access_token: {list(dados.keys())}")
+                return None
+            expira_em = int(dados.get('expires_in', 3600))
+            self._token = token
+            self._valido_ate = time.monotonic() + max(0, expira_em - MARGEM_RENOVACAO)
+            logger.info(f"Token do Microsoft Graph obtido (válido por {expira_em}s)")
+            return token
+        except Exception as e:
+            logger.error(f"Erro ao obter token do Microsoft Graph: {str(e)}")
+            return None
+
+    def invalidar(self, token: Optional[str] = None):
+        """
+        Descarta o token em cache (ex.: Graph respondeu 401).
+
+        Com token informado, só descarta se ainda for o mesmo: várias threads que
+        receberam 401 com o token antigo causam uma única renovação.
+        """
+        with self._lock:
+            if token is None or token == self._token:
+                self._token = None
+                self._valido_ate = 0.0
+
+
+# Instância global do provedor
+provedor_token_graph = ProvedorTokenGraph(
+    os.getenv('CLIENT_ID'),
+    os.getenv('CLIENT_SECRET'),
+    os.getenv('TENANT_ID'),
+    url_login=os.getenv('GRAPH_LOGIN_URL', 'https://login.microsoftonline.com')
+)
@@ -4,9 +4,9 @@ from database import (db, GrupoUsuarios, GrupoMembro, GrupoUnidade, GrupoPermiss
                      User, Unidade, EmailMassa, EmailMassaDestinatario, get_brazil_time)
 from auth.auth_helpers import setor_required
 from setores.ti.painel import json_response, error_response
-from setores.ti.email_service import email_service
+from setores.ti.email_massa import disparador_email_massa
+from sqlalchemy import insert
 import logging
-from jinja2 import Template
 
 grupos_bp = Blueprint('grupos', __name__)
 logger = logging.getLogger(__name__)
@@ -254,7 +254,7 @@ def excluir_grupo(grupo_id):
 @login_required
 @setor_required('Administrador')
 def enviar_email_grupo(grupo_id):
-    """Envia email em massa para todos os membros do grupo"""
+    """Enfileira email em massa para todos os membros do grupo"""
     try:
         grupo = GrupoUsuarios.query.get(grupo_id)
         if not grupo:
@@ -266,7 +266,7 @@ def enviar_email_grupo(grupo_id):
             return error_response('Assunto e mensagem são obrigatórios')
         
         # Buscar membros do grupo
-        membros = db.session.query(User).join(GrupoMembro).filter(
+        membros = db.session.query(User).join(GrupoMembro, GrupoMembro.usuario_id == User.id).filter(
             GrupoMembro.grupo_id == grupo_id,
             GrupoMembro.ativo == True
         ).all()
@@ -274,13 +274,15 @@ def enviar_email_grupo(grupo_id):
         if not membros:
             return error_response('Nenhum membro encontrado no grupo')
         
-        # Criar registro de email em massa
+        # Criar registro de email em massa; o disparador envia em segundo plano
         email_massa = EmailMassa(
             grupo_id=grupo_id,
             assunto=data['assunto'],
             conteudo=data['mensagem'],
             tipo=data.get('tipo', 'informativo'),
             destinatarios_count=len(membros),
+            enviados_count=0,
+            falhas_count=0,
             status='preparando',
             criado_por=current_user.id
         )
@@ -288,96 +290,27 @@ def enviar_email_grupo(grupo_id):
         db.session.add(email_massa)
         db.session.flush()
         
-        # Criar template HTML
-        template_html = Template("""
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <meta charset="utf-8">
-            <style>
-                body { font-family: Arial, sans-serif; line-height: 1.6; color: #333; }
-                .container { max-width: 600px; margin: 0 auto; padding: 20px; }
-                .header { background-color: #007bff; color: white; padding: 20px; text-align: center; }
-                .content { background-color: #f8f9fa; padding: 20px; }
-                .message { background-color: white; padding: 20px; margin: 15px 0; }
-                .footer { text-align: center; margin-top: 20px; font-size: 12px; color: #666; }
-            </style>
-        </head>
-        <body>
-            <div class="container">
-                <div class="header">
-                    <h1>{{ assunto }}</h1>
-                </div>
-                
-                <div class="content">
-                    <p>Olá <strong>{{ nome_destinatario }}</strong>,</p>
-                    
-                    <div class="message">
-                        {{ mensagem|safe }}
-                    </div>
-                    
-                    <p><em>Esta mensagem foi enviada para o grupo: <strong>{{ nome_grupo }}</strong></em></p>
-                </div>
-                
-                <div class="footer">
-                    <p>Enviado por: {{ remetente }} em {{ data_envio }}</p>
-                    <p>Sistema ERP Evoque Fitness</p>
-                </div>
-            </div>
-        </body>
-        </html>
-        """)
-        
-        # Enviar emails
-        sucessos = 0
-        falhas = 0
-        
-        for membro in membros:
-            # Criar registro de destinatário
-            destinatario_record = EmailMassaDestinatario(
-                email_massa_id=email_massa.id,
-                usuario_id=membro.id,
-                email_destinatario=membro.email,
-                nome_destinatario=f"{membro.nome} {membro.sobrenome}",
-                status_envio='pendente'
-            )
-            db.session.add(destinatario_record)
-            
-            # Gerar HTML personalizado
-            corpo_html = template_html.render(
-                assunto=data['assunto'],
-                nome_destinatario=f"{membro.nome} {membro.sobrenome}",
-                mensagem=data['mensagem'],
-                nome_grupo=grupo.nome,
-                remetente=f"{current_user.nome} {current_user.sobrenome}",
-                data_envio=get_brazil_time().strftime('%d/%m/%Y às %H:%M')
-            )
-            
-            # Tentar enviar email
-            if email_service.enviar_email(membro.email, data['assunto'], corpo_html):
-                destinatario_record.status_envio = 'enviado'
-                destinatario_record.data_envio = get_brazil_time().replace(tzinfo=None)
-                sucessos += 1
-            else:
-                destinatario_record.status_envio = 'falha'
-                destinatario_record.erro_envio = 'Erro no envio'
-                falhas += 1
-        
-        # Atualizar status do email em massa
-        email_massa.enviados_count = sucessos
-        email_massa.falhas_count = falhas
-        email_massa.status = 'concluido' if falhas == 0 else 'erro'
-        email_massa.data_envio = get_brazil_time().replace(tzinfo=None)
-        email_massa.data_conclusao = get_brazil_time().replace(tzinfo=None)
+        # Destinatários inseridos num único INSERT em lote
+        db.session.execute(insert(EmailMassaDestinatario), [
+            {
+                'email_massa_id': email_massa.id,
+                'usuario_id': membro.id,
+                'email_destinatario': membro.email,
+                'nome_destinatario': f"{membro.nome} {membro.sobrenome}",
+                'status_envio': 'pendente'
+            }
+            for membro in membros
+        ])
         
         db.session.commit()
+        disparador_email_massa.acordar()
         
         return json_response({
-            'message': f'Email enviado com sucesso! {sucessos} enviados, {falhas} falhas',
-            'sucessos': sucessos,
-            'falhas': falhas,
+            'message': f'Envio iniciado: {len(membros)} emails na fila',
+            'email_massa_id': email_massa.id,
+            'email_massa': email_massa.to_dict(),
             'total': len(membros)
-        })
+        }, 202)
         
     except Exception as e:
         logger.error(f"Erro ao enviar email para grupo {grupo_id}: {str(e)}")
@@ -419,3 +352,18 @@ def listar_emails_massa():
     except Exception as e:
         logger.error(f"Erro ao listar emails em massa: {str(e)}")
         return error_response('Erro interno do servidor')
+
+
+@grupos_bp.route('/api/grupos/emails-massa/<int:email_massa_id>', methods=['GET'])
+@login_required
+@setor_required('Administrador')
+def obter_email_massa(email_massa_id):
+    """Progresso de um envio em massa (o mesmo conteúdo do evento 'email_massa_progresso')"""
+    try:
+        email_massa = EmailMassa.query.get(email_massa_id)
+        if not email_massa:
+            return error_response('Envio não encontrado', 404)
+        return json_response(email_massa.to_dict())
+    except Exception as e:
+        logger.error(f"Erro ao consultar email em massa {email_massa_id}: {str(e)}")
+        return error_response('Erro interno do servidor')
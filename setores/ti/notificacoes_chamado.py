@@ -0,0 +1,133 @@
+"""
+Notificações de chamado agrupadas por destinatário
+
+Um agente que assume o chamado, muda o status e envia um ticket em sequência
+gerava três e-mails para o solicitante. notificar_chamado() grava um único
+evento 'notificacao_chamado' no outbox por (chamado, destinatário), agendado
+para o fim da janela NOTIFICACOES_JANELA_SEGUNDOS; enquanto ele estiver
+pendente, as notificações seguintes entram no mesmo evento. Ao fim da janela
+o tratador envia um e-mail (a própria mensagem se houver só uma, ou um resumo
+com todas).
+
+O aviso no painel ('notificacao_chamado' via Socket.IO) não espera a janela nem
+depende do e-mail: cada chamada enfileira um evento 'socketio' imediato, emitido
+logo após o commit, mesmo com o e-mail desabilitado.
+
+O envio usa o mesmo caminho dos demais e-mails (Retry-After, erro permanente,
+espera exponencial) e divide o limite de concorrência do tipo 'email'.
+"""
+import json
+import logging
+from datetime import timedelta
+from typing import Dict, List, Optional
+
+from flask import current_app
+
+from database import OutboxEvento, get_brazil_time
+from setores.ti.fila_email import ErroEnvioEmail, classificar_erro, email_habilitado, enviar_mensagem_graph
+from setores.ti.outbox import ErroPermanente, enfileirar, tratador_outbox
+from setores.ti.templates_email import renderizar_email
+
+logger = logging.getLogger(__name__)
+
+TIPO_NOTIFICACAO = 'notificacao_chamado'
+JANELA_PADRAO = 60  # segundos
+
+
+def _agora_local():
+    return get_brazil_time().replace(tzinfo=None)
+
+
+def janela_agrupamento() -> int:
+    return max(0, int(current_app.config.get('NOTIFICACOES_JANELA_SEGUNDOS', JANELA_PADRAO)))
+
+
+def _chave(chamado_id: int, destinatario: str) -> str:
+    return f"chamado:{chamado_id}:{destinatario.strip().lower()}"
+
+
+def notificar_chamado(chamado, destinatarios: List[str], tipo: str, assunto: str, texto: str,
+                      prioritario: bool = False) -> List[OutboxEvento]:
+    """
+    Agenda a notificação para cada destinatário; o chamador faz o commit.
+
+    tipo descreve a notificação ('atribuicao', 'status', 'ticket'). Retorna os
+    eventos do outbox (um por destinatário), já existentes ou criados agora.
+    """
+    agora = _agora_local()
+    janela = janela_agrupamento()
+    item = {
+        'tipo': tipo,
+        'assunto': assunto,
+        'texto': texto,
+        'prioritario': bool(prioritario),
+        'data': agora.strftime('%d/%m/%Y %H:%M:%S'),
+    }
+
+    eventos = []
+    for destinatario in dict.fromkeys(d for d in destinatarios if d):
+        chave = _chave(chamado.id, destinatario)
+        # Trava o evento pendente: o processador só o reserva depois deste commit
+        evento = OutboxEvento.query.filter_by(
+            tipo=TIPO_NOTIFICACAO, chave=chave, status='pendente'
+        ).with_for_update().first() if janela else None
+
+        if evento:
+            payload = evento.get_payload()
+            payload['itens'].append(item)
+            payload['assunto'] = montar_resumo(payload)['assunto']
+            evento.payload = json.dumps(payload, default=str)
+            logger.info(f"Notificação '{tipo}' do chamado {chamado.codigo} agrupada no evento {evento.id} ({len(payload['itens'])} itens)")
+        else:
+            payload = {
+                'chamado_id': chamado.id,
+                'codigo': chamado.codigo,
+                'destinatarios': [destinatario],
+                'assunto': assunto,
+                'itens': [item],
+            }
+            evento = enfileirar(TIPO_NOTIFICACAO, payload, chave=chave,
+                                executar_em=agora + timedelta(seconds=janela))
+        eventos.append(evento)
+
+    enfileirar('socketio', {
+        'evento': TIPO_NOTIFICACAO,
+        'dados': {
+            'chamado_id': chamado.id,
+            'codigo': chamado.codigo,
+            'destinatarios': list(dict.fromkeys(d for d in destinatarios if d)),
+            'assunto': assunto,
+            'tipo': tipo,
+            'timestamp': get_brazil_time().isoformat()
+        }
+    })
+    return eventos
+
+
+def montar_resumo(payload: Dict) -> Dict[str, Optional[str]]:
+    """Assunto e texto do e-mail: a mensagem original se houver só uma, senão o resumo"""
+    itens = payload['itens']
+    if len(itens) == 1:
+        return {'assunto': itens[0]['assunto'], 'texto': itens[0]['texto']}
+    email = renderizar_email(
+        'resumo_chamado',
+        codigo=payload['codigo'],
+        itens=itens,
+        prioritario=any(item.get('prioritario') for item in itens)
+    )
+    return {'assunto': email.assunto, 'texto': email.texto}
+
+
+@tratador_outbox(TIPO_NOTIFICACAO)
+def _enviar_notificacao(payload: Dict):
+    resumo = montar_resumo(payload)
+    destinatarios = payload['destinatarios']
+    if not email_habilitado():
+        # Só o e-mail vai para 'erro'; o aviso no painel já saiu em notificar_chamado()
+        logger.warning(f"E-mail desabilitado; notificação '{resumo['assunto']}' não enviada")
+        raise ErroPermanente('E-mail desabilitado')
+    try:
+        enviar_mensagem_graph(destinatarios, resumo['assunto'], resumo['texto'])
+    except ErroEnvioEmail as e:
+        raise classificar_erro(e) from e
+    logger.info(f"Notificação do chamado {payload['codigo']} enviada para {', '.join(destinatarios)} ({len(payload['itens'])} itens)")
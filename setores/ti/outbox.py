@@ -0,0 +1,282 @@
+"""
+Outbox de efeitos colaterais (e-mail, Socket.IO) executados após o commit
+
+Quem altera dados chama enfileirar() antes do commit: o evento é gravado na
+tabela outbox_eventos na mesma transação, então só existe se os dados
+existirem. Um processador em segundo plano reserva os eventos vencidos com
+UPDATE condicional (seguro entre workers), executa o tratador registrado
+para o tipo e refaz com espera exponencial em caso de falha.
+
+Tratadores podem sinalizar AdiarEvento (ex.: 429 com Retry-After: o evento
+volta para a fila sem gastar tentativa e o tipo fica pausado neste worker) ou
+ErroPermanente (não adianta repetir: vai direto para 'erro'). Eventos em
+'erro' são a fila de mensagens mortas e podem ser reenviados com reprocessar().
+"""
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+from flask import current_app
+from sqlalchemy import event, update
+from sqlalchemy.orm import Session
+
+from database import db, OutboxEvento, get_brazil_time
+
+logger = logging.getLogger(__name__)
+
+MAXIMO_TENTATIVAS = 5
+ESPERA_BASE = 30  # segundos; dobra a cada tentativa
+TEMPO_RESERVA = timedelta(minutes=5)  # evento 'processando' há mais tempo é retomado
+TAMANHO_LOTE = 20
+MAXIMO_THREADS = 4
+INTERVALO_VERIFICACAO = 30  # segundos entre buscas (eventos de outros workers/novas tentativas)
+MAXIMO_ADIAMENTO = 3600  # teto para esperas pedidas pelo tratador (Retry-After)
+IDADE_MAXIMA_ADIAMENTO = timedelta(hours=24)  # evento adiado há mais tempo que isso vai para 'erro'
+# Execuções simultâneas por tipo; o Graph aceita no máximo 4 requisições
+# concorrentes por caixa de correio
+LIMITE_CONCORRENCIA = {'email': 4}
+# Tipos que contam no limite de outro (enviam pela mesma caixa de correio)
+COMPARTILHA_LIMITE = {'notificacao_chamado': 'email'}
+
+# tipo -> função(payload: dict)
+_tratadores: Dict[str, Callable[[Dict], None]] = {}
+
+
+class AdiarEvento(Exception):
+    """O destino pediu para esperar (ex.: HTTP 429); não conta como tentativa"""
+
+    def __init__(self, segundos: float, mensagem: str = ''):
+        super().__init__(mensagem or f"Adiado por {segundos}s")
+        self.segundos = max(1, min(int(segundos), MAXIMO_ADIAMENTO))
+
+
+class ErroPermanente(Exception):
+    """Falha que não se resolve repetindo (ex.: destinatário inválido)"""
+
+
+def _agora_local() -> datetime:
+    return get_brazil_time().replace(tzinfo=None)
+
+
+def tratador_outbox(tipo: str):
+    """Registra a função que executa os eventos de um tipo"""
+    def registrar(funcao):
+        _tratadores[tipo] = funcao
+        return funcao
+    return registrar
+
+
+def enfileirar(tipo: str, payload: Dict, chave: Optional[str] = None,
+               executar_em: Optional[datetime] = None) -> OutboxEvento:
+    """
+    Adiciona o evento à sessão atual; ele é gravado (e executado) somente com o commit.
+
+    executar_em adia a execução (ex.: janela de agrupamento); chave identifica
+    eventos que podem ser agrupados enquanto estiverem pendentes.
+    """
+    evento = OutboxEvento(tipo=tipo, payload=json.dumps(payload, default=str), chave=chave,
+                          proxima_tentativa=executar_em or _agora_local())
+    db.session.add(evento)
+    db.session.info['outbox_novos'] = True
+    return evento
+
+
+def reprocessar(evento_id: int) -> bool:
+    """Devolve à fila um evento em 'erro' (mensagem morta); o chamador faz o commit"""
+    resultado = db.session.execute(
+        update(OutboxEvento)
+        .where(OutboxEvento.id == evento_id, OutboxEvento.status == 'erro')
+        .values(status='pendente', tentativas=0, proxima_tentativa=_agora_local(), erro=None)
+        .execution_options(synchronize_session=False)
+    )
+    if resultado.rowcount == 1:
+        db.session.info['outbox_novos'] = True
+        return True
+    return False
+
+
+class ProcessadorOutbox:
+    """Executa em segundo plano os eventos pendentes do outbox"""
+
+    def __init__(self, maximo_threads: int = MAXIMO_THREADS):
+        self.maximo_threads = maximo_threads
+        self._cond = threading.Condition()
+        self._acordar = False
+        self._thread: Optional[threading.Thread] = None
+        self._app = None
+        self._semaforos = {tipo: threading.BoundedSemaphore(limite) for tipo, limite in LIMITE_CONCORRENCIA.items()}
+        self._pausas: Dict[str, float] = {}  # tipo -> time.monotonic() até quando não reservar
+        self._lock_pausas = threading.Lock()
+
+    @property
+    def ativo(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def iniciar(self, app):
+        if self.ativo:
+            return
+        self._app = app
+        self._thread = threading.Thread(target=self._executar, name='outbox', daemon=True)
+        self._thread.start()
+        logger.info("Processador de outbox iniciado")
+
+    def acordar(self):
+        with self._cond:
+            self._acordar = True
+            self._cond.notify()
+
+    def _executar(self):
+        with ThreadPoolExecutor(max_workers=self.maximo_threads, thread_name_prefix='outbox') as pool:
+            while True:
+                with self._cond:
+                    self._acordar = False
+                reservados = []
+                try:
+                    with self._app.app_context():
+                        reservados = self._reservar_lote()
+                    # Cada evento roda no próprio app context; a thread principal espera o lote
+                    list(pool.map(self._processar, reservados))
+                except Exception as e:
+                    logger.error(f"Erro no processador de outbox: {str(e)}")
+                if len(reservados) == TAMANHO_LOTE:
+                    continue
+                with self._cond:
+                    if not self._acordar:
+                        self._cond.wait(INTERVALO_VERIFICACAO)
+
+    def pausar(self, tipo: str, segundos: float):
+        """Deixa de reservar eventos do tipo por alguns segundos (destino sobrecarregado)"""
+        with self._lock_pausas:
+            ate = time.monotonic() + segundos
+            if ate > self._pausas.get(tipo, 0):
+                self._pausas[tipo] = ate
+
+    def _tipos_pausados(self) -> List[str]:
+        agora = time.monotonic()
+        with self._lock_pausas:
+            for tipo in [t for t, ate in self._pausas.items() if ate <= agora]:
+                del self._pausas[tipo]
+            return list(self._pausas)
+
+    def _reservar_lote(self) -> List[int]:
+        """Reserva eventos vencidos; o UPDATE condicional impede que dois workers peguem o mesmo"""
+        try:
+            agora = _agora_local()
+            consulta = db.session.query(OutboxEvento.id).filter(
+                OutboxEvento.status.in_(['pendente', 'processando']),
+                OutboxEvento.proxima_tentativa <= agora
+            )
+            pausados = self._tipos_pausados()
+            if pausados:
+                consulta = consulta.filter(OutboxEvento.tipo.notin_(pausados))
+            candidatos = consulta.order_by(OutboxEvento.proxima_tentativa, OutboxEvento.id).limit(TAMANHO_LOTE).all()
+
+            reservados = []
+            for (evento_id,) in candidatos:
+                resultado = db.session.execute(
+                    update(OutboxEvento)
+                    .where(OutboxEvento.id == evento_id,
+                           OutboxEvento.status.in_(['pendente', 'processando']),
+                           OutboxEvento.proxima_tentativa <= agora)
+                    .values(status='processando', proxima_tentativa=agora + TEMPO_RESERVA,
+                            tentativas=OutboxEvento.tentativas + 1)
+                    .execution_options(synchronize_session=False)
+                )
+                if resultado.rowcount == 1:
+                    reservados.append(evento_id)
+            db.session.commit()
+            return reservados
+        finally:
+            db.session.remove()
+
+    def _processar(self, evento_id: int):
+        with self._app.app_context():
+            semaforo = None
+            try:
+                evento = db.session.get(OutboxEvento, evento_id)
+                tratador = _tratadores.get(evento.tipo)
+                if tratador is None:
+                    raise RuntimeError(f"Nenhum tratador registrado para '{evento.tipo}'")
+
+                semaforo = self._semaforos.get(COMPARTILHA_LIMITE.get(evento.tipo, evento.tipo))
+                if semaforo:
+                    semaforo.acquire()
+                tratador(evento.get_payload())
+
+                evento.status = 'concluido'
+                evento.erro = None
+                evento.data_processamento = _agora_local()
+                db.session.commit()
+            except AdiarEvento as e:
+                db.session.rollback()
+                self._registrar_adiamento(evento_id, e)
+            except Exception as e:
+                db.session.rollback()
+                self._registrar_falha(evento_id, str(e), permanente=isinstance(e, ErroPermanente))
+            finally:
+                if semaforo:
+                    semaforo.release()
+                db.session.remove()
+
+    def _registrar_adiamento(self, evento_id: int, adiamento: AdiarEvento):
+        try:
+            evento = db.session.get(OutboxEvento, evento_id)
+            if evento.data_criacao and _agora_local() - evento.data_criacao > IDADE_MAXIMA_ADIAMENTO:
+                self._registrar_falha(evento_id, f"Adiado por mais de {IDADE_MAXIMA_ADIAMENTO}: {adiamento}", permanente=True)
+                return
+            # Devolve a tentativa contada na reserva e segura o tipo todo neste worker
+            evento.status = 'pendente'
+            evento.tentativas = max(0, evento.tentativas - 1)
+            evento.proxima_tentativa = _agora_local() + timedelta(seconds=adiamento.segundos)
+            evento.erro = str(adiamento)
+            db.session.commit()
+            self.pausar(evento.tipo, adiamento.segundos)
+            logger.warning(f"Evento de outbox {evento_id} ({evento.tipo}) adiado por {adiamento.segundos}s: {adiamento}")
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Erro ao adiar evento de outbox {evento_id}: {str(e)}")
+
+    def _registrar_falha(self, evento_id: int, erro: str, permanente: bool = False):
+        try:
+            evento = db.session.get(OutboxEvento, evento_id)
+            if permanente or evento.tentativas >= MAXIMO_TENTATIVAS:
+                evento.status = 'erro'
+                logger.error(f"Evento de outbox {evento_id} ({evento.tipo}) descartado após {evento.tentativas} tentativas: {erro}")
+            else:
+                evento.status = 'pendente'
+                evento.proxima_tentativa = _agora_local() + timedelta(seconds=ESPERA_BASE * 2 ** (evento.tentativas - 1))
+                logger.warning(f"Evento de outbox {evento_id} ({evento.tipo}) falhou, nova tentativa em {evento.proxima_tentativa}: {erro}")
+            evento.erro = erro
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Erro ao registrar falha do evento de outbox {evento_id}: {str(e)}")
+
+
+# Instância global do processador
+processador_outbox = ProcessadorOutbox()
+
+
+@event.listens_for(Session, 'after_commit')
+def _acordar_processador_apos_commit(session):
+    if session.info.pop('outbox_novos', False) and processador_outbox.ativo:
+        processador_outbox.acordar()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _descartar_marcacao_outbox(session):
+    session.info.pop('outbox_novos', None)
+
+
+@tratador_outbox('socketio')
+def _emitir_socketio(payload: Dict):
+    if not hasattr(current_app, 'socketio'):
+        return
+    if payload.get('sala'):
+        current_app.socketio.emit(payload['evento'], payload.get('dados'), room=payload['sala'])
+    else:
+        current_app.socketio.emit(payload['evento'], payload.get('dados'))
@@ -1,6 +1,6 @@
-from flask import Blueprint, render_template, request, jsonify, abort, redirect, url_for, flash, Response
+from flask import Blueprint, render_template, request, jsonify, abort, redirect, url_for, flash, Response, stream_with_context
 from database import Chamado, Unidade, User, db, ProblemaReportado, get_brazil_time, utc_to_brazil
-from database import HistoricoTicket, Configuracao, AgenteSuporte, ChamadoAgente, HistoricoSLA
+from database import HistoricoTicket, Configuracao, AgenteSuporte, ChamadoAgente, HistoricoSLA, Feriado, SlaRebaselineJob
 from sqlalchemy.exc import IntegrityError
 import logging
 import random
@@ -9,10 +9,13 @@ from flask_login import LoginManager, login_required, current_user, logout_user
 from auth.auth_helpers import setor_required
 import os
 from setores.ti.routes import enviar_email
+from setores.ti.templates_email import renderizar_email
+from setores.ti.notificacoes_chamado import notificar_chamado
 from setores.ti.rotas import get_client_info
 from datetime import datetime, timedelta
 from flask import current_app
-from sqlalchemy import func, case, extract
+from sqlalchemy import func, case, extract, and_, or_
+import base64
 import json
 import pytz
 import traceback
@@ -24,8 +27,11 @@ from setores.ti.sla_utils import (
     carregar_configuracoes_sla,
     salvar_configuracoes_sla,
     carregar_configuracoes_horario_comercial,
-    obter_metricas_sla_consolidadas
+    obter_metricas_sla_consolidadas,
+    filtro_sla_status
 )
+from setores.ti.sla_lote import buscar_colunas_sla, iterar_colunas_sla, calcular_sla_linhas, calcular_sla_lote, sla_info_do_lote
+from setores.ti.sla_rebaseline import executor_rebaseline_sla
 
 painel_bp = Blueprint('painel', __name__, template_folder='templates')
 
@@ -1025,33 +1031,18 @@ def atribuir_chamado_para_mim(chamado_id):
         )
 
         db.session.add(nova_atribuicao)
-        db.session.commit()
-
-        logger.info(f"Chamado {chamado_id} atribuído com sucesso ao agente {agente.id}")
 
-        # Enviar e-mail de notificação
+        email_evento = None
+        # Notificação agrupada com as demais do chamado e enviada pelo outbox após o commit
         try:
-            from setores.ti.routes import enviar_email
-            assunto = f"Chamado {chamado.codigo} - Agente Atribuído"
-            corpo = f"""
-Olá {chamado.solicitante},
-
-Seu chamado {chamado.codigo} foi atribuído ao agente {current_user.nome} {current_user.sobrenome}.
-
-Detalhes do chamado:
-- Problema: {chamado.problema}
-- Prioridade: {chamado.prioridade}
-- Agente responsável: {current_user.nome} {current_user.sobrenome}
-- E-mail do agente: {current_user.email}
+            email = renderizar_email('chamado_auto_atribuido', chamado=chamado, agente=current_user)
+            email_evento = notificar_chamado(chamado, [chamado.email], 'atribuicao', email.assunto, email.texto)[0]
+        except Exception as email_error:
+            logger.warning(f"Erro ao preparar e-mail de atribuiç��o: {str(email_error)}")
 
-Em breve você receberá um contato para resolução do seu problema.
+        db.session.commit()
 
-Atenciosamente,
-Equipe de Suporte TI - Evoque Fitness
-"""
-            enviar_email(assunto, corpo, [chamado.email])
-        except Exception as email_error:
-            logger.warning(f"Erro ao enviar e-mail de atribuiç��o: {str(email_error)}")
+        logger.info(f"Chamado {chamado_id} atribuído com sucesso ao agente {agente.id}")
 
         # Emitir evento Socket.IO para notificação em tempo real
         try:
@@ -1074,7 +1065,8 @@ Equipe de Suporte TI - Evoque Fitness
         logger.info(f"Chamado {chamado.codigo} auto-atribuído ao agente {current_user.nome}")
 
         return json_response({
-            'message': f'Chamado {chamado.codigo} atribuído com sucesso'
+            'message': f'Chamado {chamado.codigo} atribuído com sucesso',
+            'email_id': email_evento.id if email_evento else None
         })
 
     except Exception as e:
@@ -1518,6 +1510,9 @@ def salvar_configuracoes_sla_api():
             except ValueError:
                 return error_response('Formato de hor��rio inválido (use HH:MM)', 400)
 
+        # Prazos e status de SLA materializados dependem dessas regras: recálculo em segundo plano
+        job_recalculo = executor_rebaseline_sla.agendar(usuario_id=current_user.id)
+
         # Registrar log da ação
         registrar_log_acao(
             usuario_id=current_user.id,
@@ -1530,6 +1525,7 @@ def salvar_configuracoes_sla_api():
 
         return json_response({
             'message': 'Configurações salvas com sucesso',
+            'recalculo_sla': job_recalculo.to_dict(),
             'timestamp': get_brazil_time().isoformat()
         })
 
@@ -1538,6 +1534,25 @@ def salvar_configuracoes_sla_api():
         logger.error(f"Erro ao salvar configurações SLA: {str(e)}")
         return error_response('Erro interno no servidor')
 
+@painel_bp.route('/api/sla/recalculo', methods=['GET'])
+@painel_bp.route('/api/sla/recalculo/<int:job_id>', methods=['GET'])
+@login_required
+@setor_required('ti')
+def obter_recalculo_sla(job_id=None):
+    """Retorna o progresso de um job de recálculo de SLA (ou do mais recente)"""
+    try:
+        if job_id is None:
+            job = SlaRebaselineJob.query.order_by(SlaRebaselineJob.id.desc()).first()
+        else:
+            job = SlaRebaselineJob.query.get(job_id)
+        if not job:
+            return error_response('Recálculo de SLA não encontrado', 404)
+        return json_response(job.to_dict())
+
+    except Exception as e:
+        logger.error(f"Erro ao obter recálculo de SLA: {str(e)}")
+        return error_response('Erro interno no servidor')
+
 @painel_bp.route('/api/sla/metricas', methods=['GET'])
 @login_required
 @setor_required('ti')
@@ -1591,6 +1606,10 @@ def obter_chamados_com_sla():
         if prioridade_filtro:
             query = query.filter(Chamado.prioridade == prioridade_filtro)
 
+        # Filtrar por status SLA no banco (colunas materializadas), antes da paginação
+        if sla_status_filtro:
+            query = query.filter(filtro_sla_status(sla_status_filtro))
+
         # Ordenar por data de abertura (mais recentes primeiro)
         query = query.order_by(Chamado.data_abertura.desc())
 
@@ -1601,13 +1620,19 @@ def obter_chamados_com_sla():
         config_sla = carregar_configuracoes_sla()
         config_horario = carregar_configuracoes_horario_comercial()
 
-        chamados_list = []
-        for chamado in chamados:
-            sla_info = calcular_sla_chamado_correto(chamado, config_sla, config_horario)
+        # Detalhes de SLA da página calculados em lote
+        sla = calcular_sla_lote(
+            [c.data_abertura for c in chamados],
+            [c.data_primeira_resposta for c in chamados],
+            [c.data_conclusao for c in chamados],
+            [c.status for c in chamados],
+            [c.prioridade for c in chamados],
+            config_sla, config_horario
+        )
 
-            # Filtrar por status SLA se especificado
-            if sla_status_filtro and sla_info['sla_status'] != sla_status_filtro:
-                continue
+        chamados_list = []
+        for i, chamado in enumerate(chamados):
+            sla_info = sla_info_do_lote(sla, i)
 
             data_abertura_brazil = chamado.get_data_abertura_brazil()
             data_conclusao_brazil = chamado.get_data_conclusao_brazil()
@@ -1653,31 +1678,34 @@ def obter_dashboard_sla():
         config_sla = carregar_configuracoes_sla()
         config_horario = carregar_configuracoes_horario_comercial()
 
-        # Converter objetos time para strings
-        if 'inicio' in config_horario and hasattr(config_horario['inicio'], 'strftime'):
-            config_horario['inicio'] = config_horario['inicio'].strftime('%H:%M')
-        if 'fim' in config_horario and hasattr(config_horario['fim'], 'strftime'):
-            config_horario['fim'] = config_horario['fim'].strftime('%H:%M')
-
-        # Obter chamados abertos em risco
-        chamados_abertos = Chamado.query.filter(
-            Chamado.status.in_(['Aberto', 'Aguardando'])
-        ).order_by(Chamado.data_abertura.asc()).all()
+        # Converter objetos time para strings (em cópia, o original é usado no cálculo)
+        horario_json = dict(config_horario)
+        if 'inicio' in horario_json and hasattr(horario_json['inicio'], 'strftime'):
+            horario_json['inicio'] = horario_json['inicio'].strftime('%H:%M')
+        if 'fim' in horario_json and hasattr(horario_json['fim'], 'strftime'):
+            horario_json['fim'] = horario_json['fim'].strftime('%H:%M')
+
+        # Obter chamados abertos em risco (cálculo em lote sobre colunas)
+        linhas = buscar_colunas_sla(
+            Chamado.status.in_(['Aberto', 'Aguardando']),
+            extras=(Chamado.id, Chamado.codigo, Chamado.solicitante, Chamado.problema),
+            ordenacao=(Chamado.data_abertura.asc(),)
+        )
+        sla = calcular_sla_linhas(linhas, config_sla, config_horario)
 
         chamados_risco = []
-        for chamado in chamados_abertos:
-            sla_info = calcular_sla_chamado_correto(chamado, config_sla, config_horario)
-            if sla_info['sla_status'] in ['Em Risco', 'Violado']:
-                data_abertura_brazil = chamado.get_data_abertura_brazil()
+        for i, linha in enumerate(linhas):
+            if sla['sla_status'][i] in ['Em Risco', 'Violado']:
+                data_abertura, _, _, _, prioridade, chamado_id, codigo, solicitante, problema = linha
                 chamados_risco.append({
-                    'id': chamado.id,
-                    'codigo': chamado.codigo,
-                    'solicitante': chamado.solicitante,
-                    'problema': chamado.problema,
-                    'prioridade': chamado.prioridade,
-                    'data_abertura': data_abertura_brazil.strftime('%d/%m/%Y %H:%M') if data_abertura_brazil else None,
-                    'sla_status': sla_info['sla_status'],
-                    'percentual_tempo_usado': sla_info['percentual_tempo_usado']
+                    'id': chamado_id,
+                    'codigo': codigo,
+                    'solicitante': solicitante,
+                    'problema': problema,
+                    'prioridade': prioridade,
+                    'data_abertura': data_abertura.strftime('%d/%m/%Y %H:%M') if data_abertura else None,
+                    'sla_status': sla['sla_status'][i],
+                    'percentual_tempo_usado': float(sla['percentual_tempo_usado'][i])
                 })
 
         # Estatísticas por status
@@ -1703,7 +1731,7 @@ def obter_dashboard_sla():
             'metricas': metricas,
             'configuracoes': {
                 'sla': config_sla,
-                'horario_comercial': config_horario
+                'horario_comercial': horario_json
             },
             'chamados_risco': chamados_risco,
             'estatisticas': {
@@ -1782,17 +1810,22 @@ def auto_atribuir_chamado(chamado_id):
         )
 
         db.session.add(nova_atribuicao)
-        db.session.commit()
 
-        # Enviar email
+        # E-mail gravado no outbox na mesma transação da atribuição
+        email_evento = None
         try:
             from .email_service import email_service
-            email_service.notificar_agente_atribuido(chamado, agente)
+            email_evento = email_service.notificar_agente_atribuido(chamado, agente) or None
         except Exception as e:
-            logger.warning(f"Erro ao enviar email: {str(e)}")
+            logger.warning(f"Erro ao preparar email: {str(e)}")
+
+        db.session.commit()
 
         logger.info(f"Chamado {chamado.codigo} auto-atribuído com sucesso")
-        return json_response({'message': f'Chamado {chamado.codigo} atribuído com sucesso'})
+        return json_response({
+            'message': f'Chamado {chamado.codigo} atribuído com sucesso',
+            'email_id': email_evento.id if email_evento else None
+        })
 
     except Exception as e:
         db.session.rollback()
@@ -3229,24 +3262,17 @@ def notificar_status_chamado(id):
         if not novo_status:
             return error_response('Status não fornecido.', 400)
         
-        assunto = f"ATUALIZAÇÃO DO CHAMADO {chamado.codigo}"
-        corpo = f"""
-Prezado(a), {chamado.solicitante}
+        if not chamado.email:
+            return error_response('Chamado sem e-mail do solicitante.', 400)
 
-O status do seu chamado foi alterado para: {novo_status}
+        email = renderizar_email('status_chamado', chamado=chamado, status=novo_status)
+        eventos = notificar_chamado(chamado, [chamado.email], 'status', email.assunto, email.texto)
+        db.session.commit()
 
-Atenciosamente,
-Suporte Evoque.
-"""
-        
-        enviado = enviar_email(assunto, corpo, [chamado.email])
-        
-        if enviado:
-            return json_response({'message': 'E-mail enviado com sucesso'})
-        else:
-            return error_response('Falha ao enviar e-mail')
+        return json_response({'message': 'Notificação agendada para envio', 'email_id': eventos[0].id})
             
     except Exception as e:
+        db.session.rollback()
         logger.error(f"Erro ao enviar notificação: {str(e)}")
         logger.error(traceback.format_exc())
         return error_response('Erro interno ao enviar notificação')
@@ -3299,115 +3325,103 @@ def enviar_ticket(id):
 
         # Verificar se há agente atribuído
         from database import ChamadoAgente, AgenteSuporte
-        agente_info = ""
+        agente = None
         try:
             chamado_agente = ChamadoAgente.query.filter_by(
                 chamado_id=chamado.id,
                 ativo=True
             ).first()
 
-            if chamado_agente and chamado_agente.agente:
+            if chamado_agente and chamado_agente.agente and chamado_agente.agente.usuario:
                 agente = chamado_agente.agente
-                agente_info = f"""
-Agente Responsável: {agente.usuario.nome} {agente.usuario.sobrenome}
-Email do Agente: {agente.usuario.email}
-Nível de Experiência: {agente.nivel_experiencia.title()}
-"""
         except Exception as agente_error:
             logger.warning(f"Erro ao buscar agente do chamado: {str(agente_error)}")
 
-        mensagem_formatada = f"""
-Chamado: {chamado.codigo}
-Status: {chamado.status}
-Data de Abertura: {data_abertura_str}
-Problema: {chamado.problema}
-Unidade: {chamado.unidade}{agente_info}
-
-{mensagem}
-
-Atenciosamente,
-Equipe de Suporte TI - Evoque Fitness
-"""
+        email = renderizar_email(
+            'ticket_chamado',
+            chamado=chamado,
+            data_abertura=data_abertura_str,
+            agente=agente,
+            mensagem=mensagem
+        )
+        eventos = notificar_chamado(chamado, destinatarios, 'ticket', assunto, email.texto, prioritario=prioridade)
 
-        sucesso = enviar_email(
+        historico = HistoricoTicket(
+            chamado_id=chamado.id,
+            usuario_id=current_user.id,
             assunto=assunto,
-            corpo=mensagem_formatada,
-            destinatarios=destinatarios
+            mensagem=mensagem,
+            destinatarios=", ".join(destinatarios)
         )
+        db.session.add(historico)
+        # E-mail e histórico gravados juntos; o envio acontece em segundo plano
+        db.session.commit()
 
-        if sucesso:
-            historico = HistoricoTicket(
+        # Registrar evento de timeline: ticket enviado
+        try:
+            from database import ChamadoTimelineEvent
+            import json as _json
+            evento_ticket = ChamadoTimelineEvent(
                 chamado_id=chamado.id,
-                usuario_id=current_user.id,
-                assunto=assunto,
-                mensagem=mensagem,
-                destinatarios=", ".join(destinatarios)
+                usuario_id=getattr(current_user, 'id', None),
+                tipo='ticket_sent',
+                descricao=f"Ticket enviado: {assunto} para {', '.join(destinatarios)}",
+                metadados=_json.dumps({
+                    'assunto': assunto,
+                    'mensagem': mensagem,
+                    'destinatarios': destinatarios
+                })
             )
-            db.session.add(historico)
+            db.session.add(evento_ticket)
             db.session.commit()
+        except Exception as e:
+            logger.warning(f"Falha ao registrar timeline de ticket: {str(e)}")
 
-            # Registrar evento de timeline: ticket enviado
-            try:
-                from database import ChamadoTimelineEvent
-                import json as _json
-                evento_ticket = ChamadoTimelineEvent(
-                    chamado_id=chamado.id,
-                    usuario_id=getattr(current_user, 'id', None),
-                    tipo='ticket_sent',
-                    descricao=f"Ticket enviado: {assunto} para {', '.join(destinatarios)}",
-                    metadados=_json.dumps({
-                        'assunto': assunto,
-                        'mensagem': mensagem,
-                        'destinatarios': destinatarios
-                    })
-                )
-                db.session.add(evento_ticket)
-                db.session.commit()
-            except Exception as e:
-                logger.warning(f"Falha ao registrar timeline de ticket: {str(e)}")
+        # Salvar anexos do ticket, se houver, e criar eventos na timeline (armazenar no DB como blob)
+        try:
+            if arquivos:
+                from werkzeug.utils import secure_filename
+                from security.security_config import SecurityConfig
+                from database import AnexoArquivo, ChamadoTimelineEvent
+                from setores.ti.armazenamento_anexos import salvar_upload
+                from setores.ti.derivados_anexos import agendar_derivados
 
-            # Salvar anexos do ticket, se houver, e criar eventos na timeline (armazenar no DB como blob)
-            try:
-                if arquivos:
-                    from werkzeug.utils import secure_filename
-                    from security.security_config import SecurityConfig
-                    from database import AnexoArquivo, ChamadoTimelineEvent
+                try:
+                    keys = list(request.files.keys())
+                    logger.info(f"Ticket upload debug - request.files keys: {keys}")
+                    logger.info(f"Ticket upload debug - arquivos count: {len(arquivos) if arquivos is not None else 0}")
+                except Exception:
+                    logger.info("Ticket upload debug - could not enumerate request.files keys")
 
+                for arquivo in arquivos:
                     try:
-                        keys = list(request.files.keys())
-                        logger.info(f"Ticket upload debug - request.files keys: {keys}")
-                        logger.info(f"Ticket upload debug - arquivos count: {len(arquivos) if arquivos is not None else 0}")
-                    except Exception:
-                        logger.info("Ticket upload debug - could not enumerate request.files keys")
-
-                    for arquivo in arquivos:
-                        try:
-                            if not arquivo or arquivo.filename == '':
-                                logger.info("Ticket upload debug - skipping empty file")
-                                continue
-                            filename = secure_filename(arquivo.filename)
-                            ext = os.path.splitext(filename)[1].lower()
-                            if SecurityConfig.UPLOAD_EXTENSIONS and ext not in SecurityConfig.UPLOAD_EXTENSIONS:
-                                logger.info(f"Ticket upload debug - extension not allowed: {filename}")
-                                continue
-
-                            # Ler conteúdo em memória e salvar no banco
-                            data = arquivo.read()
-                            tamanho = len(data) if data is not None else None
-                            logger.info(f"Ticket upload debug - read file {filename} size={tamanho}")
-
+                        if not arquivo or arquivo.filename == '':
+                            logger.info("Ticket upload debug - skipping empty file")
+                            continue
+                        filename = secure_filename(arquivo.filename)
+                        ext = os.path.splitext(filename)[1].lower()
+                        if SecurityConfig.UPLOAD_EXTENSIONS and ext not in SecurityConfig.UPLOAD_EXTENSIONS:
+                            logger.info(f"Ticket upload debug - extension not allowed: {filename}")
+                            continue
+
+                        # Gravar em blocos no armazenamento de anexos (sem carregar em memória)
+                        conteudo = salvar_upload(arquivo)
+                        logger.info(f"Ticket upload debug - stored file {filename} size={conteudo['tamanho_bytes']} sha256={conteudo['sha256']}")
+
+                        # Falha num arquivo descarta só esse anexo (savepoint); o conteúdo já gravado
+                        # e não referenciado sai com scripts/migrate_anexos.py --sweep-orphans
+                        with db.session.begin_nested():
                             anexo = AnexoArquivo(
                                 historico_ticket_id=historico.id,
                                 chamado_id=chamado.id,
                                 nome_original=arquivo.filename,
                                 caminho_arquivo=None,
-                                arquivo_blob=data,
-                                mime_type=arquivo.mimetype,
-                                tamanho_bytes=tamanho,
-                                usuario_id=current_user.id
+                                usuario_id=current_user.id,
+                                **conteudo
                             )
                             db.session.add(anexo)
                             db.session.flush()  # obter ID do anexo
+                            agendar_derivados(anexo)
 
                             # Timeline: anexo enviado pelo suporte
                             evento_anexo = ChamadoTimelineEvent(
@@ -3418,33 +3432,20 @@ Equipe de Suporte TI - Evoque Fitness
                                 anexo_id=anexo.id
                             )
                             db.session.add(evento_anexo)
-                        except Exception as e:
-                            logger.error(f"Erro ao processar anexo do ticket: {str(e)}")
-                    db.session.commit()
-            except Exception as e:
-                logger.error(f"Erro ao salvar anexos do ticket: {str(e)}")
-                db.session.rollback()
-
-            # Emitir evento Socket.IO apenas se a conexão estiver disponível
-            try:
-                if hasattr(current_app, 'socketio'):
-                    current_app.socketio.emit('ticket_enviado', {
-                        'chamado_id': chamado.id,
-                        'codigo': chamado.codigo,
-                        'assunto': assunto,
-                        'destinatarios': destinatarios,
-                        'timestamp': get_brazil_time().isoformat()
-                    })
-            except Exception as socket_error:
-                logger.warning(f"Erro ao emitir evento Socket.IO: {str(socket_error)}")
+                    except Exception as e:
+                        logger.error(f"Erro ao processar anexo do ticket: {str(e)}")
+                db.session.commit()
+        except Exception as e:
+            logger.error(f"Erro ao salvar anexos do ticket: {str(e)}")
+            db.session.rollback()
 
-            return json_response({
-                'message': 'Ticket enviado com sucesso',
-                'chamado_id': chamado.id,
-                'destinatarios': destinatarios
-            })
-        else:
-            raise Exception('Falha ao enviar e-mail')
+        # O aviso via Socket.IO ('notificacao_chamado') sai pelo outbox logo após o commit
+        return json_response({
+            'message': 'Ticket enviado com sucesso',
+            'chamado_id': chamado.id,
+            'destinatarios': destinatarios,
+            'email_id': eventos[0].id
+        })
 
     except Exception as e:
         db.session.rollback()
@@ -3540,46 +3541,139 @@ def obter_grafico_semanal():
         logger.error(traceback.format_exc())
         return error_response('Erro interno no servidor')
 
+# Paginação por cursor de /api/sla/chamados-detalhados
+TAMANHO_PAGINA_SLA_PADRAO = 100
+TAMANHO_PAGINA_SLA_MAXIMO = 1000
+TAMANHO_LOTE_STREAMING_SLA = 1000
+
+def _codificar_cursor_sla(data_abertura, chamado_id):
+    """Cursor opaco com a posição (data_abertura, id) do último chamado entregue"""
+    dados = json.dumps({'a': data_abertura.isoformat(), 'i': chamado_id}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(dados.encode()).decode().rstrip('=')
+
+def _decodificar_cursor_sla(cursor):
+    """Retorna (data_abertura, id) do cursor; ValueError se inválido"""
+    try:
+        dados = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode())
+        return datetime.fromisoformat(dados['a']), int(dados['i'])
+    except Exception:
+        raise ValueError('Cursor inválido')
+
+def _chamado_detalhado_sla(linha, sla, indice):
+    data_abertura, _, _, status, prioridade, chamado_id, codigo, solicitante, problema = linha
+    sla_info = sla_info_do_lote(sla, indice)
+
+    # Datas sem timezone já estão no horário do Brasil
+    data_abertura_str = data_abertura.strftime('%d/%m/%Y %H:%M')
+
+    return {
+        'id': chamado_id,
+        'codigo': codigo,
+        'solicitante': solicitante,
+        'problema': problema,
+        'status': status,
+        'data_abertura': data_abertura_str,
+        'horas_decorridas': sla_info['horas_decorridas'],
+        'sla_limite': sla_info['sla_limite'],
+        'sla_status': sla_info['sla_status'],
+        'prioridade': sla_info.get('prioridade', prioridade),
+        'tempo_primeira_resposta': sla_info['tempo_primeira_resposta'],
+        'tempo_resolucao': sla_info['tempo_resolucao'],
+        'violacao_primeira_resposta': sla_info['violacao_primeira_resposta'],
+        'violacao_resolucao': sla_info['violacao_resolucao']
+    }
+
 @painel_bp.route('/api/sla/chamados-detalhados', methods=['GET'])
 @login_required
 @setor_required('ti')
 def obter_chamados_detalhados_sla():
-    """Retorna lista detalhada de chamados com informações de SLA"""
+    """
+    Retorna lista detalhada de chamados com informações de SLA
+
+    Ordenação: data de abertura (mais recentes primeiro) e id.
+    - ?limite=N[&cursor=...]: página com {'chamados', 'proximo_cursor', 'tem_mais'}
+    - ?formato=ndjson (ou Accept: application/x-ndjson): um chamado por linha, em streaming;
+      uma falha no meio termina com a linha {"erro": ..., "incompleto": true}
+    - sem parâmetros: array JSON completo, gerado em streaming; uma falha no meio
+      interrompe a resposta sem fechar o array
+    """
     try:
         sla_config = carregar_configuracoes_sla()
         horario_config = carregar_configuracoes_horario_comercial()
 
-        chamados = Chamado.query.order_by(Chamado.data_abertura.desc()).all()
+        formato = request.args.get('formato')
+        if not formato and 'application/x-ndjson' in request.headers.get('Accept', ''):
+            formato = 'ndjson'
+        cursor = request.args.get('cursor')
+        limite = request.args.get('limite', type=int)
 
-        chamados_detalhados = []
-        for chamado in chamados:
-            if not chamado.data_abertura:
-                continue
+        filtros = [Chamado.data_abertura.isnot(None)]
+        if cursor:
+            try:
+                ultima_abertura, ultimo_id = _decodificar_cursor_sla(cursor)
+            except ValueError as e:
+                return error_response(str(e), 400)
+            filtros.append(or_(
+                Chamado.data_abertura < ultima_abertura,
+                and_(Chamado.data_abertura == ultima_abertura, Chamado.id < ultimo_id)
+            ))
+
+        extras = (Chamado.id, Chamado.codigo, Chamado.solicitante, Chamado.problema)
+        ordenacao = (Chamado.data_abertura.desc(), Chamado.id.desc())
+
+        if formato != 'ndjson' and (cursor or limite):
+            limite = min(max(limite or TAMANHO_PAGINA_SLA_PADRAO, 1), TAMANHO_PAGINA_SLA_MAXIMO)
+            # Uma linha a mais indica se existe próxima página
+            linhas = buscar_colunas_sla(*filtros, extras=extras, ordenacao=ordenacao, limite=limite + 1)
+            tem_mais = len(linhas) > limite
+            linhas = linhas[:limite]
+            sla = calcular_sla_linhas(linhas, sla_config, horario_config)
 
-            sla_info = calcular_sla_chamado_correto(chamado, sla_config, horario_config)
-            
-            # Converter data de abertura para timezone do Brasil
-            data_abertura_brazil = chamado.get_data_abertura_brazil()
-            data_abertura_str = data_abertura_brazil.strftime('%d/%m/%Y %H:%M') if data_abertura_brazil else 'N/A'
-            
-            chamados_detalhados.append({
-                'id': chamado.id,
-                'codigo': chamado.codigo,
-                'solicitante': chamado.solicitante,
-                'problema': chamado.problema,
-                'status': chamado.status,
-                'data_abertura': data_abertura_str,
-                'horas_decorridas': sla_info['horas_decorridas'],
-                'sla_limite': sla_info['sla_limite'],
-                'sla_status': sla_info['sla_status'],
-                'prioridade': sla_info.get('prioridade', chamado.prioridade),
-                'tempo_primeira_resposta': sla_info['tempo_primeira_resposta'],
-                'tempo_resolucao': sla_info['tempo_resolucao'],
-                'violacao_primeira_resposta': sla_info['violacao_primeira_resposta'],
-                'violacao_resolucao': sla_info['violacao_resolucao']
+            return json_response({
+                'chamados': [_chamado_detalhado_sla(linha, sla, i) for i, linha in enumerate(linhas)],
+                'proximo_cursor': _codificar_cursor_sla(linhas[-1][0], linhas[-1][5]) if tem_mais else None,
+                'tem_mais': tem_mais
             })
-        
-        return json_response(chamados_detalhados)
+
+        def gerar_chamados():
+            """Lê com cursor do servidor e calcula o SLA lote a lote (memória constante)"""
+            restantes = limite if formato == 'ndjson' and limite else None
+            for linhas in iterar_colunas_sla(*filtros, extras=extras, ordenacao=ordenacao,
+                                             tamanho_lote=TAMANHO_LOTE_STREAMING_SLA):
+                if restantes is not None:
+                    linhas = linhas[:restantes]
+                    restantes -= len(linhas)
+                sla = calcular_sla_linhas(linhas, sla_config, horario_config)
+                for i, linha in enumerate(linhas):
+                    yield _chamado_detalhado_sla(linha, sla, i)
+                if restantes == 0:
+                    return
+
+        if formato == 'ndjson':
+            def gerar_ndjson():
+                try:
+                    for chamado in gerar_chamados():
+                        yield json.dumps(chamado, ensure_ascii=False) + '\n'
+                except Exception as e:
+                    logger.error(f"Erro no streaming de chamados detalhados: {str(e)}")
+                    # O status 200 já foi enviado: a última linha avisa que a lista está incompleta
+                    yield json.dumps({'erro': 'Erro interno no servidor', 'incompleto': True}, ensure_ascii=False) + '\n'
+
+            return Response(stream_with_context(gerar_ndjson()), mimetype='application/x-ndjson')
+
+        def gerar_array():
+            yield '['
+            try:
+                for indice, chamado in enumerate(gerar_chamados()):
+                    yield (',' if indice else '') + json.dumps(chamado, ensure_ascii=False)
+            except Exception as e:
+                # Sem fechar o array: a conexão é interrompida e o cliente recebe JSON inválido,
+                # em vez de uma lista truncada que parece completa
+                logger.error(f"Erro no streaming de chamados detalhados: {str(e)}")
+                raise
+            yield ']'
+
+        return Response(stream_with_context(gerar_array()), mimetype='application/json')
 
     except Exception as e:
         logger.error(f"Erro ao obter chamados detalhados: {str(e)}")
@@ -3955,6 +4049,12 @@ def sincronizar_sla_database():
         # Commit das alterações
         db.session.commit()
 
+        # Feriados, horário comercial e datas dos chamados alimentam os prazos
+        # materializados: recálculo em segundo plano
+        job_recalculo = None
+        if feriados_adicionados or configuracoes_corrigidas or chamados_corrigidos:
+            job_recalculo = executor_rebaseline_sla.agendar(usuario_id=current_user.id)
+
         # Registrar ação de auditoria
         client_info = get_client_info(request)
         registrar_log_acao(
@@ -3977,6 +4077,7 @@ def sincronizar_sla_database():
             'configuracoes_corrigidas': configuracoes_corrigidas,
             'chamados_corrigidos': chamados_corrigidos,
             'feriados_adicionados': feriados_adicionados,
+            'recalculo_sla': job_recalculo.to_dict() if job_recalculo else None,
             'timestamp': get_brazil_time().strftime('%d/%m/%Y %H:%M:%S %Z')
         })
 
@@ -4530,25 +4631,26 @@ def atribuir_chamado(chamado_id):
         )
 
         db.session.add(nova_atribuicao)
-        db.session.commit()
 
-        logger.info(f"Chamado {chamado.codigo} atribuído ao agente {agente.usuario.nome} por {current_user.nome}")
-
-        # Enviar notificação por email ao solicitante
+        # Notificação por email ao solicitante, enviada pelo outbox após o commit
+        email_evento = None
         try:
             from .email_service import email_service
-            email_enviado = email_service.notificar_agente_atribuido(chamado, agente)
-            if email_enviado:
-                logger.info(f"Email de notificação enviado para {chamado.email}")
-            else:
-                logger.warning(f"Falha ao enviar email de notificaç��o para {chamado.email}")
+            email_evento = email_service.notificar_agente_atribuido(chamado, agente) or None
+            if not email_evento:
+                logger.warning(f"Falha ao preparar email de notificação para {chamado.email}")
         except Exception as e:
-            logger.warning(f"Erro ao enviar email de notificação: {str(e)}")
+            logger.warning(f"Erro ao preparar email de notificação: {str(e)}")
+
+        db.session.commit()
+
+        logger.info(f"Chamado {chamado.codigo} atribuído ao agente {agente.usuario.nome} por {current_user.nome}")
 
         return json_response({
             'message': f'Chamado {chamado.codigo} atribuído ao agente {agente.usuario.nome}',
             'agente_nome': f"{agente.usuario.nome} {agente.usuario.sobrenome}",
-            'agente_id': agente.id
+            'agente_id': agente.id,
+            'email_id': email_evento.id if email_evento else None
         })
 
     except Exception as e:
@@ -1,5 +1,6 @@
 import os
 import os
+import json
 import random
 import string
 from datetime import datetime, timedelta
@@ -7,8 +8,16 @@ from flask import Blueprint, render_template, request, jsonify, current_app, fla
 from flask_login import LoginManager, login_required, current_user
 from auth.auth_helpers import setor_required
 from database import db, Chamado, User, Unidade, ProblemaReportado, ItemInternet, seed_unidades, get_brazil_time
-import requests
-from msal import ConfidentialClientApplication
+from setores.ti.sequencias import gerar_codigo_chamado, gerar_protocolo
+from setores.ti.outbox import enfileirar
+from setores.ti.derivados_anexos import agendar_derivados
+from setores.ti.dados_referencia import (
+    listar_unidades, listar_problemas_ativos, listar_itens_internet_ativos,
+    obter_unidade, obter_problema, obter_item_internet
+)
+from setores.ti.graph_token import provedor_token_graph
+from setores.ti.fila_email import URL_GRAPH, ErroEnvioEmail, enfileirar_email, enviar_mensagem_graph
+from setores.ti.templates_email import renderizar_email
 
 ti_bp = Blueprint('ti', __name__, template_folder='templates')
 
@@ -24,7 +33,7 @@ EMAIL_ENABLED = all([CLIENT_ID, CLIENT_SECRET, TENANT_ID, USER_ID])
 
 if EMAIL_ENABLED:
     SCOPES = ["https://graph.microsoft.com/.default"]
-    ENDPOINT = f"https://graph.microsoft.com/v1.0/users/{USER_ID}/sendMail"
+    ENDPOINT = f"{URL_GRAPH}/users/{USER_ID}/sendMail"
     print("✅ Configurações de email Microsoft Graph carregadas")
 else:
     SCOPES = []
@@ -36,40 +45,11 @@ def get_access_token():
         current_app.logger.warning("⚠️  Tentativa de obter token com email desabilitado")
         return None
 
-    try:
-        current_app.logger.info(f"🔄 Configurando MSAL Client...")
-        current_app.logger.info(f"🔑 CLIENT_ID: {CLIENT_ID[:8]}...")
-        current_app.logger.info(f"🏢 TENANT_ID: {TENANT_ID}")
-        current_app.logger.info(f"🌐 Authority: https://login.microsoftonline.com/{TENANT_ID}")
-
-        app = ConfidentialClientApplication(
-            client_id=CLIENT_ID,
-            client_credential=CLIENT_SECRET,
-            authority=f"https://login.microsoftonline.com/{TENANT_ID}"
-        )
-
-        current_app.logger.info(f"📋 Scopes: {SCOPES}")
-        current_app.logger.info("🔄 Solicitando token...")
-
-        result = app.acquire_token_for_client(scopes=SCOPES)
-
-        current_app.logger.info(f"📥 Resultado recebido: {list(result.keys())}")
-
-        if "access_token" in result:
-            current_app.logger.info("✅ Token obtido com sucesso!")
-            return result["access_token"]
-        else:
-            current_app.logger.error(f"❌ Erro ao obter token:")
-            current_app.logger.error(f"   - Error: {result.get('error', 'N/A')}")
-            current_app.logger.error(f"   - Error Description: {result.get('error_description', 'N/A')}")
-            current_app.logger.error(f"   - Error Codes: {result.get('error_codes', 'N/A')}")
-            current_app.logger.error(f"   - Correlation ID: {result.get('correlation_id', 'N/A')}")
-            return None
-    except Exception as e:
-        current_app.logger.error(f"❌ Exceção ao obter token: {str(e)}")
-        import traceback
-        current_app.logger.error(f"🔍 Stack trace: {traceback.format_exc()}")
-        return None
+    # Token compartilhado entre threads e renovado só perto do vencimento
+    token = provedor_token_graph.obter_token()
+    if not token:
+        current_app.logger.error("❌ Erro ao obter token do Microsoft Graph")
+    return token
 
 def testar_configuracao_email():
     """Função para testar se as configurações de e-mail estão funcionando"""
@@ -113,77 +93,22 @@ def testar_configuracao_email():
         return False
 
 def enviar_email(assunto, corpo, destinatarios=None):
+    """Envia na hora (diagnóstico); as rotas usam enfileirar_email"""
     if destinatarios is None:
         destinatarios = [EMAIL_TI]
 
-    current_app.logger.info(f"📧 === INICIANDO ENVIO DE EMAIL ===")
-    current_app.logger.info(f"📧 Destinatários: {destinatarios}")
-    current_app.logger.info(f"📋 Assunto: {assunto}")
-    current_app.logger.info(f"📄 Tamanho do corpo: {len(corpo)} caracteres")
-
-    token = get_access_token()
-    if not token:
-        current_app.logger.error("❌ Token não obtido, não é possível enviar e-mail")
+    current_app.logger.info(f"📧 Enviando e-mail '{assunto}' para {destinatarios}")
+    if not EMAIL_ENABLED:
+        current_app.logger.warning("⚠️  Tentativa de enviar e-mail com email desabilitado")
         return False
-
-    current_app.logger.info(f"🔑 Token obtido: {token[:20]}...")
-    current_app.logger.info(f"🌐 Endpoint: {ENDPOINT}")
-
-    headers = {
-        "Authorization": f"Bearer {token}",
-        "Content-Type": "application/json"
-    }
-
-    email_data = {
-        "message": {
-            "subject": assunto,
-            "body": {
-                "contentType": "Text",
-                "content": corpo
-            },
-            "toRecipients": [
-                {"emailAddress": {"address": addr}} for addr in destinatarios
-            ]
-        },
-        "saveToSentItems": "false"
-    }
-
-    current_app.logger.info(f"�� Email data preparado para: {[r['emailAddress']['address'] for r in email_data['message']['toRecipients']]}")
-
     try:
-        response = requests.post(ENDPOINT, headers=headers, json=email_data)
-        if response.status_code == 202:
-            current_app.logger.info("���� E-mail enviado com sucesso!")
-            return True
-        else:
-            current_app.logger.error(f"❌ Falha ao enviar e-mail. Status: {response.status_code}")
-            return False
-    except Exception as e:
-        current_app.logger.error(f"❌ Erro na requisição: {str(e)}")
+        enviar_mensagem_graph(destinatarios, assunto, corpo, 'Text', USER_ID)
+        current_app.logger.info("✅ E-mail enviado com sucesso!")
+        return True
+    except ErroEnvioEmail as e:
+        current_app.logger.error(f"❌ Falha ao enviar e-mail: {str(e)}")
         return False
 
-def gerar_codigo_chamado():
-    ultimo_chamado = Chamado.query.order_by(Chamado.id.desc()).first()
-    if ultimo_chamado and ultimo_chamado.codigo.startswith("EVQ-"):
-        try:
-            ultimo_numero = int(ultimo_chamado.codigo.split("-")[1])
-        except:
-            ultimo_numero = 0
-    else:
-        ultimo_numero = 0
-    
-    novo_numero = ultimo_numero + 1
-    numero_formatado = str(novo_numero).zfill(4)
-    return f"EVQ-{numero_formatado}"
-
-def gerar_protocolo():
-    # Usar horário do Brasil para gerar protocolo
-    data_brazil = get_brazil_time()
-    data_str = data_brazil.strftime("%Y%m%d")
-    count = Chamado.query.filter(Chamado.protocolo.like(f"{data_str}-%")).count()
-    novo_num = count + 1
-    return f"{data_str}-{novo_num}"
-
 @ti_bp.route('/test-email')
 @login_required
 @setor_required('ti')
@@ -290,13 +215,9 @@ def painel_agente():
 @setor_required('ti')
 def abrir_chamado():
     try:
-        unidades = Unidade.query.order_by(Unidade.nome).all()
-        problemas = ProblemaReportado.query.filter_by(ativo=True).order_by(ProblemaReportado.nome).all()
-        # Filtro ativo opcional para ItemInternet (pode não existir em dados antigos)
-        try:
-            itens_internet = ItemInternet.query.filter_by(ativo=True).order_by(ItemInternet.nome).all()
-        except:
-            itens_internet = ItemInternet.query.order_by(ItemInternet.nome).all()
+        unidades = listar_unidades()
+        problemas = listar_problemas_ativos()
+        itens_internet = listar_itens_internet_ativos()
 
         # Log de debug
         current_app.logger.info(f"📊 Dados carregados - Unidades: {len(unidades)}, Problemas: {len(problemas)}, Itens: {len(itens_internet)}")
@@ -304,13 +225,9 @@ def abrir_chamado():
         if not unidades:
             current_app.logger.info("🔄 Nenhuma unidade encontrada, executando seed_unidades()")
             seed_unidades()
-            unidades = Unidade.query.order_by(Unidade.nome).all()
-            problemas = ProblemaReportado.query.filter_by(ativo=True).order_by(ProblemaReportado.nome).all()
-            # Filtro ativo opcional para ItemInternet (pode não existir em dados antigos)
-            try:
-                itens_internet = ItemInternet.query.filter_by(ativo=True).order_by(ItemInternet.nome).all()
-            except:
-                itens_internet = ItemInternet.query.order_by(ItemInternet.nome).all()
+            unidades = listar_unidades()
+            problemas = listar_problemas_ativos()
+            itens_internet = listar_itens_internet_ativos()
             current_app.logger.info(f"📊 Após seed - Unidades: {len(unidades)}, Problemas: {len(problemas)}, Itens: {len(itens_internet)}")
             
         if request.method == 'POST':
@@ -331,8 +248,8 @@ def abrir_chamado():
                     'prioridade': request.form.get('prioridade', 'Normal')
                 }
 
-                unidade_obj = Unidade.query.get(dados_chamado['unidade_id'])
-                problema_obj = ProblemaReportado.query.get(dados_chamado['problema_id'])
+                unidade_obj = obter_unidade(dados_chamado['unidade_id'])
+                problema_obj = obter_problema(dados_chamado['problema_id'])
                 
                 if not unidade_obj or not problema_obj:
                     return jsonify({
@@ -345,7 +262,7 @@ def abrir_chamado():
                 
                 internet_item_nome = ""
                 if dados_chamado['internet_item_id']:
-                    item_obj = ItemInternet.query.get(dados_chamado['internet_item_id'])
+                    item_obj = obter_item_internet(dados_chamado['internet_item_id'])
                     internet_item_nome = item_obj.nome if item_obj else ""
 
                 data_visita = None
@@ -383,96 +300,73 @@ def abrir_chamado():
                     usuario_id=current_user.id  # Vincular ao usuário logado
                 )
 
+                # Chamado, linha do tempo, anexos e efeitos colaterais (outbox) num único commit
                 db.session.add(novo_chamado)
-                db.session.commit()
+                db.session.flush()
 
                 # Registrar evento de criação na linha do tempo
-                try:
-                    from database import ChamadoTimelineEvent
-                    evento_criacao = ChamadoTimelineEvent(
-                        chamado_id=novo_chamado.id,
-                        usuario_id=current_user.id,
-                        tipo='created',
-                        descricao='Chamado criado',
-                        status_anterior=None,
-                        status_novo='Aberto'
-                    )
-                    db.session.add(evento_criacao)
-                    db.session.commit()
-                except Exception as e:
-                    current_app.logger.warning(f"Falha ao registrar timeline de criação: {str(e)}")
-
-                # Processar anexos enviados - armazenar conteúdo no banco (blob) em vez de filesystem
-                try:
-                    from werkzeug.utils import secure_filename
-                    from security.security_config import SecurityConfig
-                    arquivos = request.files.getlist('anexos') or request.files.getlist('anexos[]')
-
-                    # Debug logging: show received files info
+                from database import ChamadoTimelineEvent
+                db.session.add(ChamadoTimelineEvent(
+                    chamado_id=novo_chamado.id,
+                    usuario_id=current_user.id,
+                    tipo='created',
+                    descricao='Chamado criado',
+                    status_anterior=None,
+                    status_novo='Aberto'
+                ))
+
+                # Processar anexos enviados - conteúdo gravado em blocos no armazenamento de anexos
+                from werkzeug.utils import secure_filename
+                from security.security_config import SecurityConfig
+                from database import AnexoArquivo
+                from setores.ti.armazenamento_anexos import salvar_upload
+                arquivos = request.files.getlist('anexos') or request.files.getlist('anexos[]')
+                for arquivo in arquivos:
+                    if not arquivo or arquivo.filename == '':
+                        continue
+                    filename = secure_filename(arquivo.filename)
+                    ext = os.path.splitext(filename)[1].lower()
+                    if SecurityConfig.UPLOAD_EXTENSIONS and ext not in SecurityConfig.UPLOAD_EXTENSIONS:
+                        current_app.logger.info(f"Anexo ignorado (extensão não permitida): {filename}")
+                        continue
+
+                    # Falha num arquivo descarta só esse anexo (savepoint), não o chamado; o conteúdo
+                    # já gravado e não referenciado sai com scripts/migrate_anexos.py --sweep-orphans
                     try:
-                        keys = list(request.files.keys())
-                        current_app.logger.info(f"Upload debug - request.files keys: {keys}")
-                        current_app.logger.info(f"Upload debug - arquivos length: {len(arquivos) if arquivos is not None else 0}")
-                    except Exception as _:
-                        current_app.logger.info("Upload debug - could not read request.files keys")
-
-                    if arquivos:
-                        from database import AnexoArquivo, ChamadoTimelineEvent
-                        for arquivo in arquivos:
-                            try:
-                                if not arquivo or arquivo.filename == '':
-                                    current_app.logger.info("Upload debug - skipping empty file object")
-                                    continue
-                                filename = secure_filename(arquivo.filename)
-                                ext = os.path.splitext(filename)[1].lower()
-                                if SecurityConfig.UPLOAD_EXTENSIONS and ext not in SecurityConfig.UPLOAD_EXTENSIONS:
-                                    current_app.logger.info(f"Upload debug - extension not allowed for file: {filename}")
-                                    continue
-
-                                # Ler conteúdo em memória e salvar no banco
-                                data = arquivo.read()
-                                tamanho = len(data) if data is not None else None
-                                current_app.logger.info(f"Upload debug - read file {filename} size={tamanho}")
-
-                                anexo = AnexoArquivo(
-                                    chamado_id=novo_chamado.id,
-                                    nome_original=arquivo.filename,
-                                    caminho_arquivo=None,
-                                    arquivo_blob=data,
-                                    mime_type=arquivo.mimetype,
-                                    tamanho_bytes=tamanho,
-                                    usuario_id=current_user.id
-                                )
-                                db.session.add(anexo)
-                                db.session.flush()
-
-                                # Registrar timeline do anexo recebido na abertura
-                                try:
-                                    evento_anexo = ChamadoTimelineEvent(
-                                        chamado_id=novo_chamado.id,
-                                        usuario_id=current_user.id,
-                                        tipo='attachment_received',
-                                        descricao=f'Anexo recebido na abertura: {arquivo.filename}',
-                                        anexo_id=anexo.id,
-                                        metadados=json.dumps({
-                                            'arquivo_nome': arquivo.filename,
-                                            'mime_type': arquivo.mimetype,
-                                            'tamanho_bytes': tamanho,
-                                            'origem': 'solicitante'
-                                        })
-                                    )
-                                    db.session.add(evento_anexo)
-                                except Exception as e:
-                                    current_app.logger.warning(f"Falha ao registrar timeline de anexo: {str(e)}")
-                            except Exception as e:
-                                current_app.logger.error(f"Erro ao processar arquivo de upload: {str(e)}")
-                        db.session.commit()
-                except Exception as e:
-                    current_app.logger.error(f"Erro ao salvar anexos do chamado {codigo_gerado}: {str(e)}")
-                    db.session.rollback()
-
-                if hasattr(current_app, 'socketio'):
-                    current_app.socketio.emit('novo_chamado', {
+                        conteudo = salvar_upload(arquivo)
+                        tamanho = conteudo['tamanho_bytes']
+                        with db.session.begin_nested():
+                            anexo = AnexoArquivo(
+                                chamado_id=novo_chamado.id,
+                                nome_original=arquivo.filename,
+                                caminho_arquivo=None,
+                                usuario_id=current_user.id,
+                                **conteudo
+                            )
+                            db.session.add(anexo)
+                            db.session.flush()
+                            agendar_derivados(anexo)
+
+                            # Registrar timeline do anexo recebido na abertura
+                            db.session.add(ChamadoTimelineEvent(
+                                chamado_id=novo_chamado.id,
+                                usuario_id=current_user.id,
+                                tipo='attachment_received',
+                                descricao=f'Anexo recebido na abertura: {arquivo.filename}',
+                                anexo_id=anexo.id,
+                                metadados=json.dumps({
+                                    'arquivo_nome': arquivo.filename,
+                                    'mime_type': conteudo['mime_type'],
+                                    'tamanho_bytes': tamanho,
+                                    'origem': 'solicitante'
+                                })
+                            ))
+                    except Exception as e:
+                        current_app.logger.error(f"Erro ao processar anexo {filename} do chamado {codigo_gerado}: {str(e)}")
+
+                enfileirar('socketio', {
+                    'evento': 'novo_chamado',
+                    'dados': {
                         'id': novo_chamado.id,
                         'codigo': codigo_gerado,
                         'protocolo': protocolo_gerado,
@@ -482,52 +376,33 @@ def abrir_chamado():
                         'status': 'Aberto',
                         'data_abertura': data_abertura_brazil.isoformat(),
                         'prioridade': dados_chamado['prioridade']
-                    })
-
-                visita_tecnica_texto = (
-                    f"Sim, agendada para {data_visita.strftime('%d/%m/%Y')}"
-                    if data_visita else "Não requisitada"
-                )
+                    }
+                })
 
-                internet_item_texto = (
-                    f"\nItem de Internet: {internet_item_nome}"
-                    if problema_nome == 'Internet' and internet_item_nome
-                    else ""
+                email = renderizar_email(
+                    'chamado_aberto',
+                    codigo=codigo_gerado,
+                    protocolo=protocolo_gerado,
+                    prioridade=dados_chamado['prioridade'],
+                    nome_solicitante=dados_chamado['nome_solicitante'],
+                    cargo=dados_chamado['cargo'],
+                    unidade=unidade_nome_completo,
+                    email=dados_chamado['email'],
+                    telefone=dados_chamado['telefone'],
+                    problema=problema_nome,
+                    item_internet=internet_item_nome if problema_nome == 'Internet' else None,
+                    descricao=dados_chamado['descricao'],
+                    data_visita=data_visita
                 )
+                email_evento = enfileirar_email([dados_chamado['email'], EMAIL_TI], email.assunto, email.texto)
 
-                corpo_email = f"""
-Seu chamado foi registrado com sucesso! Aqui estão os detalhes:
-
-Chamado: {codigo_gerado}
-Protocolo: {protocolo_gerado}
-Prioridade: {dados_chamado['prioridade']}
-Nome do solicitante: {dados_chamado['nome_solicitante']}
-Cargo: {dados_chamado['cargo']}
-Unidade: {unidade_nome_completo}
-E-mail: {dados_chamado['email']}
-Telefone: {dados_chamado['telefone']}
-Problema reportado: {problema_nome}{internet_item_texto}
-Descrição: {dados_chamado['descricao']}
-Visita técnica: {visita_tecnica_texto}
-
-⚠️ Caso precise acompanhar o status do chamado, utilize o código acima.
-
-Atenciosamente,
-Suporte Evoque!
-
-Por favor, não responda este e-mail, essa é uma mensagem automática!
-"""
-                destinatarios = [dados_chamado['email'], EMAIL_TI]
-                assunto_email = f"ACADEMIA EVOQUE - CHAMADO #{codigo_gerado}"
-
-                sucesso_email = enviar_email(assunto_email, corpo_email, destinatarios)
-                if not sucesso_email:
-                    current_app.logger.warning(f"Falha ao enviar e-mail para o chamado {codigo_gerado}")
+                db.session.commit()
 
                 return jsonify({
                     'status': 'success',
                     'codigo_chamado': codigo_gerado,
                     'protocolo_chamado': protocolo_gerado,
+                    'email_id': email_evento.id,
                     'notificacao_data': {
                         'id': novo_chamado.id,
                         'codigo': codigo_gerado,
@@ -714,17 +589,19 @@ def internal_error(error):
 from .painel import painel_bp
 ti_bp.register_blueprint(painel_bp, url_prefix='/painel')
 
-# Registrar blueprints de agentes, grupos, auditoria e rotas avançadas
+# Registrar blueprints de agentes, grupos, auditoria, rotas avançadas e fila de emails
 from .agentes import agentes_bp
 from .grupos import grupos_bp
 from .auditoria import auditoria_bp
 from .rotas import rotas_bp
 from .agente_api import agente_api_bp
+from .emails_api import emails_bp
 ti_bp.register_blueprint(agentes_bp, url_prefix='/painel')
 ti_bp.register_blueprint(grupos_bp, url_prefix='/painel')
 ti_bp.register_blueprint(auditoria_bp, url_prefix='/painel')
 ti_bp.register_blueprint(rotas_bp, url_prefix='/painel')
 ti_bp.register_blueprint(agente_api_bp, url_prefix='/painel')
+ti_bp.register_blueprint(emails_bp, url_prefix='/painel')
 
 @ti_bp.route('/debug/dados')
 @login_required
@@ -0,0 +1,118 @@
+"""
+Alocação de códigos de chamado (EVQ-NNNN) e protocolos diários (AAAAMMDD-N)
+
+Cada sequência é uma linha da tabela 'sequencias' incrementada com UPDATE
+atômico numa transação curta e independente da transação do chamado: não há
+varredura da tabela de chamados nem colisão entre requisições/workers, e a
+trava da linha dura apenas o incremento. Com tamanho_bloco > 1 cada processo
+reserva um bloco de números e os entrega da memória (menos acessos ao banco,
+mas a numeração deixa de seguir a ordem de abertura entre workers).
+"""
+import logging
+import threading
+from typing import Callable, Dict, Optional, Tuple
+
+from sqlalchemy import func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+from database import db, Chamado, Sequencia, get_brazil_time
+
+logger = logging.getLogger(__name__)
+
+SEQUENCIA_CODIGO_CHAMADO = 'chamado_codigo'
+PREFIXO_SEQUENCIA_PROTOCOLO = 'protocolo_'
+TENTATIVAS_CRIACAO = 3
+
+
+class AlocadorSequencias:
+    """Entrega números crescentes por sequência, sem colisões entre processos"""
+
+    def __init__(self, tamanho_bloco: int = 1):
+        self.tamanho_bloco = max(1, int(tamanho_bloco))
+        # nome -> (próximo número, último número do bloco reservado)
+        self._blocos: Dict[str, Tuple[int, int]] = {}
+        self._lock = threading.Lock()
+
+    def proximo(self, nome: str, valor_inicial: Optional[Callable] = None) -> int:
+        """
+        Retorna o próximo número da sequência.
+
+        valor_inicial(conexao) é chamado apenas quando a sequência ainda não
+        existe, para continuar a numeração já usada pelos chamados.
+        """
+        # No SQLite o incremento participa da transação da sessão (ver _reservar) e
+        # pode ser desfeito por um rollback, então não há blocos guardados em memória
+        bloco = 1 if db.engine.dialect.name == 'sqlite' else self.tamanho_bloco
+        if bloco == 1:
+            # Sem bloco em memória não há estado a proteger; segurar o lock enquanto o
+            # banco espera a transação de outra requisição travaria as duas threads
+            return self._reservar(nome, 1, valor_inicial)
+        with self._lock:
+            proximo, ultimo = self._blocos.get(nome, (1, 0))
+            if proximo > ultimo:
+                ultimo = self._reservar(nome, bloco, valor_inicial)
+                proximo = ultimo - bloco + 1
+            if bloco > 1:
+                self._blocos[nome] = (proximo + 1, ultimo)
+            return proximo
+
+    def _incrementar(self, conexao, nome: str, quantidade: int, valor_inicial: Optional[Callable]) -> int:
+        tabela = Sequencia.__table__
+        resultado = conexao.execute(
+            update(tabela).where(tabela.c.nome == nome).values(valor=tabela.c.valor + quantidade)
+        )
+        if resultado.rowcount == 0:
+            inicial = int(valor_inicial(conexao) or 0) if valor_inicial else 0
+            conexao.execute(insert(tabela).values(nome=nome, valor=inicial + quantidade))
+        # A linha está travada por esta transação: o valor lido é o que acabamos de gravar
+        return conexao.execute(select(tabela.c.valor).where(tabela.c.nome == nome)).scalar_one()
+
+    def _reservar(self, nome: str, quantidade: int, valor_inicial: Optional[Callable]) -> int:
+        """Incrementa a sequência e retorna o último número reservado"""
+        if db.engine.dialect.name == 'sqlite':
+            # SQLite tem um único escritor: uma segunda conexão esperaria a transação da sessão
+            return self._incrementar(db.session.connection(), nome, quantidade, valor_inicial)
+
+        for tentativa in range(TENTATIVAS_CRIACAO):
+            try:
+                with db.engine.begin() as conexao:
+                    return self._incrementar(conexao, nome, quantidade, valor_inicial)
+            except IntegrityError:
+                # Outro processo criou a sequência ao mesmo tempo; o UPDATE agora encontra a linha
+                logger.info(f"Sequência {nome} criada concorrentemente, tentando novamente")
+        raise RuntimeError(f"Não foi possível reservar números da sequência {nome}")
+
+
+# Instância global do alocador
+alocador_sequencias = AlocadorSequencias()
+
+
+def _ultimo_codigo_existente(conexao) -> int:
+    """Número do último código EVQ já usado (apenas na criação da sequência)"""
+    codigo = conexao.execute(
+        select(Chamado.codigo).where(Chamado.codigo.like('EVQ-%')).order_by(Chamado.id.desc()).limit(1)
+    ).scalar()
+    try:
+        return int(codigo.split('-')[1]) if codigo else 0
+    except (IndexError, ValueError):
+        return 0
+
+
+def gerar_codigo_chamado() -> str:
+    """Próximo código de chamado no formato EVQ-NNNN"""
+    numero = alocador_sequencias.proximo(SEQUENCIA_CODIGO_CHAMADO, _ultimo_codigo_existente)
+    return f"EVQ-{str(numero).zfill(4)}"
+
+
+def gerar_protocolo() -> str:
+    """Próximo protocolo do dia (horário do Brasil) no formato AAAAMMDD-N"""
+    data_str = get_brazil_time().strftime("%Y%m%d")
+
+    def protocolos_do_dia(conexao) -> int:
+        # Apenas na primeira alocação do dia
+        return conexao.execute(
+            select(func.count()).select_from(Chamado).where(Chamado.protocolo.like(f"{data_str}-%"))
+        ).scalar()
+
+    numero = alocador_sequencias.proximo(f"{PREFIXO_SEQUENCIA_PROTOCOLO}{data_str}", protocolos_do_dia)
+    return f"{data_str}-{numero}"
@@ -0,0 +1,335 @@
+"""
+Cálculo de SLA em lote (vetorizado com NumPy)
+
+Produz os mesmos valores de calcular_sla_chamado_correto, mas para um
+conjunto inteiro de chamados de uma vez, a partir de colunas simples
+(sem carregar entidades ORM).
+"""
+from datetime import datetime, timedelta
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence
+
+import numpy as np
+
+from database import Chamado, db, get_brazil_time
+from setores.ti.calendario_comercial import para_horario_local
+from setores.ti.sla_utils import (
+    carregar_configuracoes_sla,
+    carregar_configuracoes_horario_comercial,
+    obter_calendario_comercial,
+)
+
+# Colunas necessárias para o cálculo, sempre nesta ordem no início de cada tupla
+COLUNAS_SLA = (
+    Chamado.data_abertura,
+    Chamado.data_primeira_resposta,
+    Chamado.data_conclusao,
+    Chamado.status,
+    Chamado.prioridade,
+)
+
+STATUS_FINALIZADOS = ('Concluido', 'Cancelado')
+
+# Percentual do prazo de resolução a partir do qual o chamado fica "Em Risco"
+PERCENTUAL_RISCO = 80
+
+_EPOCH = datetime(1970, 1, 1)
+_EPOCH_ORDINAL = _EPOCH.toordinal()
+_UM_US = timedelta(microseconds=1)
+_US_POR_DIA = 86_400_000_000
+_NAT = np.iinfo(np.int64).min
+# A tabela dobra até cobrir o prazo; além deste tamanho o prazo fica NaT
+MAXIMO_DIAS_TABELA = 366 * 50
+
+
+def obter_limites_sla(config_sla: Dict) -> Dict[str, float]:
+    """Mapa prioridade -> limite de resolução (horas)"""
+    return {
+        'Crítica': config_sla.get('resolucao_critica', 2),
+        'Urgente': config_sla.get('resolucao_urgente', 2),
+        'Alta': config_sla.get('resolucao_alta', 8),
+        'Normal': config_sla.get('resolucao_normal', 24),
+        'Baixa': config_sla.get('resolucao_baixa', 72)
+    }
+
+
+def _microssegundos(valor: Optional[datetime]) -> int:
+    if valor is None:
+        return _NAT
+    if valor.tzinfo is not None:
+        valor = para_horario_local(valor)
+    return (valor - _EPOCH) // _UM_US
+
+
+def _para_microssegundos(valores: Sequence[Optional[datetime]]) -> np.ndarray:
+    """Converte datetimes (horário local) em microssegundos desde 1970; None vira NaT"""
+    return np.fromiter((_microssegundos(v) for v in valores), dtype=np.int64, count=len(valores))
+
+
+def _arredondar(valores: np.ndarray, casas: int) -> np.ndarray:
+    """np.round com desempate igual ao round() do Python"""
+    resultado = np.round(valores, casas)
+    escala = 10 ** casas
+    empates = np.abs(np.mod(valores * escala, 1) - 0.5) < 1e-6
+    if empates.any():
+        resultado[empates] = [round(float(v), casas) for v in valores[empates]]
+    return resultado
+
+
+class _TabelaVetorizada:
+    """Tabela acumulada do calendário como arrays NumPy"""
+
+    def __init__(self, calendario, primeiro: int, ultimo: int):
+        self.calendario = calendario
+        self.inicio_seg = calendario.inicio_seg
+        self._carregar(primeiro, ultimo)
+
+    def _carregar(self, primeiro: int, ultimo: int):
+        base, acumulado = self.calendario.tabela(primeiro, ultimo)
+        self.base = base
+        self.acumulado = np.asarray(acumulado, dtype=np.float64)
+        self.duracoes = np.diff(self.acumulado)
+
+    def posicoes(self, microssegundos: np.ndarray) -> np.ndarray:
+        """Segundos úteis acumulados até cada instante"""
+        dias = microssegundos // _US_POR_DIA
+        segundos = (microssegundos - dias * _US_POR_DIA) / 1_000_000
+        indices = dias + (_EPOCH_ORDINAL - self.base)
+        parcial = np.minimum(np.maximum(segundos - self.inicio_seg, 0.0), self.duracoes[indices])
+        return self.acumulado[indices] + parcial
+
+    def somar(self, posicoes: np.ndarray, segundos: np.ndarray) -> np.ndarray:
+        """Instantes (microssegundos) em que se completam os segundos úteis informados"""
+        alvos = posicoes + segundos
+        resultado = np.full(alvos.shape, _NAT, dtype=np.int64)
+        if not alvos.size:
+            return resultado
+        while self.acumulado[-1] < alvos.max() and len(self.duracoes) < MAXIMO_DIAS_TABELA:
+            self._carregar(self.base, self.base + min(2 * len(self.duracoes), MAXIMO_DIAS_TABELA))
+        alcancados = alvos <= self.acumulado[-1]
+        alvos = alvos[alcancados]
+        indices = np.searchsorted(self.acumulado, alvos, side='left') - 1
+        restante_us = np.round((alvos - self.acumulado[indices]) * 1_000_000).astype(np.int64)
+        inicio_us = int(round(self.inicio_seg * 1_000_000))
+        resultado[alcancados] = (indices + self.base - _EPOCH_ORDINAL) * _US_POR_DIA + inicio_us + restante_us
+        return resultado
+
+
+def calcular_sla_lote(aberturas: Sequence[Optional[datetime]],
+                      primeiras_respostas: Sequence[Optional[datetime]],
+                      conclusoes: Sequence[Optional[datetime]],
+                      status: Sequence[str],
+                      prioridades: Sequence[str],
+                      config_sla: Dict = None,
+                      config_horario: Dict = None,
+                      agora: datetime = None) -> Dict[str, np.ndarray]:
+    """
+    Calcula SLA para vários chamados de uma vez.
+
+    Recebe colunas (listas do mesmo tamanho) e retorna um dicionário de arrays
+    com as mesmas chaves de calcular_sla_chamado_correto. Valores ausentes
+    (ex.: tempo de primeira resposta) aparecem como NaN e prazos como NaT.
+    """
+    if config_sla is None:
+        config_sla = carregar_configuracoes_sla()
+    if config_horario is None:
+        config_horario = carregar_configuracoes_horario_comercial()
+    if agora is None:
+        agora = get_brazil_time()
+
+    calendario = obter_calendario_comercial(config_horario)
+    total = len(aberturas)
+
+    abertura_us = _para_microssegundos(aberturas)
+    resposta_us = _para_microssegundos(primeiras_respostas)
+    conclusao_us = _para_microssegundos(conclusoes)
+    agora_us = int(np.datetime64(para_horario_local(agora), 'us').astype(np.int64))
+    status_arr = np.array(status, dtype=object)
+    prioridade_arr = np.array(prioridades, dtype=object)
+
+    validos = abertura_us != _NAT
+    tem_resposta = validos & (resposta_us != _NAT)
+    finalizados = np.isin(status_arr, STATUS_FINALIZADOS)
+    tem_conclusao = conclusao_us != _NAT
+
+    # Limite de resolução por prioridade
+    limites_map = obter_limites_sla(config_sla)
+    limite_padrao = config_sla.get('resolucao_normal', 24)
+    limites = np.full(total, float(limite_padrao))
+    for prioridade, limite in limites_map.items():
+        limites[prioridade_arr == prioridade] = limite
+    limite_primeira_resposta = config_sla.get('primeira_resposta', 4)
+
+    # Fim do cálculo: data de conclusão para finalizados, agora para os demais
+    fim_us = np.where(finalizados & tem_conclusao, conclusao_us, agora_us)
+
+    # Todas as datas válidas precisam estar cobertas pela tabela acumulada
+    abertura_ok = np.where(validos, abertura_us, agora_us)
+    resposta_ok = np.where(tem_resposta, resposta_us, abertura_ok)
+    fim_ok = np.where(validos, fim_us, agora_us)
+    extremos = np.concatenate([abertura_ok, resposta_ok, fim_ok, [agora_us]])
+    primeiro = int(extremos.min() // _US_POR_DIA) + _EPOCH_ORDINAL
+    ultimo = int(extremos.max() // _US_POR_DIA) + _EPOCH_ORDINAL
+    tabela = _TabelaVetorizada(calendario, primeiro, ultimo)
+
+    pos_abertura = tabela.posicoes(abertura_ok)
+    pos_fim = tabela.posicoes(fim_ok)
+    pos_resposta = tabela.posicoes(resposta_ok)
+
+    def horas_uteis(pos_ini, pos_fim_, ini_us, fim_us_):
+        horas = np.where(fim_us_ > ini_us, (pos_fim_ - pos_ini) / 3600, 0.0)
+        resultado = np.round(horas, 2)
+        empates = np.abs(np.mod(horas * 100, 1) - 0.5) < 1e-6
+        for i in np.nonzero(empates)[0]:
+            # Empate no arredondamento: mesmo desempate do cálculo escalar
+            ini_dt = np.datetime64(int(ini_us[i]), 'us').astype(datetime)
+            fim_dt = np.datetime64(int(fim_us_[i]), 'us').astype(datetime)
+            resultado[i] = calendario.horas_uteis_arredondadas(ini_dt, fim_dt)
+        return resultado
+
+    horas_decorridas = (fim_ok - abertura_ok) / 1_000_000 / 3600
+    horas_uteis_decorridas = horas_uteis(pos_abertura, pos_fim, abertura_ok, fim_ok)
+
+    percentual = np.where(limites > 0, horas_uteis_decorridas / np.where(limites > 0, limites, 1) * 100, 0.0)
+
+    # Primeira resposta
+    tempo_pr = np.full(total, np.nan)
+    tempo_pr_uteis = np.full(total, np.nan)
+    tempo_pr[tem_resposta] = ((resposta_us - abertura_ok) / 1_000_000 / 3600)[tem_resposta]
+    tempo_pr_uteis[tem_resposta] = horas_uteis(pos_abertura, pos_resposta, abertura_ok, resposta_ok)[tem_resposta]
+    sem_resposta_andamento = validos & ~tem_resposta & (status_arr != 'Aberto')
+    tempo_pr[sem_resposta_andamento] = horas_decorridas[sem_resposta_andamento]
+    tempo_pr_uteis[sem_resposta_andamento] = horas_uteis_decorridas[sem_resposta_andamento]
+    violacao_pr = np.where(
+        tem_resposta | sem_resposta_andamento,
+        np.nan_to_num(tempo_pr_uteis) > limite_primeira_resposta,
+        horas_uteis_decorridas > limite_primeira_resposta
+    ) & validos
+
+    # Resolução
+    tempo_resolucao = np.where(finalizados & validos, horas_decorridas, np.nan)
+    tempo_resolucao_uteis = np.where(finalizados & validos, horas_uteis_decorridas, np.nan)
+    violacao_resolucao = (horas_uteis_decorridas > limites) & validos
+
+    sla_status = np.select(
+        [~validos, finalizados & violacao_resolucao, finalizados, violacao_resolucao, percentual >= PERCENTUAL_RISCO],
+        ['Indefinido', 'Violado', 'Cumprido', 'Violado', 'Em Risco'],
+        default='Dentro do Prazo'
+    ).astype(object)
+
+    def prazos(horas: np.ndarray) -> np.ndarray:
+        # Limites não positivos e calendários sem expediente seguem pelo cálculo
+        # escalar (próximo horário comercial, ou a própria abertura)
+        resultado = np.full(total, _NAT, dtype=np.int64)
+        positivos = validos & (horas > 0) & calendario._tem_expediente
+        if positivos.any():
+            resultado[positivos] = tabela.somar(pos_abertura[positivos], horas[positivos] * 3600)
+        for i in np.nonzero(validos & ~positivos)[0]:
+            inicio = np.datetime64(int(abertura_us[i]), 'us').astype(datetime)
+            resultado[i] = _microssegundos(calendario.somar_horas_uteis(inicio, float(horas[i])))
+        return resultado
+
+    prazo_us = prazos(limites)
+    prazo_risco_us = prazos(limites * PERCENTUAL_RISCO / 100)
+    prazo_pr_us = prazos(np.full(total, float(limite_primeira_resposta)))
+
+    def opcional(valores):
+        # Tempos zerados são tratados como ausentes (None no cálculo escalar)
+        return np.where(valores != 0, _arredondar(valores, 2), np.nan)
+
+    zeros = np.zeros(total)
+    return {
+        'valido': validos,
+        'horas_decorridas': np.where(validos, _arredondar(horas_decorridas, 2), zeros),
+        'horas_uteis_decorridas': np.where(validos, horas_uteis_decorridas, zeros),
+        'tempo_primeira_resposta': opcional(tempo_pr),
+        'tempo_primeira_resposta_uteis': opcional(tempo_pr_uteis),
+        'tempo_resolucao': opcional(tempo_resolucao),
+        'tempo_resolucao_uteis': opcional(tempo_resolucao_uteis),
+        'sla_limite': limites,
+        'sla_prazo_expiracao': prazo_us.astype('datetime64[us]'),
+        'sla_prazo_risco': prazo_risco_us.astype('datetime64[us]'),
+        'sla_prazo_primeira_resposta': prazo_pr_us.astype('datetime64[us]'),
+        'sla_status': sla_status,
+        'violacao_primeira_resposta': violacao_pr,
+        'violacao_resolucao': violacao_resolucao,
+        'prioridade': prioridade_arr,
+        'percentual_tempo_usado': np.where(validos, _arredondar(percentual, 1), zeros),
+    }
+
+
+def buscar_colunas_sla(*filtros, extras: Iterable = (), ordenacao: Iterable = (),
+                       limite: Optional[int] = None) -> List[tuple]:
+    """
+    Busca tuplas com as colunas de SLA (COLUNAS_SLA) seguidas das colunas extras.
+
+    Usa consulta por colunas, sem instanciar objetos Chamado.
+    """
+    consulta = db.session.query(*COLUNAS_SLA, *extras)
+    if filtros:
+        consulta = consulta.filter(*filtros)
+    ordenacao = tuple(ordenacao)
+    if ordenacao:
+        consulta = consulta.order_by(*ordenacao)
+    if limite is not None:
+        consulta = consulta.limit(limite)
+    return consulta.all()
+
+
+def iterar_colunas_sla(*filtros, extras: Iterable = (), ordenacao: Iterable = (),
+                       tamanho_lote: int = 1000) -> Iterator[List[tuple]]:
+    """
+    Como buscar_colunas_sla, mas lê com cursor do servidor (stream_results) e
+    entrega lotes de até tamanho_lote tuplas, sem carregar a tabela inteira.
+    """
+    consulta = db.session.query(*COLUNAS_SLA, *extras)
+    if filtros:
+        consulta = consulta.filter(*filtros)
+    ordenacao = tuple(ordenacao)
+    if ordenacao:
+        consulta = consulta.order_by(*ordenacao)
+    linhas = iter(consulta.yield_per(tamanho_lote))
+    while True:
+        lote = list(islice(linhas, tamanho_lote))
+        if not lote:
+            return
+        yield lote
+
+
+def calcular_sla_linhas(linhas: Sequence[tuple], config_sla: Dict = None,
+                        config_horario: Dict = None, agora: datetime = None) -> Dict[str, np.ndarray]:
+    """Calcula SLA em lote para tuplas retornadas por buscar_colunas_sla"""
+    if linhas:
+        aberturas, respostas, conclusoes, status, prioridades = list(zip(*linhas))[:5]
+    else:
+        aberturas = respostas = conclusoes = status = prioridades = ()
+    return calcular_sla_lote(aberturas, respostas, conclusoes, status, prioridades,
+                             config_sla, config_horario, agora)
+
+
+def _valor_opcional(valor: float) -> Optional[float]:
+    """NaN (tempo ausente) vira None"""
+    if np.isnan(valor):
+        return None
+    return float(valor)
+
+
+def sla_info_do_lote(resultado: Dict[str, np.ndarray], indice: int) -> Dict:
+    """Monta, para um chamado, o mesmo dicionário de calcular_sla_chamado_correto"""
+    prazo = resultado['sla_prazo_expiracao'][indice]
+    limite = float(resultado['sla_limite'][indice])
+    return {
+        'horas_decorridas': float(resultado['horas_decorridas'][indice]),
+        'horas_uteis_decorridas': float(resultado['horas_uteis_decorridas'][indice]),
+        'tempo_primeira_resposta': _valor_opcional(resultado['tempo_primeira_resposta'][indice]),
+        'tempo_primeira_resposta_uteis': _valor_opcional(resultado['tempo_primeira_resposta_uteis'][indice]),
+        'tempo_resolucao': _valor_opcional(resultado['tempo_resolucao'][indice]),
+        'tempo_resolucao_uteis': _valor_opcional(resultado['tempo_resolucao_uteis'][indice]),
+        'sla_limite': int(limite) if limite.is_integer() else limite,
+        'sla_prazo_expiracao': prazo.astype(datetime).strftime('%d/%m/%Y %H:%M:%S') if not np.isnat(prazo) else None,
+        'sla_status': resultado['sla_status'][indice],
+        'violacao_primeira_resposta': bool(resultado['violacao_primeira_resposta'][indice]),
+        'violacao_resolucao': bool(resultado['violacao_resolucao'][indice]),
+        'prioridade': resultado['prioridade'][indice],
+        'percentual_tempo_usado': float(resultado['percentual_tempo_usado'][indice])
+    }
@@ -0,0 +1,366 @@
+"""
+Monitor de prazos de SLA em segundo plano
+
+Mantém os chamados em andamento num min-heap ordenado pelo próximo limite
+(80% do prazo, violação da primeira resposta ou violação da resolução) e
+dorme até o limite mais próximo. Ao cruzar um limite grava um HistoricoSLA
+e emite 'sla_alerta' via Socket.IO. A tabela de chamados é lida uma única
+vez na inicialização; depois disso o heap é alimentado pelos commits que
+alteram chamados e pelos recálculos em massa (reagendar_recalculados). Um
+recálculo concluído em outro processo faz o heap ser recarregado na próxima
+leitura da configuração (a cada intervalo_verificacao).
+"""
+import heapq
+import json
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import event, or_, update
+from sqlalchemy.orm import Session
+
+from database import db, Chamado, HistoricoSLA, Configuracao, SlaRebaselineJob, User, get_brazil_time
+
+logger = logging.getLogger(__name__)
+
+# Tipos de limite monitorados
+LIMITE_RISCO = 'sla_em_risco'
+LIMITE_PRIMEIRA_RESPOSTA = 'violacao_primeira_resposta'
+LIMITE_RESOLUCAO = 'violacao_resolucao'
+
+STATUS_FINALIZADOS = ('Concluido', 'Cancelado')
+
+# Padrões de CONFIGURACOES_PADRAO['notificacoes']
+NOTIFICAR_SLA_RISCO_PADRAO = True
+INTERVALO_VERIFICACAO_PADRAO = 15  # minutos
+
+
+def _agora_local() -> datetime:
+    return get_brazil_time().replace(tzinfo=None)
+
+
+class MonitorSLA:
+    """Agenda e dispara eventos de SLA a partir dos prazos materializados do chamado"""
+
+    def __init__(self):
+        self._heap: List[Tuple[datetime, int, str, int]] = []
+        self._versoes: Dict[int, int] = {}
+        self._contador = 0
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._app = None
+        self._notificar = NOTIFICAR_SLA_RISCO_PADRAO
+        self._intervalo = INTERVALO_VERIFICACAO_PADRAO * 60
+        self._proxima_leitura_config = None
+        self._usuario_sistema_id = None
+        self._ultimo_recalculo = None
+
+    @property
+    def ativo(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def iniciar(self, app):
+        """Carrega os chamados em andamento e inicia a thread do monitor"""
+        if self.ativo:
+            return
+        self._app = app
+        try:
+            with app.app_context():
+                self._carregar_configuracao()
+                self._ultimo_recalculo = self._ler_ultimo_recalculo()
+                self._carregar_chamados_em_andamento()
+        except Exception as e:
+            logger.error(f"Erro ao inicializar monitor de SLA: {str(e)}")
+            return
+
+        self._thread = threading.Thread(target=self._executar, name='monitor-sla', daemon=True)
+        self._thread.start()
+        logger.info(f"Monitor de SLA iniciado com {len(self._versoes)} chamados agendados")
+
+    def agendar(self, chamado_id: int, status: str, sla_status: Optional[str],
+                prazo_risco: Optional[datetime], prazo_primeira_resposta: Optional[datetime],
+                prazo_resolucao: Optional[datetime], data_primeira_resposta: Optional[datetime]):
+        """
+        (Re)agenda os próximos limites de um chamado.
+
+        Entradas anteriores do mesmo chamado continuam no heap, mas são
+        descartadas ao sair dele porque a versão não confere mais.
+        """
+        limites = []
+        if status not in STATUS_FINALIZADOS:
+            if prazo_risco and sla_status not in ('Em Risco', 'Violado'):
+                limites.append((prazo_risco, LIMITE_RISCO))
+            # Após sair de 'Aberto' a primeira resposta é considerada dada
+            if prazo_primeira_resposta and data_primeira_resposta is None and status == 'Aberto':
+                limites.append((prazo_primeira_resposta, LIMITE_PRIMEIRA_RESPOSTA))
+            if prazo_resolucao and sla_status != 'Violado':
+                limites.append((prazo_resolucao, LIMITE_RESOLUCAO))
+
+        with self._cond:
+            if not limites:
+                self._versoes.pop(chamado_id, None)
+                return
+            self._contador += 1
+            versao = self._contador
+            self._versoes[chamado_id] = versao
+            for instante, tipo in limites:
+                heapq.heappush(self._heap, (instante, chamado_id, tipo, versao))
+            self._cond.notify()
+
+    def remover(self, chamado_id: int):
+        with self._cond:
+            self._versoes.pop(chamado_id, None)
+
+    def _carregar_configuracao(self):
+        """Lê notificar_sla_risco e intervalo_verificacao da configuração 'notificacoes'"""
+        notificar = NOTIFICAR_SLA_RISCO_PADRAO
+        intervalo = INTERVALO_VERIFICACAO_PADRAO
+        try:
+            config = Configuracao.query.filter_by(chave='notificacoes').first()
+            if config:
+                dados = json.loads(config.valor)
+                notificar = bool(dados.get('notificar_sla_risco', notificar))
+                intervalo = int(dados.get('intervalo_verificacao', intervalo) or intervalo)
+        except Exception as e:
+            logger.warning(f"Erro ao ler configurações de notificação do monitor de SLA: {str(e)}")
+        finally:
+            db.session.remove()
+
+        self._notificar = notificar
+        self._intervalo = max(intervalo, 1) * 60
+        self._proxima_leitura_config = _agora_local() + timedelta(seconds=self._intervalo)
+
+    def _ler_ultimo_recalculo(self) -> Optional[datetime]:
+        try:
+            return db.session.query(db.func.max(SlaRebaselineJob.data_conclusao)).filter(
+                SlaRebaselineJob.status == 'concluido'
+            ).scalar()
+        finally:
+            db.session.remove()
+
+    def _verificar_recalculo(self):
+        """Recarrega o heap quando um recálculo de SLA terminou desde a última verificação"""
+        try:
+            ultimo = self._ler_ultimo_recalculo()
+            if ultimo and ultimo != self._ultimo_recalculo:
+                self._ultimo_recalculo = ultimo
+                self._carregar_chamados_em_andamento()
+                logger.info("Monitor de SLA recarregado após recálculo dos prazos")
+        except Exception as e:
+            logger.warning(f"Erro ao verificar recálculos de SLA: {str(e)}")
+
+    def _carregar_chamados_em_andamento(self):
+        linhas = db.session.query(
+            Chamado.id, Chamado.status, Chamado.sla_status, Chamado.sla_prazo_risco,
+            Chamado.sla_prazo_primeira_resposta, Chamado.sla_prazo_resolucao,
+            Chamado.data_primeira_resposta
+        ).filter(~Chamado.status.in_(STATUS_FINALIZADOS)).all()
+        db.session.remove()
+        for linha in linhas:
+            self.agendar(*linha)
+
+    def _retirar_vencidos(self, agora: datetime) -> List[Tuple[datetime, int, str, int]]:
+        """Remove do heap os limites vencidos e ainda válidos (chamar com o lock)"""
+        vencidos = []
+        while self._heap and self._heap[0][0] <= agora:
+            item = heapq.heappop(self._heap)
+            if self._versoes.get(item[1]) == item[3]:
+                vencidos.append(item)
+        return vencidos
+
+    def _executar(self):
+        while True:
+            try:
+                with self._cond:
+                    agora = _agora_local()
+                    vencidos = self._retirar_vencidos(agora)
+                    if not vencidos:
+                        espera = self._intervalo
+                        if self._heap:
+                            espera = min(espera, (self._heap[0][0] - agora).total_seconds())
+                        if espera > 0:
+                            self._cond.wait(espera)
+
+                with self._app.app_context():
+                    if _agora_local() >= self._proxima_leitura_config:
+                        self._carregar_configuracao()
+                        self._verificar_recalculo()
+                    if vencidos:
+                        self._processar(vencidos)
+            except Exception as e:
+                logger.error(f"Erro no monitor de SLA: {str(e)}")
+
+    def _obter_usuario_sistema(self) -> Optional[int]:
+        """Usuário atribuído aos registros automáticos (HistoricoSLA exige usuario_id)"""
+        if self._usuario_sistema_id is None:
+            usuario = User.query.filter_by(usuario='admin').first() or \
+                User.query.filter_by(nivel_acesso='Administrador').first()
+            self._usuario_sistema_id = usuario.id if usuario else None
+        return self._usuario_sistema_id
+
+    def _processar(self, vencidos):
+        from setores.ti.sla_utils import carregar_configuracoes_sla
+        from setores.ti.sla_lote import obter_limites_sla
+
+        config_sla = carregar_configuracoes_sla()
+        limites_resolucao = obter_limites_sla(config_sla)
+
+        try:
+            for instante, chamado_id, tipo, _ in vencidos:
+                evento = self._registrar_limite(chamado_id, tipo, instante, config_sla, limites_resolucao)
+                if evento and self._notificar:
+                    self._emitir(evento)
+        finally:
+            db.session.remove()
+
+    def _registrar_limite(self, chamado_id, tipo, instante, config_sla, limites_resolucao) -> Optional[Dict]:
+        """Grava a transição do chamado; retorna o evento a emitir ou None se já tratada"""
+        try:
+            chamado = db.session.get(Chamado, chamado_id)
+            if not chamado or chamado.status in STATUS_FINALIZADOS:
+                return None
+
+            # A entrada do heap pode ser antiga (prioridade, pausa ou recálculo gravados
+            # por outro processo): vale o prazo gravado no chamado agora
+            agora = _agora_local()
+            status_anterior = chamado.sla_status
+            if tipo == LIMITE_PRIMEIRA_RESPOSTA:
+                if chamado.data_primeira_resposta is not None or chamado.status != 'Aberto':
+                    return None
+                prazo = chamado.sla_prazo_primeira_resposta
+                if prazo is None or prazo > agora:
+                    self._reagendar(chamado_id)
+                    return None
+                if HistoricoSLA.query.filter_by(chamado_id=chamado_id, acao=tipo).first():
+                    return None
+                status_novo = status_anterior
+                limite_horas = config_sla.get('primeira_resposta', 4)
+            else:
+                # Atualização condicional: apenas um processo/worker registra a transição
+                status_novo = 'Em Risco' if tipo == LIMITE_RISCO else 'Violado'
+                ja_registrados = ['Em Risco', 'Violado'] if tipo == LIMITE_RISCO else ['Violado']
+                coluna_prazo = Chamado.sla_prazo_risco if tipo == LIMITE_RISCO else Chamado.sla_prazo_resolucao
+                resultado = db.session.execute(
+                    update(Chamado)
+                    .where(Chamado.id == chamado_id)
+                    .where(~Chamado.status.in_(STATUS_FINALIZADOS))
+                    .where(or_(Chamado.sla_status.is_(None), ~Chamado.sla_status.in_(ja_registrados)))
+                    .where(coluna_prazo <= agora)
+                    .values(sla_status=status_novo)
+                    .execution_options(synchronize_session=False)
+                )
+                if resultado.rowcount != 1:
+                    db.session.rollback()
+                    prazo = db.session.query(coluna_prazo).filter(Chamado.id == chamado_id).scalar()
+                    if prazo is not None and prazo > agora:
+                        self._reagendar(chamado_id)
+                    return None
+                limite_horas = limites_resolucao.get(chamado.prioridade, config_sla.get('resolucao_normal', 24))
+
+            usuario_id = self._obter_usuario_sistema()
+            if usuario_id:
+                db.session.add(HistoricoSLA(
+                    chamado_id=chamado_id,
+                    usuario_id=usuario_id,
+                    acao=tipo,
+                    status_anterior=status_anterior,
+                    status_novo=status_novo,
+                    limite_sla_horas=limite_horas,
+                    status_sla=status_novo,
+                    observacoes=f'Registrado automaticamente pelo monitor de SLA (limite em {instante.strftime("%d/%m/%Y %H:%M")})'
+                ))
+            else:
+                logger.warning("Nenhum usuário administrador para registrar histórico de SLA")
+            db.session.commit()
+
+            return {
+                'chamado_id': chamado.id,
+                'codigo': chamado.codigo,
+                'solicitante': chamado.solicitante,
+                'prioridade': chamado.prioridade,
+                'tipo': tipo,
+                'sla_status': status_novo,
+                'limite': instante.isoformat(),
+                'timestamp': get_brazil_time().isoformat()
+            }
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Erro ao registrar limite de SLA do chamado {chamado_id}: {str(e)}")
+            return None
+
+    def _reagendar(self, chamado_id: int):
+        """Agenda o chamado de novo com os prazos gravados no banco"""
+        linha = db.session.query(
+            Chamado.id, Chamado.status, Chamado.sla_status, Chamado.sla_prazo_risco,
+            Chamado.sla_prazo_primeira_resposta, Chamado.sla_prazo_resolucao,
+            Chamado.data_primeira_resposta
+        ).filter(Chamado.id == chamado_id).first()
+        if linha:
+            self.agendar(*linha)
+
+    def _emitir(self, evento: Dict):
+        try:
+            if hasattr(self._app, 'socketio'):
+                self._app.socketio.emit('sla_alerta', evento)
+        except Exception as socket_error:
+            logger.warning(f"Erro ao emitir evento Socket.IO: {str(socket_error)}")
+
+
+# Instância global do monitor
+monitor_sla = MonitorSLA()
+
+
+@event.listens_for(Session, 'after_flush')
+def _coletar_chamados_alterados(session, flush_context):
+    """Guarda os prazos dos chamados gravados para reagendar após o commit"""
+    if not monitor_sla.ativo:
+        return
+    alterados = session.info.setdefault('monitor_sla', {})
+    for obj in session.new.union(session.dirty):
+        if isinstance(obj, Chamado) and obj.id is not None:
+            alterados[obj.id] = (
+                obj.status, obj.sla_status, obj.sla_prazo_risco,
+                obj.sla_prazo_primeira_resposta, obj.sla_prazo_resolucao,
+                obj.data_primeira_resposta
+            )
+    for obj in session.deleted:
+        if isinstance(obj, Chamado) and obj.id is not None:
+            alterados[obj.id] = None
+
+
+@event.listens_for(Session, 'after_commit')
+def _reagendar_chamados_alterados(session):
+    alterados = session.info.pop('monitor_sla', None)
+    if not alterados:
+        return
+    for chamado_id, dados in alterados.items():
+        if dados is None:
+            monitor_sla.remover(chamado_id)
+        else:
+            monitor_sla.agendar(chamado_id, *dados)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _descartar_chamados_alterados(session):
+    session.info.pop('monitor_sla', None)
+
+
+def reagendar_recalculados(linhas, valores: List[Dict]):
+    """
+    Reagenda os chamados em andamento de um lote regravado em massa.
+
+    bulk_update_mappings não passa pelo flush observado acima; chamar depois do
+    commit do lote. linhas são as tuplas de buscar_colunas_sla (data_primeira_resposta
+    na posição 1, status na 3) e valores os dicionários gravados, na mesma ordem.
+    """
+    if not monitor_sla.ativo:
+        return
+    for linha, valor in zip(linhas, valores):
+        status = linha[3]
+        if status in STATUS_FINALIZADOS:
+            continue
+        monitor_sla.agendar(
+            valor['id'], status, valor['sla_status'], valor['sla_prazo_risco'],
+            valor['sla_prazo_primeira_resposta'], valor['sla_prazo_resolucao'], linha[1]
+        )
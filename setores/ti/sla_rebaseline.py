@@ -0,0 +1,247 @@
+"""
+Recálculo assíncrono do SLA (re-baseline) após mudança nas regras
+
+Quando limites de SLA ou o horário comercial mudam, os prazos e status
+materializados de todos os chamados precisam ser refeitos. Em vez de fazer
+isso dentro da requisição do administrador, um job é gravado na tabela
+sla_rebaseline_job e executado em segundo plano: os chamados são lidos em
+lotes ordenados por id, calculados com calcular_sla_linhas (vetorizado) na
+própria thread e gravados com commit por lote. O último id gravado fica no job, então um job interrompido
+(reinício do servidor) continua de onde parou. O progresso é emitido via
+Socket.IO ('sla_rebaseline_progresso') e, ao final, o agregado diário é
+reconstruído.
+"""
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from sqlalchemy import and_, or_, update
+
+from database import db, Chamado, SlaRebaselineJob, get_brazil_time
+from setores.ti.sla_monitor import reagendar_recalculados
+from setores.ti.sla_rollup import reconstruir_sla_rollup
+
+logger = logging.getLogger(__name__)
+
+TAMANHO_LOTE = 2000
+PAUSA_ENTRE_LOTES = 0.05  # segundos, para não saturar o banco
+# Job 'executando' sem heartbeat por esse tempo é considerado interrompido e retomado
+TEMPO_HEARTBEAT = timedelta(minutes=2)
+INTERVALO_VERIFICACAO = 60  # segundos entre buscas por jobs de outros workers
+
+STATUS_ATIVOS = ('pendente', 'executando')
+
+
+def _agora_local() -> datetime:
+    return get_brazil_time().replace(tzinfo=None)
+
+
+def _calcular_bloco(linhas: List[tuple], config_sla: Dict, config_horario: Dict, agora: datetime) -> List[Dict]:
+    """Calcula os campos de SLA materializados de um lote"""
+    from setores.ti.sla_lote import calcular_sla_linhas
+    from setores.ti.sla_utils import _para_datetime
+
+    sla = calcular_sla_linhas(linhas, config_sla, config_horario, agora)
+    return [
+        {
+            'id': linha[5],
+            'sla_prazo_primeira_resposta': _para_datetime(sla['sla_prazo_primeira_resposta'][i]),
+            'sla_prazo_resolucao': _para_datetime(sla['sla_prazo_expiracao'][i]),
+            'sla_prazo_risco': _para_datetime(sla['sla_prazo_risco'][i]),
+            'sla_status': sla['sla_status'][i],
+        }
+        for i, linha in enumerate(linhas)
+    ]
+
+
+class ExecutorRebaselineSLA:
+    """Executa em segundo plano os jobs de recálculo de SLA gravados no banco"""
+
+    def __init__(self, tamanho_lote: int = TAMANHO_LOTE):
+        self.tamanho_lote = tamanho_lote
+        self._cond = threading.Condition()
+        self._acordar = False
+        self._thread: Optional[threading.Thread] = None
+        self._app = None
+
+    @property
+    def ativo(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def iniciar(self, app):
+        """Inicia a thread que executa (e retoma) jobs pendentes"""
+        if self.ativo:
+            return
+        self._app = app
+        self._thread = threading.Thread(target=self._executar, name='rebaseline-sla', daemon=True)
+        self._thread.start()
+        logger.info("Executor de recálculo de SLA iniciado")
+
+    def agendar(self, usuario_id: Optional[int] = None) -> SlaRebaselineJob:
+        """
+        Cria um job de recálculo e acorda o executor.
+
+        Jobs ainda ativos são marcados como substituídos: o novo job recalcula
+        tudo com as regras mais recentes.
+        """
+        db.session.execute(
+            update(SlaRebaselineJob)
+            .where(SlaRebaselineJob.status.in_(STATUS_ATIVOS))
+            .values(status='substituido', data_conclusao=_agora_local())
+            .execution_options(synchronize_session=False)
+        )
+        job = SlaRebaselineJob(
+            status='pendente',
+            usuario_id=usuario_id,
+            total_chamados=db.session.query(Chamado.id).count()
+        )
+        db.session.add(job)
+        db.session.commit()
+
+        with self._cond:
+            self._acordar = True
+            self._cond.notify()
+        return job
+
+    def _executar(self):
+        while True:
+            with self._cond:
+                self._acordar = False
+            try:
+                with self._app.app_context():
+                    job_id = self._reservar_proximo_job()
+                    if job_id:
+                        self._processar_job(job_id)
+                        continue
+            except Exception as e:
+                logger.error(f"Erro no executor de recálculo de SLA: {str(e)}")
+            with self._cond:
+                # Um job agendado durante a busca não pode ser perdido
+                if not self._acordar:
+                    self._cond.wait(INTERVALO_VERIFICACAO)
+
+    def _reservar_proximo_job(self) -> Optional[int]:
+        """Reserva um job pendente (ou interrompido) com UPDATE condicional entre workers"""
+        try:
+            agora = _agora_local()
+            candidatos = db.session.query(SlaRebaselineJob.id).filter(
+                SlaRebaselineJob.status.in_(STATUS_ATIVOS)
+            ).order_by(SlaRebaselineJob.id).all()
+
+            for (job_id,) in candidatos:
+                resultado = db.session.execute(
+                    update(SlaRebaselineJob)
+                    .where(SlaRebaselineJob.id == job_id)
+                    .where(or_(
+                        SlaRebaselineJob.status == 'pendente',
+                        and_(
+                            SlaRebaselineJob.status == 'executando',
+                            or_(SlaRebaselineJob.data_heartbeat.is_(None),
+                                SlaRebaselineJob.data_heartbeat < agora - TEMPO_HEARTBEAT)
+                        )
+                    ))
+                    .values(status='executando', data_heartbeat=agora,
+                            data_inicio=db.func.coalesce(SlaRebaselineJob.data_inicio, agora))
+                    .execution_options(synchronize_session=False)
+                )
+                db.session.commit()
+                if resultado.rowcount == 1:
+                    return job_id
+            return None
+        finally:
+            db.session.remove()
+
+    def _processar_job(self, job_id: int):
+        from setores.ti.sla_lote import buscar_colunas_sla
+        from setores.ti.sla_utils import carregar_configuracoes_sla, carregar_configuracoes_horario_comercial
+
+        job = db.session.get(SlaRebaselineJob, job_id)
+        ultimo_lido = job.ultimo_id
+        logger.info(f"Recálculo de SLA {job_id} iniciado a partir do chamado {ultimo_lido}")
+
+        config_sla = carregar_configuracoes_sla()
+        config_horario = carregar_configuracoes_horario_comercial()
+        agora = get_brazil_time()
+        db.session.commit()
+
+        try:
+            while True:
+                linhas = buscar_colunas_sla(
+                    Chamado.id > ultimo_lido,
+                    extras=(Chamado.id,),
+                    ordenacao=(Chamado.id,),
+                    limite=self.tamanho_lote
+                )
+                db.session.commit()
+                if not linhas:
+                    break
+                ultimo_lido = linhas[-1][5]
+
+                valores = _calcular_bloco(linhas, config_sla, config_horario, agora)
+                if not self._gravar_lote(job_id, valores, ultimo_lido, len(linhas)):
+                    logger.info(f"Recálculo de SLA {job_id} substituído por um job mais recente")
+                    return
+                reagendar_recalculados(linhas, valores)
+                time.sleep(PAUSA_ENTRE_LOTES)
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Erro no recálculo de SLA {job_id}: {str(e)}")
+            self._finalizar(job_id, 'erro', str(e))
+            return
+
+        try:
+            reconstruir_sla_rollup()
+        except Exception as e:
+            self._finalizar(job_id, 'erro', f'Erro ao reconstruir agregado diário: {str(e)}')
+            return
+        self._finalizar(job_id, 'concluido')
+        logger.info(f"Recálculo de SLA {job_id} concluído")
+
+    def _gravar_lote(self, job_id: int, valores: List[Dict], ultimo_id: int, quantidade: int) -> bool:
+        """Grava o lote e o checkpoint na mesma transação; False se o job não é mais o ativo"""
+        resultado = db.session.execute(
+            update(SlaRebaselineJob)
+            .where(SlaRebaselineJob.id == job_id, SlaRebaselineJob.status == 'executando')
+            .values(
+                ultimo_id=ultimo_id,
+                chamados_processados=SlaRebaselineJob.chamados_processados + quantidade,
+                data_heartbeat=_agora_local()
+            )
+            .execution_options(synchronize_session=False)
+        )
+        if resultado.rowcount != 1:
+            db.session.rollback()
+            return False
+
+        db.session.bulk_update_mappings(Chamado, valores)
+        db.session.commit()
+        self._emitir_progresso(job_id)
+        return True
+
+    def _finalizar(self, job_id: int, status: str, erro: Optional[str] = None):
+        try:
+            db.session.execute(
+                update(SlaRebaselineJob)
+                .where(SlaRebaselineJob.id == job_id, SlaRebaselineJob.status == 'executando')
+                .values(status=status, erro=erro, data_conclusao=_agora_local())
+                .execution_options(synchronize_session=False)
+            )
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Erro ao finalizar recálculo de SLA {job_id}: {str(e)}")
+        self._emitir_progresso(job_id)
+
+    def _emitir_progresso(self, job_id: int):
+        try:
+            job = db.session.get(SlaRebaselineJob, job_id, populate_existing=True)
+            if job and hasattr(self._app, 'socketio'):
+                self._app.socketio.emit('sla_rebaseline_progresso', job.to_dict())
+        except Exception as socket_error:
+            logger.warning(f"Erro ao emitir evento Socket.IO: {str(socket_error)}")
+
+
+# Instância global do executor
+executor_rebaseline_sla = ExecutorRebaselineSLA()
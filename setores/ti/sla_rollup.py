@@ -0,0 +1,253 @@
+"""
+Agregado diário de SLA (tabela sla_rollup_diario)
+
+Cada linha soma os chamados finalizados abertos num dia, por prioridade e
+unidade. A tabela é atualizada de forma incremental no mesmo flush em que um
+chamado é finalizado (ou reaberto, alterado ou excluído) e pode ser
+reconstruída por completo com reconstruir_sla_rollup(). Métricas de período
+passam a ser um SUM sobre poucas linhas em vez de recalcular cada chamado.
+"""
+import logging
+from collections import defaultdict
+from datetime import date, datetime
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+from sqlalchemy import event, func, inspect as sa_inspect, update
+from sqlalchemy.orm import Session
+
+from database import db, Chamado, SlaRollupDiario, get_brazil_time
+from setores.ti.sla_lote import (
+    PERCENTUAL_RISCO, STATUS_FINALIZADOS, buscar_colunas_sla, calcular_sla_linhas
+)
+
+logger = logging.getLogger(__name__)
+
+CAMPOS_ROLLUP = (
+    'chamados_finalizados',
+    'chamados_cumpridos',
+    'chamados_violados',
+    'chamados_em_risco',
+    'soma_horas_primeira_resposta',
+    'qtd_primeira_resposta',
+    'soma_horas_resolucao',
+    'qtd_resolucao',
+)
+
+# Colunas do chamado que influenciam o agregado (as cinco primeiras seguem COLUNAS_SLA)
+CAMPOS_CHAMADO_ROLLUP = ('data_abertura', 'data_primeira_resposta', 'data_conclusao', 'status', 'prioridade', 'unidade')
+
+ChaveRollup = Tuple[date, str, str]
+
+
+def _contribuicoes(linhas: List[tuple], config_sla: Dict, config_horario: Dict,
+                   sinal: int = 1, agora: datetime = None) -> Dict[ChaveRollup, Dict[str, float]]:
+    """Soma a contribuição de chamados finalizados (tuplas de CAMPOS_CHAMADO_ROLLUP) por chave"""
+    deltas: Dict[ChaveRollup, Dict[str, float]] = defaultdict(lambda: dict.fromkeys(CAMPOS_ROLLUP, 0))
+    linhas = [l for l in linhas if l[0] is not None and l[3] in STATUS_FINALIZADOS]
+    if not linhas:
+        return deltas
+
+    sla = calcular_sla_linhas(linhas, config_sla, config_horario, agora)
+    for i, linha in enumerate(linhas):
+        data_abertura, _, _, _, prioridade, unidade = linha[:6]
+        delta = deltas[(data_abertura.date(), prioridade or '', unidade or '')]
+        status = sla['sla_status'][i]
+
+        delta['chamados_finalizados'] += sinal
+        if status == 'Cumprido':
+            delta['chamados_cumpridos'] += sinal
+            if sla['percentual_tempo_usado'][i] >= PERCENTUAL_RISCO:
+                delta['chamados_em_risco'] += sinal
+        elif status == 'Violado':
+            delta['chamados_violados'] += sinal
+
+        # Como nas médias do painel, apenas tempos preenchidos e diferentes de zero
+        primeira_resposta = sla['tempo_primeira_resposta_uteis'][i]
+        if not np.isnan(primeira_resposta) and primeira_resposta:
+            delta['soma_horas_primeira_resposta'] += sinal * float(primeira_resposta)
+            delta['qtd_primeira_resposta'] += sinal
+
+        resolucao = sla['tempo_resolucao_uteis'][i]
+        if not np.isnan(resolucao) and resolucao:
+            delta['soma_horas_resolucao'] += sinal * float(resolucao)
+            delta['qtd_resolucao'] += sinal
+
+    return deltas
+
+
+def _combinar(*grupos: Dict[ChaveRollup, Dict[str, float]]) -> Dict[ChaveRollup, Dict[str, float]]:
+    total: Dict[ChaveRollup, Dict[str, float]] = defaultdict(lambda: dict.fromkeys(CAMPOS_ROLLUP, 0))
+    for grupo in grupos:
+        for chave, valores in grupo.items():
+            for campo, valor in valores.items():
+                total[chave][campo] += valor
+    return total
+
+
+def _aplicar_deltas(conexao, deltas: Dict[ChaveRollup, Dict[str, float]]):
+    """Soma os deltas nas linhas do agregado com upsert atômico (sem corrida entre workers)"""
+    tabela = SlaRollupDiario.__table__
+    agora = get_brazil_time().replace(tzinfo=None)
+    dialeto = conexao.dialect.name
+
+    for (dia, prioridade, unidade), valores in deltas.items():
+        if not any(valores.values()):
+            continue
+        linha = dict(valores, dia=dia, prioridade=prioridade, unidade=unidade, data_atualizacao=agora)
+
+        if dialeto == 'mysql':
+            from sqlalchemy.dialects.mysql import insert
+            stmt = insert(tabela).values(**linha)
+            stmt = stmt.on_duplicate_key_update(
+                data_atualizacao=stmt.inserted.data_atualizacao,
+                **{campo: tabela.c[campo] + stmt.inserted[campo] for campo in CAMPOS_ROLLUP}
+            )
+            conexao.execute(stmt)
+        elif dialeto in ('sqlite', 'postgresql'):
+            if dialeto == 'sqlite':
+                from sqlalchemy.dialects.sqlite import insert
+            else:
+                from sqlalchemy.dialects.postgresql import insert
+            stmt = insert(tabela).values(**linha)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=['dia', 'prioridade', 'unidade'],
+                set_=dict(
+                    data_atualizacao=stmt.excluded.data_atualizacao,
+                    **{campo: tabela.c[campo] + stmt.excluded[campo] for campo in CAMPOS_ROLLUP}
+                )
+            )
+            conexao.execute(stmt)
+        else:
+            resultado = conexao.execute(
+                update(tabela)
+                .where(tabela.c.dia == dia, tabela.c.prioridade == prioridade, tabela.c.unidade == unidade)
+                .values(data_atualizacao=agora, **{campo: tabela.c[campo] + valores[campo] for campo in CAMPOS_ROLLUP})
+            )
+            if resultado.rowcount == 0:
+                conexao.execute(tabela.insert().values(**linha))
+
+
+def _valores_anteriores(chamado) -> tuple:
+    """Valores de CAMPOS_CHAMADO_ROLLUP antes das alterações pendentes"""
+    estado = sa_inspect(chamado)
+    valores = []
+    for campo in CAMPOS_CHAMADO_ROLLUP:
+        historico = estado.attrs[campo].history
+        if historico.deleted:
+            valores.append(historico.deleted[0])
+        elif historico.unchanged:
+            valores.append(historico.unchanged[0])
+        else:
+            valores.append(None)
+    return tuple(valores)
+
+
+def _valores_atuais(chamado) -> tuple:
+    return tuple(getattr(chamado, campo) for campo in CAMPOS_CHAMADO_ROLLUP)
+
+
+def _alterou_rollup(chamado) -> bool:
+    estado = sa_inspect(chamado)
+    return any(estado.attrs[campo].history.has_changes() for campo in CAMPOS_CHAMADO_ROLLUP)
+
+
+@event.listens_for(Session, 'after_flush')
+def _atualizar_rollup_sla(session, flush_context):
+    """Atualiza o agregado na mesma transação em que chamados são finalizados/alterados"""
+    antigos, novos = [], []
+    for obj in session.new:
+        if isinstance(obj, Chamado):
+            novos.append(_valores_atuais(obj))
+    for obj in session.dirty:
+        if isinstance(obj, Chamado) and _alterou_rollup(obj):
+            antigos.append(_valores_anteriores(obj))
+            novos.append(_valores_atuais(obj))
+    for obj in session.deleted:
+        if isinstance(obj, Chamado):
+            antigos.append(_valores_anteriores(obj))
+
+    # Só chamados finalizados (antes ou depois) entram no agregado
+    antigos = [v for v in antigos if v[3] in STATUS_FINALIZADOS]
+    novos = [v for v in novos if v[3] in STATUS_FINALIZADOS]
+    if not antigos and not novos:
+        return
+
+    from setores.ti.sla_utils import _ler_configuracoes_sla_sem_gravar
+
+    try:
+        config_sla, config_horario = _ler_configuracoes_sla_sem_gravar()
+        deltas = _combinar(
+            _contribuicoes(antigos, config_sla, config_horario, sinal=-1),
+            _contribuicoes(novos, config_sla, config_horario, sinal=1),
+        )
+        _aplicar_deltas(session.connection(), deltas)
+    except Exception as e:
+        # O agregado pode ser refeito com reconstruir_sla_rollup(); não bloquear o chamado
+        logger.error(f"Erro ao atualizar agregado diário de SLA: {str(e)}")
+
+
+def reconstruir_sla_rollup(tamanho_lote: int = 5000) -> int:
+    """
+    Reconstrói todo o agregado a partir dos chamados finalizados (backfill)
+
+    Returns:
+        Número de chamados agregados
+    """
+    from setores.ti.sla_utils import carregar_configuracoes_sla, carregar_configuracoes_horario_comercial
+
+    config_sla = carregar_configuracoes_sla()
+    config_horario = carregar_configuracoes_horario_comercial()
+    agora = get_brazil_time()
+
+    acumulado: Dict[ChaveRollup, Dict[str, float]] = {}
+    total = 0
+    ultimo_id = 0
+    try:
+        while True:
+            linhas = buscar_colunas_sla(
+                Chamado.id > ultimo_id,
+                Chamado.status.in_(STATUS_FINALIZADOS),
+                Chamado.data_abertura.isnot(None),
+                extras=(Chamado.unidade, Chamado.id),
+                ordenacao=(Chamado.id,),
+                limite=tamanho_lote
+            )
+            if not linhas:
+                break
+            acumulado = _combinar(acumulado, _contribuicoes(linhas, config_sla, config_horario, agora=agora))
+            total += len(linhas)
+            ultimo_id = linhas[-1][6]
+
+        agora_local = agora.replace(tzinfo=None)
+        db.session.query(SlaRollupDiario).delete()
+        db.session.bulk_insert_mappings(SlaRollupDiario, [
+            dict(valores, dia=dia, prioridade=prioridade, unidade=unidade, data_atualizacao=agora_local)
+            for (dia, prioridade, unidade), valores in acumulado.items()
+        ])
+        db.session.commit()
+        logger.info(f"Agregado diário de SLA reconstruído: {total} chamados em {len(acumulado)} linhas")
+        return total
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Erro ao reconstruir agregado diário de SLA: {str(e)}")
+        raise
+
+
+def somar_rollup(desde: date, agrupar_por: Iterable[str] = ()) -> List[Dict]:
+    """
+    SUM ... GROUP BY sobre o agregado a partir do dia informado
+
+    Args:
+        desde: Primeiro dia (de abertura) considerado
+        agrupar_por: Colunas de agrupamento ('prioridade', 'unidade', 'dia')
+    """
+    agrupar_por = tuple(agrupar_por)
+    colunas_grupo = [getattr(SlaRollupDiario, coluna) for coluna in agrupar_por]
+    somas = [func.coalesce(func.sum(getattr(SlaRollupDiario, campo)), 0).label(campo) for campo in CAMPOS_ROLLUP]
+
+    consulta = db.session.query(*colunas_grupo, *somas).filter(SlaRollupDiario.dia >= desde)
+    if colunas_grupo:
+        consulta = consulta.group_by(*colunas_grupo)
+
+    return [dict(zip(agrupar_por + CAMPOS_ROLLUP, linha)) for linha in consulta.all()]
@@ -3,9 +3,17 @@ Utilitários para cálculo correto de SLA considerando horário comercial
 """
 from datetime import datetime, timedelta, time
 from typing import Optional, Dict, Tuple
+from time import monotonic
+import copy
+import threading
 import pytz
 import json
-from database import get_brazil_time, Configuracao, db
+from sqlalchemy import event, func, and_, or_, inspect as sa_inspect
+from sqlalchemy.orm import Session, object_session
+from database import get_brazil_time, Configuracao, Feriado, Chamado, db
+from setores.ti.calendario_comercial import (
+    CalendarioComercial, obter_calendario, limpar_calendarios, para_horario_local
+)
 import logging
 
 logger = logging.getLogger(__name__)
@@ -30,12 +38,91 @@ SLA_PADRAO = {
     'resolucao_baixa': 72
 }
 
+# Intervalo máximo (segundos) para um processo perceber alterações gravadas por outro worker
+INTERVALO_VERIFICACAO_CONFIG = 5
+
+CHAVES_CONFIG_SLA = ('sla', 'horario_comercial')
+
+# Configurações já convertidas em memória: chave -> (versão, valor)
+# A versão é (data_atualizacao, tamanho do JSON), lida sem trazer o valor
+_config_cache: Dict[str, Tuple[tuple, Dict]] = {}
+_config_verificado_em = 0.0
+_config_lock = threading.Lock()
+
+def _sincronizar_cache_configuracoes():
+    """Compara as versões no banco com as em memória e recarrega apenas as alteradas"""
+    global _config_cache
+    # Sem autoflush: a leitura também é usada dentro do before_flush dos chamados
+    with db.session.no_autoflush:
+        versoes = {
+            chave: (data_atualizacao, tamanho)
+            for chave, data_atualizacao, tamanho in db.session.query(
+                Configuracao.chave, Configuracao.data_atualizacao, func.length(Configuracao.valor)
+            ).filter(Configuracao.chave.in_(CHAVES_CONFIG_SLA)).all()
+        }
+    alteradas = [chave for chave, versao in versoes.items() if _config_cache.get(chave, (None,))[0] != versao]
+    if not alteradas and set(versoes) == set(_config_cache):
+        return
+
+    novo_cache = {chave: item for chave, item in _config_cache.items() if chave in versoes}
+    with db.session.no_autoflush:
+        linhas = db.session.query(
+            Configuracao.chave, Configuracao.valor, Configuracao.data_atualizacao, func.length(Configuracao.valor)
+        ).filter(Configuracao.chave.in_(alteradas)).all()
+    for chave, valor, data_atualizacao, tamanho in linhas:
+        dados = json.loads(valor)
+        if chave == 'horario_comercial':
+            dados = _converter_horario_comercial(dados)
+        novo_cache[chave] = ((data_atualizacao, tamanho), dados)
+    _config_cache = novo_cache
+    logger.info(f"Configurações de SLA recarregadas: {', '.join(alteradas) or 'nenhuma'}")
+
+def _obter_configuracao_em_cache(chave: str) -> Optional[Dict]:
+    """
+    Retorna uma cópia da configuração convertida, ou None se não existir no banco.
+    
+    A versão só é consultada a cada INTERVALO_VERIFICACAO_CONFIG segundos; nunca grava.
+    """
+    global _config_verificado_em
+    if monotonic() - _config_verificado_em >= INTERVALO_VERIFICACAO_CONFIG:
+        with _config_lock:
+            if monotonic() - _config_verificado_em >= INTERVALO_VERIFICACAO_CONFIG:
+                _sincronizar_cache_configuracoes()
+                _config_verificado_em = monotonic()
+    item = _config_cache.get(chave)
+    # Cópia: chamadores alteram o dicionário (ex.: time -> 'HH:MM' para JSON)
+    return copy.deepcopy(item[1]) if item else None
+
+def invalidar_cache_configuracoes():
+    """Força a releitura das configurações de SLA e horário comercial na próxima chamada"""
+    global _config_cache, _config_verificado_em
+    with _config_lock:
+        _config_cache = {}
+        _config_verificado_em = 0.0
+
+def _marcar_configuracao_alterada(mapper, connection, target):
+    sessao = object_session(target)
+    if sessao is not None and target.chave in CHAVES_CONFIG_SLA:
+        sessao.info['configuracoes_sla_alteradas'] = True
+
+for _evento in ('after_insert', 'after_update', 'after_delete'):
+    event.listen(Configuracao, _evento, _marcar_configuracao_alterada)
+
+@event.listens_for(Session, 'after_commit')
+def _invalidar_configuracoes_apos_commit(session):
+    if session.info.pop('configuracoes_sla_alteradas', False):
+        invalidar_cache_configuracoes()
+
+@event.listens_for(Session, 'after_rollback')
+def _descartar_marcacao_configuracoes(session):
+    session.info.pop('configuracoes_sla_alteradas', None)
+
 def carregar_configuracoes_sla():
-    """Carrega configurações de SLA do banco ou retorna padrões"""
+    """Carrega configurações de SLA (em cache) ou retorna padrões"""
     try:
-        config_sla = Configuracao.query.filter_by(chave='sla').first()
-        if config_sla:
-            return json.loads(config_sla.valor)
+        config_sla = _obter_configuracao_em_cache('sla')
+        if config_sla is not None:
+            return config_sla
         else:
             # Criar configuração padrão se não existir
             nova_config = Configuracao(
@@ -44,11 +131,12 @@ def carregar_configuracoes_sla():
             )
             db.session.add(nova_config)
             db.session.commit()
+            invalidar_cache_configuracoes()
             logger.info("Configurações SLA padrão criadas no banco de dados")
-            return SLA_PADRAO
+            return copy.deepcopy(SLA_PADRAO)
     except Exception as e:
         logger.error(f"Erro ao carregar configurações SLA: {str(e)}")
-        return SLA_PADRAO
+        return copy.deepcopy(SLA_PADRAO)
 
 def salvar_configuracoes_sla(config_sla: Dict):
     """Salva configurações de SLA no banco"""
@@ -65,6 +153,7 @@ def salvar_configuracoes_sla(config_sla: Dict):
             db.session.add(config_obj)
         
         db.session.commit()
+        invalidar_cache_configuracoes()
         logger.info("Configurações SLA salvas com sucesso")
         return True
     except Exception as e:
@@ -72,20 +161,22 @@ def salvar_configuracoes_sla(config_sla: Dict):
         db.session.rollback()
         return False
 
+def _converter_horario_comercial(dados: Dict) -> Dict:
+    """Converte strings 'HH:MM' de início/fim para objetos time"""
+    if 'inicio' in dados:
+        hora, minuto = map(int, dados['inicio'].split(':'))
+        dados['inicio'] = time(hora, minuto)
+    if 'fim' in dados:
+        hora, minuto = map(int, dados['fim'].split(':'))
+        dados['fim'] = time(hora, minuto)
+    return dados
+
 def carregar_configuracoes_horario_comercial():
-    """Carrega configurações de horário comercial do banco ou retorna padrões"""
+    """Carrega configurações de horário comercial (em cache) ou retorna padrões"""
     try:
-        config_horario = Configuracao.query.filter_by(chave='horario_comercial').first()
-        if config_horario:
-            dados = json.loads(config_horario.valor)
-            # Converter strings de time de volta para objetos time
-            if 'inicio' in dados:
-                hora, minuto = map(int, dados['inicio'].split(':'))
-                dados['inicio'] = time(hora, minuto)
-            if 'fim' in dados:
-                hora, minuto = map(int, dados['fim'].split(':'))
-                dados['fim'] = time(hora, minuto)
-            return dados
+        config_horario = _obter_configuracao_em_cache('horario_comercial')
+        if config_horario is not None:
+            return config_horario
         else:
             # Criar configuração padrão se não existir
             config_para_salvar = HORARIO_COMERCIAL.copy()
@@ -98,24 +189,105 @@ def carregar_configuracoes_horario_comercial():
             )
             db.session.add(nova_config)
             db.session.commit()
+            invalidar_cache_configuracoes()
             logger.info("Configurações de horário comercial padrão criadas no banco de dados")
-            return HORARIO_COMERCIAL
+            return copy.deepcopy(HORARIO_COMERCIAL)
     except Exception as e:
         logger.error(f"Erro ao carregar configurações de horário comercial: {str(e)}")
-        return HORARIO_COMERCIAL
+        return copy.deepcopy(HORARIO_COMERCIAL)
 
-def eh_horario_comercial(dt: datetime, config_horario: Dict = None) -> bool:
-    """Verifica se um datetime está dentro do horário comercial"""
+def _para_brazil_tz(dt: datetime) -> datetime:
+    """Garante que o datetime esteja no timezone do Brasil"""
+    if dt.tzinfo is None:
+        return BRAZIL_TZ.localize(dt)
+    elif dt.tzinfo != BRAZIL_TZ:
+        return dt.astimezone(BRAZIL_TZ)
+    return dt
+
+# Feriados ativos em memória: (datas fixas, (mês, dia) recorrentes)
+_feriados_cache = None
+_feriados_verificado_em = 0.0
+_feriados_lock = threading.Lock()
+
+def _ler_feriados_ativos() -> Tuple[tuple, tuple]:
+    # Sem autoflush: a leitura também é usada dentro do before_flush dos chamados
+    with db.session.no_autoflush:
+        linhas = db.session.query(Feriado.data, Feriado.recorrente).filter(
+            Feriado.ativo == True
+        ).all()
+    fixos = tuple(sorted({data for data, recorrente in linhas if data and not recorrente}))
+    recorrentes = tuple(sorted({(data.month, data.day) for data, recorrente in linhas if data and recorrente}))
+    return fixos, recorrentes
+
+def carregar_feriados_ativos() -> Tuple[tuple, tuple]:
+    """
+    Retorna os feriados ativos mantidos em memória.
+    
+    Feriados recorrentes valem para todos os anos (mês/dia); os demais valem
+    apenas na data cadastrada. O processo que grava descarta o cache no commit;
+    os demais workers releem as datas (tabela pequena, só duas colunas) a cada
+    INTERVALO_VERIFICACAO_CONFIG segundos e recompilam apenas se mudaram.
+    """
+    global _feriados_cache, _feriados_verificado_em
+    feriados = _feriados_cache
+    if feriados is not None and monotonic() - _feriados_verificado_em < INTERVALO_VERIFICACAO_CONFIG:
+        return feriados
+    
+    with _feriados_lock:
+        if _feriados_cache is not None and monotonic() - _feriados_verificado_em < INTERVALO_VERIFICACAO_CONFIG:
+            return _feriados_cache
+        try:
+            feriados = _ler_feriados_ativos()
+        except Exception as e:
+            logger.error(f"Erro ao carregar feriados: {str(e)}")
+            return _feriados_cache if _feriados_cache is not None else ((), ())
+        
+        _feriados_verificado_em = monotonic()
+        if feriados != _feriados_cache:
+            if _feriados_cache is not None:
+                # Alterados por outro processo: calendários compilados com as datas antigas saem da memória
+                limpar_calendarios()
+            _feriados_cache = feriados
+            logger.info(f"Calendário de feriados carregado: {len(feriados[0])} fixos, {len(feriados[1])} recorrentes")
+        return _feriados_cache
+
+def invalidar_calendario_comercial():
+    """Descarta feriados e calendários compilados para serem recarregados"""
+    global _feriados_cache, _feriados_verificado_em
+    with _feriados_lock:
+        _feriados_cache = None
+        _feriados_verificado_em = 0.0
+    limpar_calendarios()
+
+def _marcar_feriados_alterados(mapper, connection, target):
+    sessao = object_session(target)
+    if sessao is not None:
+        sessao.info['feriados_alterados'] = True
+
+for _evento in ('after_insert', 'after_update', 'after_delete'):
+    event.listen(Feriado, _evento, _marcar_feriados_alterados)
+
+@event.listens_for(Session, 'after_commit')
+def _invalidar_feriados_apos_commit(session):
+    # Invalida só após o commit para que outra thread não recompile com dados antigos
+    if session.info.pop('feriados_alterados', False):
+        invalidar_calendario_comercial()
+
+@event.listens_for(Session, 'after_rollback')
+def _descartar_marcacao_feriados(session):
+    session.info.pop('feriados_alterados', None)
+
+def obter_calendario_comercial(config_horario: Dict = None) -> CalendarioComercial:
+    """Retorna o calendário comercial compilado (horário + feriados) para a configuração"""
     if config_horario is None:
         config_horario = carregar_configuracoes_horario_comercial()
-    
-    # Verificar dia da semana (0=segunda, 6=domingo)
-    if dt.weekday() not in config_horario['dias_semana']:
-        return False
-    
-    # Verificar horário
-    hora_atual = dt.time()
-    return config_horario['inicio'] <= hora_atual <= config_horario['fim']
+    feriados, feriados_recorrentes = carregar_feriados_ativos()
+    return obter_calendario(config_horario, feriados, feriados_recorrentes)
+
+def eh_horario_comercial(dt: datetime, config_horario: Dict = None) -> bool:
+    """Verifica se um datetime está dentro do horário comercial"""
+    calendario = obter_calendario_comercial(config_horario)
+    return calendario.eh_horario_comercial(para_horario_local(_para_brazil_tz(dt)))
 
 def calcular_horas_uteis(inicio: datetime, fim: datetime, config_horario: Dict = None) -> float:
     """
@@ -129,127 +301,32 @@ def calcular_horas_uteis(inicio: datetime, fim: datetime, config_horario: Dict =
     Returns:
         Número de horas úteis como float
     """
-    if config_horario is None:
-        config_horario = carregar_configuracoes_horario_comercial()
+    calendario = obter_calendario_comercial(config_horario)
     
     # Garantir que as datas estão no timezone correto
-    if inicio.tzinfo is None:
-        inicio = BRAZIL_TZ.localize(inicio)
-    elif inicio.tzinfo != BRAZIL_TZ:
-        inicio = inicio.astimezone(BRAZIL_TZ)
-    
-    if fim.tzinfo is None:
-        fim = BRAZIL_TZ.localize(fim)
-    elif fim.tzinfo != BRAZIL_TZ:
-        fim = fim.astimezone(BRAZIL_TZ)
+    inicio = _para_brazil_tz(inicio)
+    fim = _para_brazil_tz(fim)
     
     if inicio >= fim:
         return 0.0
     
-    horas_uteis = 0.0
-    data_atual = inicio.replace(hour=0, minute=0, second=0, microsecond=0)
-    
-    while data_atual.date() <= fim.date():
-        # Pular fins de semana e feriados
-        if data_atual.weekday() not in config_horario['dias_semana']:
-            data_atual += timedelta(days=1)
-            continue
-        
-        # Definir início e fim do horário comercial para este dia
-        inicio_comercial = data_atual.replace(
-            hour=config_horario['inicio'].hour,
-            minute=config_horario['inicio'].minute
-        )
-        fim_comercial = data_atual.replace(
-            hour=config_horario['fim'].hour,
-            minute=config_horario['fim'].minute
-        )
-        
-        # Ajustar para o período efetivo
-        periodo_inicio = max(inicio, inicio_comercial)
-        periodo_fim = min(fim, fim_comercial)
-        
-        if periodo_inicio < periodo_fim:
-            delta = periodo_fim - periodo_inicio
-            horas_uteis += delta.total_seconds() / 3600
-        
-        data_atual += timedelta(days=1)
-    
-    return round(horas_uteis, 2)
+    return calendario.horas_uteis_arredondadas(para_horario_local(inicio), para_horario_local(fim))
 
 def obter_proximo_horario_comercial(dt: datetime, config_horario: Dict = None) -> datetime:
     """
     Retorna o próximo horário comercial após a data informada
     """
-    if config_horario is None:
-        config_horario = carregar_configuracoes_horario_comercial()
+    calendario = obter_calendario_comercial(config_horario)
     
     # Garantir timezone correto
-    if dt.tzinfo is None:
-        dt = BRAZIL_TZ.localize(dt)
-    elif dt.tzinfo != BRAZIL_TZ:
-        dt = dt.astimezone(BRAZIL_TZ)
+    dt = _para_brazil_tz(dt)
     
     # Se já está em horário comercial, retornar a própria data
-    if eh_horario_comercial(dt, config_horario):
+    local = para_horario_local(dt)
+    if calendario.eh_horario_comercial(local):
         return dt
     
-    # Procurar próximo horário comercial
-    data_teste = dt
-    max_tentativas = 14  # Máximo 2 semanas
-    tentativas = 0
-    
-    while tentativas < max_tentativas:
-        # Se é um dia útil mas fora do horário, ir para início do próximo horário comercial
-        if data_teste.weekday() in config_horario['dias_semana']:
-            inicio_comercial = data_teste.replace(
-                hour=config_horario['inicio'].hour,
-                minute=config_horario['inicio'].minute,
-                second=0,
-                microsecond=0
-            )
-            
-            if data_teste.time() < config_horario['inicio']:
-                return inicio_comercial
-            elif data_teste.time() > config_horario['fim']:
-                # Ir para próximo dia útil
-                data_teste += timedelta(days=1)
-                data_teste = data_teste.replace(
-                    hour=config_horario['inicio'].hour,
-                    minute=config_horario['inicio'].minute,
-                    second=0,
-                    microsecond=0
-                )
-            else:
-                return data_teste
-        else:
-            # Não é dia útil, ir para próximo dia
-            data_teste += timedelta(days=1)
-            data_teste = data_teste.replace(
-                hour=config_horario['inicio'].hour,
-                minute=config_horario['inicio'].minute,
-                second=0,
-                microsecond=0
-            )
-        
-        # Verificar se encontrou um horário comercial
-        if eh_horario_comercial(data_teste, config_horario):
-            return data_teste
-        
-        tentativas += 1
-    
-    # Se não encontrou, retornar segunda-feira mais próxima
-    dias_para_segunda = (7 - data_teste.weekday()) % 7
-    if dias_para_segunda == 0:
-        dias_para_segunda = 7
-    
-    proxima_segunda = data_teste + timedelta(days=dias_para_segunda)
-    return proxima_segunda.replace(
-        hour=config_horario['inicio'].hour,
-        minute=config_horario['inicio'].minute,
-        second=0,
-        microsecond=0
-    )
+    return BRAZIL_TZ.localize(calendario.proximo_horario_comercial(local))
 
 def calcular_prazo_sla(data_inicio: datetime, horas_sla: float, config_horario: Dict = None) -> datetime:
     """
@@ -263,48 +340,13 @@ def calcular_prazo_sla(data_inicio: datetime, horas_sla: float, config_horario:
     Returns:
         Data/hora quando o SLA expira
     """
-    if config_horario is None:
-        config_horario = carregar_configuracoes_horario_comercial()
+    calendario = obter_calendario_comercial(config_horario)
     
     # Garantir timezone correto
-    if data_inicio.tzinfo is None:
-        data_inicio = BRAZIL_TZ.localize(data_inicio)
-    elif data_inicio.tzinfo != BRAZIL_TZ:
-        data_inicio = data_inicio.astimezone(BRAZIL_TZ)
-    
-    # Se não está em horário comercial, mover para próximo horário comercial
-    if not eh_horario_comercial(data_inicio, config_horario):
-        data_inicio = obter_proximo_horario_comercial(data_inicio, config_horario)
-    
-    horas_restantes = horas_sla
-    data_atual = data_inicio
-    
-    while horas_restantes > 0:
-        # Se não é horário comercial, pular para próximo
-        if not eh_horario_comercial(data_atual, config_horario):
-            data_atual = obter_proximo_horario_comercial(data_atual, config_horario)
-            continue
-        
-        # Calcular quantas horas restam no dia comercial atual
-        fim_comercial_hoje = data_atual.replace(
-            hour=config_horario['fim'].hour,
-            minute=config_horario['fim'].minute,
-            second=0,
-            microsecond=0
-        )
-        
-        horas_disponiveis_hoje = (fim_comercial_hoje - data_atual).total_seconds() / 3600
-        
-        if horas_restantes <= horas_disponiveis_hoje:
-            # SLA expira hoje
-            return data_atual + timedelta(hours=horas_restantes)
-        else:
-            # Descontar horas de hoje e ir para próximo dia útil
-            horas_restantes -= horas_disponiveis_hoje
-            data_atual += timedelta(days=1)
-            data_atual = obter_proximo_horario_comercial(data_atual, config_horario)
+    data_inicio = _para_brazil_tz(data_inicio)
     
-    return data_atual
+    prazo = calendario.somar_horas_uteis(para_horario_local(data_inicio), horas_sla)
+    return BRAZIL_TZ.localize(prazo)
 
 def calcular_sla_chamado_correto(chamado, config_sla: Dict = None, config_horario: Dict = None) -> Dict:
     """
@@ -483,6 +525,10 @@ def obter_metricas_sla_consolidadas(period_days: int = 30) -> Dict:
     """
     Obtém métricas consolidadas de SLA para o período especificado
     
+    Chamados finalizados vêm do agregado diário (sla_rollup_diario); apenas os
+    chamados em andamento do período são calculados na hora. O período conta
+    dias inteiros a partir da data de abertura.
+    
     Args:
         period_days: Número de dias para análise
     
@@ -490,51 +536,40 @@ def obter_metricas_sla_consolidadas(period_days: int = 30) -> Dict:
         Dicionário com métricas consolidadas
     """
     from database import Chamado
-    from sqlalchemy import func, and_
+    from setores.ti.sla_lote import STATUS_FINALIZADOS, buscar_colunas_sla, calcular_sla_linhas
+    from setores.ti.sla_rollup import somar_rollup
+    import numpy as np
     
     config_sla = carregar_configuracoes_sla()
     config_horario = carregar_configuracoes_horario_comercial()
     
-    # Data de corte
-    data_corte = get_brazil_time() - timedelta(days=period_days)
+    # Data de corte (início do dia)
+    dia_corte = (get_brazil_time() - timedelta(days=period_days)).date()
+    data_corte = datetime.combine(dia_corte, time())
     
-    # Buscar chamados do período
-    chamados = Chamado.query.filter(
-        Chamado.data_abertura >= data_corte.replace(tzinfo=None)
-    ).all()
+    # Finalizados: SUM sobre o agregado diário
+    finalizados = somar_rollup(dia_corte)[0]
     
-    total_chamados = len(chamados)
-    chamados_cumpridos = 0
-    chamados_violados = 0
-    chamados_em_risco = 0
-    chamados_abertos = 0
-
-    tempo_total_resolucao = 0
-    tempo_total_primeira_resposta = 0
-    count_resolvidos = 0
-    count_primeira_resposta = 0
-    
-    for chamado in chamados:
-        sla_info = calcular_sla_chamado_correto(chamado, config_sla, config_horario)
-        
-        if sla_info['sla_status'] == 'Cumprido':
-            chamados_cumpridos += 1
-        elif sla_info['sla_status'] == 'Violado':
-            chamados_violados += 1
-        elif sla_info['sla_status'] == 'Em Risco':
-            chamados_em_risco += 1
-        
-        if sla_info['tempo_resolucao_uteis']:
-            tempo_total_resolucao += sla_info['tempo_resolucao_uteis']
-            count_resolvidos += 1
-        
-        if sla_info['tempo_primeira_resposta_uteis']:
-            tempo_total_primeira_resposta += sla_info['tempo_primeira_resposta_uteis']
-            count_primeira_resposta += 1
-
-        # Contar chamados abertos
-        if chamado.status in ['Aberto', 'Aguardando']:
-            chamados_abertos += 1
+    # Em andamento: apenas as colunas necessárias, calculadas em lote
+    linhas = buscar_colunas_sla(
+        Chamado.data_abertura >= data_corte,
+        ~Chamado.status.in_(STATUS_FINALIZADOS)
+    )
+    sla = calcular_sla_linhas(linhas, config_sla, config_horario)
+    
+    total_chamados = int(finalizados['chamados_finalizados']) + len(linhas)
+    chamados_cumpridos = int(finalizados['chamados_cumpridos']) + int(np.count_nonzero(sla['sla_status'] == 'Cumprido'))
+    chamados_violados = int(finalizados['chamados_violados']) + int(np.count_nonzero(sla['sla_status'] == 'Violado'))
+    chamados_em_risco = int(np.count_nonzero(sla['sla_status'] == 'Em Risco'))
+    chamados_abertos = int(np.count_nonzero(np.isin(np.array([l[3] for l in linhas], dtype=object), ['Aberto', 'Aguardando'])))
+    
+    # Apenas tempos preenchidos e diferentes de zero entram nas médias
+    tempos_resolucao = np.nan_to_num(sla['tempo_resolucao_uteis'])
+    tempos_primeira_resposta = np.nan_to_num(sla['tempo_primeira_resposta_uteis'])
+    count_resolvidos = int(finalizados['qtd_resolucao']) + int(np.count_nonzero(tempos_resolucao))
+    count_primeira_resposta = int(finalizados['qtd_primeira_resposta']) + int(np.count_nonzero(tempos_primeira_resposta))
+    tempo_total_resolucao = float(finalizados['soma_horas_resolucao']) + sum(tempos_resolucao.tolist())
+    tempo_total_primeira_resposta = float(finalizados['soma_horas_primeira_resposta']) + sum(tempos_primeira_resposta.tolist())
     
     # Calcular médias
     tempo_medio_resolucao = (tempo_total_resolucao / count_resolvidos) if count_resolvidos > 0 else 0
@@ -557,3 +592,159 @@ def obter_metricas_sla_consolidadas(period_days: int = 30) -> Dict:
         'tempo_medio_primeira_resposta': round(tempo_medio_primeira_resposta, 2),
         'period_days': period_days
     }
+
+# Campos do chamado que alteram o SLA materializado
+CAMPOS_SLA_CHAMADO = ('status', 'prioridade', 'data_abertura', 'data_primeira_resposta', 'data_conclusao')
+
+def _ler_configuracoes_sla_sem_gravar() -> Tuple[Dict, Dict]:
+    """Lê configurações de SLA e horário sem criar registros (seguro durante um flush)"""
+    config_sla = _obter_configuracao_em_cache('sla')
+    config_horario = _obter_configuracao_em_cache('horario_comercial')
+    return (
+        config_sla if config_sla is not None else SLA_PADRAO,
+        config_horario if config_horario is not None else HORARIO_COMERCIAL
+    )
+
+def _para_datetime(valor) -> Optional[datetime]:
+    """Converte numpy.datetime64 (ou NaT) para datetime sem tzinfo"""
+    import numpy as np
+    if np.isnat(valor):
+        return None
+    return valor.astype('datetime64[us]').astype(datetime)
+
+def atualizar_sla_persistido(chamados, config_sla: Dict = None, config_horario: Dict = None, agora: datetime = None):
+    """
+    Recalcula as colunas de SLA materializadas (prazos e status) dos chamados informados
+    
+    Não faz commit; os valores são gravados junto com o chamado.
+    """
+    from setores.ti.sla_lote import calcular_sla_lote
+    
+    chamados = list(chamados)
+    if not chamados:
+        return
+    
+    sla = calcular_sla_lote(
+        [c.data_abertura for c in chamados],
+        [c.data_primeira_resposta for c in chamados],
+        [c.data_conclusao for c in chamados],
+        [c.status for c in chamados],
+        [c.prioridade for c in chamados],
+        config_sla, config_horario, agora
+    )
+    
+    for i, chamado in enumerate(chamados):
+        chamado.sla_prazo_primeira_resposta = _para_datetime(sla['sla_prazo_primeira_resposta'][i])
+        chamado.sla_prazo_resolucao = _para_datetime(sla['sla_prazo_expiracao'][i])
+        chamado.sla_prazo_risco = _para_datetime(sla['sla_prazo_risco'][i])
+        chamado.sla_status = sla['sla_status'][i]
+
+def _sla_alterado(chamado) -> bool:
+    estado = sa_inspect(chamado)
+    return any(estado.attrs[campo].history.has_changes() for campo in CAMPOS_SLA_CHAMADO)
+
+@event.listens_for(Session, 'before_flush')
+def _materializar_sla_chamados(session, flush_context, instances):
+    """Mantém o SLA materializado ao criar chamados ou alterar status/prioridade/datas"""
+    pendentes = [obj for obj in session.new if isinstance(obj, Chamado)]
+    pendentes += [obj for obj in session.dirty if isinstance(obj, Chamado) and _sla_alterado(obj)]
+    if not pendentes:
+        return
+    
+    try:
+        for chamado in pendentes:
+            # Defaults de coluna só são aplicados no INSERT; antecipá-los para o cálculo
+            if chamado.data_abertura is None:
+                chamado.data_abertura = get_brazil_time().replace(tzinfo=None)
+            if chamado.status is None:
+                chamado.status = 'Aberto'
+            if chamado.prioridade is None:
+                chamado.prioridade = 'Normal'
+        
+        config_sla, config_horario = _ler_configuracoes_sla_sem_gravar()
+        atualizar_sla_persistido(pendentes, config_sla, config_horario)
+    except Exception as e:
+        logger.error(f"Erro ao atualizar SLA materializado: {str(e)}")
+
+def recalcular_sla_persistido(tamanho_lote: int = 1000) -> int:
+    """
+    Recalcula o SLA materializado de todos os chamados (ex.: após mudar as regras de SLA)
+    
+    Percorre a tabela em lotes ordenados por id, calcula em lote e grava com
+    UPDATE em massa, fazendo commit a cada lote.
+    
+    Returns:
+        Número de chamados atualizados
+    """
+    from setores.ti.sla_lote import buscar_colunas_sla, calcular_sla_linhas
+    from setores.ti.sla_monitor import reagendar_recalculados
+    
+    config_sla = carregar_configuracoes_sla()
+    config_horario = carregar_configuracoes_horario_comercial()
+    agora = get_brazil_time()
+    
+    total = 0
+    ultimo_id = 0
+    try:
+        while True:
+            linhas = buscar_colunas_sla(
+                Chamado.id > ultimo_id,
+                extras=(Chamado.id,),
+                ordenacao=(Chamado.id,),
+                limite=tamanho_lote
+            )
+            if not linhas:
+                break
+            
+            sla = calcular_sla_linhas(linhas, config_sla, config_horario, agora)
+            valores = [
+                {
+                    'id': linha[5],
+                    'sla_prazo_primeira_resposta': _para_datetime(sla['sla_prazo_primeira_resposta'][i]),
+                    'sla_prazo_resolucao': _para_datetime(sla['sla_prazo_expiracao'][i]),
+                    'sla_prazo_risco': _para_datetime(sla['sla_prazo_risco'][i]),
+                    'sla_status': sla['sla_status'][i],
+                }
+                for i, linha in enumerate(linhas)
+            ]
+            db.session.bulk_update_mappings(Chamado, valores)
+            db.session.commit()
+            # O UPDATE em massa não passa pelo flush que reagenda o monitor
+            reagendar_recalculados(linhas, valores)
+            
+            total += len(linhas)
+            ultimo_id = linhas[-1][5]
+        
+        logger.info(f"SLA materializado recalculado para {total} chamados")
+        return total
+    except Exception as e:
+        logger.error(f"Erro ao recalcular SLA materializado: {str(e)}")
+        db.session.rollback()
+        return total
+
+def filtro_sla_status(sla_status: str, agora: datetime = None):
+    """
+    Expressão SQL para filtrar chamados pelo status de SLA usando as colunas materializadas
+    
+    Para chamados finalizados usa o status gravado; para os demais compara os prazos
+    com o horário atual, então o filtro não depende do status gravado estar atualizado.
+    """
+    if agora is None:
+        agora = get_brazil_time()
+    agora = para_horario_local(agora)
+    
+    finalizado = Chamado.status.in_(['Concluido', 'Cancelado'])
+    em_andamento = ~finalizado
+    
+    if sla_status == 'Cumprido':
+        return and_(finalizado, Chamado.sla_status == 'Cumprido')
+    if sla_status == 'Violado':
+        return or_(
+            and_(finalizado, Chamado.sla_status == 'Violado'),
+            and_(em_andamento, Chamado.sla_prazo_resolucao < agora)
+        )
+    if sla_status == 'Em Risco':
+        return and_(em_andamento, Chamado.sla_prazo_risco <= agora, Chamado.sla_prazo_resolucao >= agora)
+    if sla_status == 'Dentro do Prazo':
+        return and_(em_andamento, Chamado.sla_prazo_risco > agora)
+    return Chamado.sla_status == sla_status
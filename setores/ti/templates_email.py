@@ -0,0 +1,105 @@
+"""
+Registro de templates de e-mail
+
+Cada e-mail do sistema tem uma pasta em setores/ti/templates/emails/<nome>/
+com até três variantes: assunto.txt, corpo.html e corpo.txt. Antes, cada envio
+montava jinja2.Template() a partir de uma string grande, e o Jinja analisava e
+compilava o template de novo a cada chamada. Aqui cada variante é compilada uma
+única vez (em carregar(), na inicialização, ou no primeiro uso) e reaproveitada
+por todas as requisições e threads.
+
+renderizar('agente_atribuido', chamado=..., ...) devolve EmailRenderizado com
+assunto, html e texto (None para a variante que o template não tem). O HTML é
+escapado automaticamente; conteúdo já em HTML precisa do filtro |safe.
+"""
+import logging
+import os
+import threading
+from typing import Dict, NamedTuple, Optional
+
+from jinja2 import Environment, FileSystemLoader, Template, TemplateNotFound, select_autoescape
+
+logger = logging.getLogger(__name__)
+
+PASTA_TEMPLATES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates', 'emails')
+
+# Variante -> arquivo dentro da pasta do template
+VARIANTES = {
+    'assunto': 'assunto.txt',
+    'html': 'corpo.html',
+    'texto': 'corpo.txt',
+}
+
+
+class EmailRenderizado(NamedTuple):
+    assunto: Optional[str]
+    html: Optional[str]
+    texto: Optional[str]
+
+
+class RegistroTemplatesEmail:
+    """Templates de e-mail compilados uma vez e reaproveitados"""
+
+    def __init__(self, pasta: str = PASTA_TEMPLATES):
+        self.pasta = pasta
+        self._ambiente = Environment(
+            loader=FileSystemLoader(pasta),
+            autoescape=select_autoescape(['html']),
+            auto_reload=False,  # arquivos não mudam com a aplicação no ar
+            trim_blocks=True,
+            lstrip_blocks=True,
+            keep_trailing_newline=True
+        )
+        self._lock = threading.Lock()
+        self._compilados: Dict[str, Dict[str, Template]] = {}
+
+    def _compilar(self, nome: str) -> Dict[str, Template]:
+        """Variantes compiladas do template; compila na primeira chamada"""
+        variantes = self._compilados.get(nome)
+        if variantes is not None:
+            return variantes
+        with self._lock:
+            variantes = self._compilados.get(nome)
+            if variantes is None:
+                variantes = {}
+                for variante, arquivo in VARIANTES.items():
+                    try:
+                        variantes[variante] = self._ambiente.get_template(f"{nome}/{arquivo}")
+                    except TemplateNotFound:
+                        continue
+                if not variantes:
+                    raise TemplateNotFound(nome)
+                self._compilados[nome] = variantes
+        return variantes
+
+    def carregar(self) -> int:
+        """Compila todos os templates da pasta; retorna quantos foram carregados"""
+        carregados = 0
+        for nome in sorted(os.listdir(self.pasta)):
+            if os.path.isdir(os.path.join(self.pasta, nome)):
+                try:
+                    self._compilar(nome)
+                    carregados += 1
+                except Exception as e:
+                    logger.error(f"Erro ao compilar template de email '{nome}': {str(e)}")
+        return carregados
+
+    def renderizar(self, nome: str, **contexto) -> EmailRenderizado:
+        variantes = self._compilar(nome)
+        assunto = variantes.get('assunto')
+        html = variantes.get('html')
+        texto = variantes.get('texto')
+        return EmailRenderizado(
+            # Assunto em uma linha só, mesmo que o arquivo termine com quebra
+            assunto=' '.join(assunto.render(**contexto).split()) if assunto else None,
+            html=html.render(**contexto) if html else None,
+            texto=texto.render(**contexto) if texto else None
+        )
+
+
+# Instância global usada por todos os envios de email
+templates_email = RegistroTemplatesEmail()
+
+
+def renderizar_email(nome: str, **contexto) -> EmailRenderizado:
+    return templates_email.renderizar(nome, **contexto)
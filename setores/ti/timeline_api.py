@@ -38,6 +38,7 @@ def obter_timeline_chamado(id):
         resultado = []
         last_modified = None
         last_id = 0
+        derivados = 0  # prévias geradas depois do evento também mudam a resposta
         for ev in eventos:
             if ev.criado_em and (last_modified is None or ev.criado_em > last_modified):
                 last_modified = ev.criado_em
@@ -48,10 +49,14 @@ def obter_timeline_chamado(id):
             if ev.anexo_id:
                 anexo = AnexoArquivo.query.get(ev.anexo_id)
                 if anexo:
+                    if anexo.sha256_miniatura:
+                        derivados += 1
                     anexo_info = {
                         'id': anexo.id,
                         'nome': anexo.nome_original,
                         'url': anexo.url_publica() if hasattr(anexo, 'url_publica') else ('/' + anexo.caminho_arquivo if anexo.caminho_arquivo else None),
+                        'preview_url': anexo.url_preview(),
+                        'miniatura_url': anexo.url_miniatura(),
                         'mime_type': getattr(anexo, 'mime_type', None),
                         'tamanho_bytes': getattr(anexo, 'tamanho_bytes', None)
                     }
@@ -106,7 +111,7 @@ def obter_timeline_chamado(id):
                 item['anexo'] = anexo_info
             resultado.append(item)
 
-        etag_base = f"{chamado.id}:{last_id}:{len(resultado)}".encode('utf-8')
+        etag_base = f"{chamado.id}:{last_id}:{len(resultado)}:{derivados}".encode('utf-8')
         etag = 'W/"' + hashlib.sha1(etag_base).hexdigest() + '"'
 
         inm = request.headers.get('If-None-Match')
@@ -148,11 +153,23 @@ def obter_timeline_chamado(id):
 def download_anexo(anexo_id):
     try:
         anexo = AnexoArquivo.query.get_or_404(anexo_id)
-        # Preferir blob em DB
-        if anexo.arquivo_blob:
-            from io import BytesIO
-            buf = BytesIO(anexo.arquivo_blob)
-            return send_file(buf, mimetype=anexo.mime_type or 'application/octet-stream', as_attachment=True, download_name=anexo.nome_original)
+        from setores.ti.armazenamento_anexos import TAMANHO_ASSINATURA, enviar_bytes, obter_armazenamento, tipo_inline
+        # ?inline=1 para pré-visualização no painel (somente JPEG, PNG, GIF e PDF conferidos pelo conteúdo)
+        pedir_inline = request.args.get('inline') in ('1', 'true')
+        # Conteúdo no armazenamento de anexos (endereçado pelo hash)
+        if anexo.sha256:
+            armazenamento = obter_armazenamento()
+            if not armazenamento.existe(anexo.sha256):
+                current_app.logger.error(f"Conteúdo do anexo {anexo_id} ausente no armazenamento ({anexo.sha256})")
+                return error_response('Arquivo não encontrado', 404)
+            mime_inline = tipo_inline(anexo.nome_original, armazenamento.ler_inicio(anexo.sha256)) if pedir_inline else None
+            return armazenamento.resposta_download(anexo.sha256, anexo.nome_original, mime_inline or anexo.mime_type,
+                                                   inline=bool(mime_inline))
+        # Blob em DB (anexos ainda não migrados); só aqui o conteúdo é carregado
+        if anexo.armazenamento in (None, 'blob') and anexo.arquivo_blob:
+            mime_inline = tipo_inline(anexo.nome_original, anexo.arquivo_blob[:TAMANHO_ASSINATURA]) if pedir_inline else None
+            return enviar_bytes(anexo.arquivo_blob, anexo.nome_original, mime_inline or anexo.mime_type,
+                                inline=bool(mime_inline))
         # Fallback para caminho_arquivo (compatibilidade retroativa)
         if anexo.caminho_arquivo:
             # caminho_arquivo pode ser um caminho relativo que começa com 'static/'
@@ -171,3 +188,30 @@ def download_anexo(anexo_id):
     except Exception as e:
         current_app.logger.error(f"Erro ao baixar anexo {anexo_id}: {str(e)}")
         return error_response('Erro ao baixar anexo', 500)
+
+
+def _enviar_derivado(anexo_id, campo, prefixo):
+    try:
+        anexo = AnexoArquivo.query.get_or_404(anexo_id)
+        sha256 = getattr(anexo, campo)
+        if not sha256:
+            # Derivada ainda não gerada (ou não é imagem): original no navegador
+            return redirect(f"/ti/api/anexos/{anexo.id}/download?inline=1")
+        from setores.ti.armazenamento_anexos import obter_armazenamento
+        nome = f"{prefixo}_{os.path.splitext(anexo.nome_original)[0]}.jpg"
+        return obter_armazenamento().resposta_download(sha256, nome, 'image/jpeg', inline=True)
+    except Exception as e:
+        current_app.logger.error(f"Erro ao enviar {prefixo} do anexo {anexo_id}: {str(e)}")
+        return error_response('Erro ao carregar imagem', 500)
+
+
+@timeline_bp.route('/api/anexos/<int:anexo_id>/preview', methods=['GET'])
+@login_required
+def preview_anexo(anexo_id):
+    return _enviar_derivado(anexo_id, 'sha256_preview', 'preview')
+
+
+@timeline_bp.route('/api/anexos/<int:anexo_id>/miniatura', methods=['GET'])
+@login_required
+def miniatura_anexo(anexo_id):
+    return _enviar_derivado(anexo_id, 'sha256_miniatura', 'miniatura')
@@ -495,8 +495,8 @@ async function enviarEmailGrupo() {
         
         if (window.advancedNotificationSystem) {
             window.advancedNotificationSystem.showSuccess(
-                'Email Enviado', 
-                `${result.sucessos} emails enviados com sucesso${result.falhas > 0 ? `, ${result.falhas} falharam` : ''}`
+                'Envio Iniciado', 
+                `${result.total} emails na fila de envio. Acompanhe o andamento no histórico.`
             );
         }
         
@@ -568,6 +568,22 @@ async function carregarEmailsHistorico() {
     }
 }
 
+// Atualizar histórico com o progresso recebido via Socket.IO
+document.addEventListener('emailMassaProgresso', function(event) {
+    const progresso = event.detail;
+    const email = emailsHistoricoData.find(e => e.id === progresso.id);
+    if (!email) {
+        return;
+    }
+    Object.assign(email, {
+        status: progresso.status,
+        enviados_count: progresso.enviados_count,
+        falhas_count: progresso.falhas_count,
+        data_envio: progresso.data_envio || email.data_envio
+    });
+    renderizarEmailsHistorico();
+});
+
 // Renderizar histórico de emails
 function renderizarEmailsHistorico() {
     const container = document.getElementById('emailsHistoricoContainer');
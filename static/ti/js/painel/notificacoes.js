@@ -229,16 +229,31 @@ class AdvancedNotificationSystem {
                 });
             });
 
-            this.socket.on('ticket_enviado', (data) => {
+            // Aviso imediato; o e-mail ao solicitante segue agrupado com as demais atualizações do chamado
+            this.socket.on('notificacao_chamado', (data) => {
                 this.showNotification({
                     type: 'success',
-                    title: 'Ticket Enviado',
-                    message: `Ticket enviado para chamado ${data.codigo}`,
+                    title: 'Notificação do Chamado',
+                    message: `${data.assunto} (chamado ${data.codigo}) para ${data.destinatarios.join(', ')}`,
                     data: data,
                     sound: false
                 });
             });
 
+            this.socket.on('email_massa_progresso', (data) => {
+                // Repassa o progresso para a tela de grupos (histórico de emails)
+                document.dispatchEvent(new CustomEvent('emailMassaProgresso', { detail: data }));
+                if (data.status === 'concluido' || data.status === 'erro') {
+                    this.showNotification({
+                        type: data.status === 'concluido' ? 'success' : 'warning',
+                        title: 'Email em Massa',
+                        message: `${data.assunto}: ${data.enviados_count} enviados${data.falhas_count > 0 ? `, ${data.falhas_count} falharam` : ''}`,
+                        data: data,
+                        sound: false
+                    });
+                }
+            });
+
             this.socket.on('usuario_bloqueio_alterado', (data) => {
                 const status = data.novo_status ? 'bloqueado' : 'desbloqueado';
                 this.showNotification({
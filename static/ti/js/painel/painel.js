@@ -1132,6 +1132,11 @@ async function openModal(chamado) {
             try { const u = new URL(url, window.location.origin); return decodeURIComponent(u.pathname.split('/').pop()); } catch (_) { return url || ''; }
         }
 
+        // Imagens e PDFs do endpoint de download abrem no navegador em vez de baixar
+        function inlineUrl(url) {
+            return /\/api\/anexos\/\d+\/download$/.test(url || '') ? `${url}?inline=1` : url;
+        }
+
         try {
             const cached = timelineCache.get(chamado.id) || {};
             let eventos = await prefetchTimeline(chamado.id) || cached.events || [];
@@ -1175,7 +1180,12 @@ async function openModal(chamado) {
                         const isImage = mime.startsWith('image/') || /\.(jpg|jpeg|png|gif|webp)$/i.test(url || nomeAnexo);
                         if (url) {
                             if (isImage) {
-                                anexoHtml = ` <div class="timeline-attachment"><a href="${url}" target="_blank" rel="noopener"><img src="${url}" alt="${nomeAnexo}" class="timeline-attachment-image"/></a></div>`;
+                                // Miniatura na timeline e prévia comprimida ao clicar; o original segue no download
+                                const thumb = ev.anexo.miniatura_url || inlineUrl(url);
+                                const preview = ev.anexo.preview_url || inlineUrl(url);
+                                anexoHtml = ` <div class="timeline-attachment"><a href="${preview}" target="_blank" rel="noopener"><img src="${thumb}" alt="${nomeAnexo}" class="timeline-attachment-image" loading="lazy"/></a> <a href="${url}" target="_blank" rel="noopener">Original</a></div>`;
+                            } else if (mime === 'application/pdf') {
+                                anexoHtml = ` <a href="${inlineUrl(url)}" target="_blank" rel="noopener">${nomeAnexo}</a>`;
                             } else {
                                 anexoHtml = ` <a href="${url}" target="_blank" rel="noopener">${nomeAnexo}</a>`;
                             }